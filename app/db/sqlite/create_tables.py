@@ -1,27 +1,7 @@
-CREATE_STAGGING_TABLE = """
-CREATE TABLE IF NOT EXISTS stg_table(
-    nuts1 TEXT,
-    nuts2 TEXT,
-    nuts3 TEXT,
-    geocode TEXT,
-    type TEXT,
-    distrito TEXT,
-    concelho TEXT,
-    freguesia TEXT,
-    timecode TEXT,
-    data_value TEXT,
-    name_indicator TEXT,
-    description TEXT,
-    units TEXT,
-    units_desc TEXT,
-    calculation TEXT,
-    source TEXT,
-    source_code TEXT,
-    attributes TEXT,
-    name_attribute TEXT,
-    value_attribute TEXT,
-    value_tag TEXT
-);
+# Staging is per-run: each data_load/sqlite_load.py creates its own TEMP stg_table.
+# A stg_table persisted in the database file by previous versions is dropped on creation.
+DROP_LEGACY_STAGGING_TABLE = """
+DROP TABLE IF EXISTS main.stg_table;
 """
 
 CREATE_NUTS_TABLE = """
@@ -12,7 +12,6 @@ def create_tables(database: sqlite3.Connection) -> None:
     try:
         cursor = database.cursor()
         
-        cursor.execute(ct.CREATE_STAGGING_TABLE)
         cursor.execute(ct.CREATE_NUTS_TABLE)
         cursor.execute(ct.CREATE_GEOLEVEL_TABLE)
         cursor.execute(ct.CREATE_ATTRIBUTES_TABLE)
@@ -39,6 +38,37 @@ def create_tables(database: sqlite3.Connection) -> None:
         database.rollback()
 
 
+def drop_legacy_stagging(database: sqlite3.Connection) -> None:
+    """
+    Drop the stg_table persisted by previous versions and reclaim its space.
+
+    Staging now happens in a TEMP table created by each loader, so a persisted
+    stg_table only keeps rows from old runs and makes the database file grow.
+
+    Args:
+        database (sqlite3.Connection): Connection to the SQLite DB.
+    """
+    try:
+        cursor = database.cursor()
+        legacy = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stg_table'"
+        ).fetchone()
+        if legacy is None:
+            return
+
+        staged_rows = cursor.execute("SELECT COUNT(*) FROM main.stg_table").fetchone()[0]
+        cursor.execute(ct.DROP_LEGACY_STAGGING_TABLE)
+        database.commit()
+        # VACUUM cannot run inside a transaction, it is executed after the commit
+        database.execute("VACUUM")
+
+        print(f"Legacy stagging table dropped ({staged_rows} rows).")
+
+    except sqlite3.Error as e:
+        print(f"Error dropping the legacy stagging table: {e}")
+        database.rollback()
+
+
 def main() -> None:
     """
     Main function to create tables in the DB
@@ -46,6 +76,7 @@ def main() -> None:
     DB_PATH = 'sqlite_db.db'  # Relativa path to the db
     try:
         database = sqlite3.connect(DB_PATH)
+        drop_legacy_stagging(database=database)
         create_tables(database=database)
 
     except sqlite3.Error as error:
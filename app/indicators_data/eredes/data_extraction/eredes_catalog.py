@@ -0,0 +1,231 @@
+import html
+import json
+import os
+import re
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import logging
+
+import requests
+
+# Logging configuration
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Get the path of the root directory (irradiare-app) and add it to sys.path to import the utils modules
+irradiare_app_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..'))
+sys.path.append(irradiare_app_path)
+
+import app.utils.settings as s
+import app.utils.http_utils as hu
+
+
+"""
+Enumeration of the E-REDES catalogue through the OpenDataSoft Explore API of the portal, instead of scrolling the catalogue page.
+
+    - The catalogue is listed page by page ('/catalog/datasets?limit=...&offset=...'): a few JSON requests return every dataset
+      with its metadata, so neither a browser nor the export page of each indicator is needed.
+    - The CSV export link of each dataset is built from its identifier ('/catalog/datasets/<id>/exports/csv'), the same link
+      found in the 'Export' tab of the portal.
+    - The metadata of each dataset is returned with the same labels as the indicator cards of the portal, so 'eredes_metadata.py'
+      saves the same metadata file.
+
+The pages returned by the API are saved as they are (`save_catalog_pages`) and can be read back instead of calling the API
+(`load_catalog_pages`), so the parsing can be checked against a recorded catalogue.
+"""
+
+# Number of datasets requested per catalogue page (maximum allowed by the API: 100)
+catalog_page_size = 100
+
+# Card label of each metadata field of the API ('metas' -> 'default'), as shown in the catalogue page
+metadata_labels = {
+    'publisher': 'Publisher',
+    'license': 'License',
+    'modified': 'Modified',
+    'records_count': 'Records',
+    'language': 'Language'
+}
+
+
+def fetch_catalog_pages(session: requests.Session, api_url: str = s.eredes_api_url, page_size: int = catalog_page_size) -> Iterator[Dict[str, Any]]:
+    """
+    Lists the catalogue of the portal through the API, one page at a time.
+
+    Args:
+        session (requests.Session): Session created with `http_utils.create_session`.
+        api_url (str): Base URL of the Explore API of the portal.
+        page_size (int): Number of datasets requested per page.
+
+    Yields:
+        Dict[str, Any]: Each page of the catalogue as returned by the API ('total_count' and 'results').
+
+    Raises:
+        requests.exceptions.RequestException: If a request fails.
+        ValueError: If a response is not a JSON catalogue page.
+    """
+    offset = 0
+    while True:
+        response = hu.get(session, f"{api_url}/catalog/datasets", params={'limit': page_size, 'offset': offset}, headers=s.headers)
+        response.raise_for_status()
+        page = response.json()
+        if not isinstance(page, dict) or 'results' not in page:
+            raise ValueError(f"Unexpected catalogue page at offset {offset}")
+        yield page
+        offset += len(page['results'])
+        if not page['results'] or offset >= page.get('total_count', 0):
+            break
+
+
+def save_catalog_pages(pages: Iterable[Dict[str, Any]], pages_path: str) -> List[Dict[str, Any]]:
+    """
+    Saves the pages of the catalogue returned by the API into a JSON file (under a temporary name, renamed when completed).
+
+    Args:
+        pages (Iterable[Dict[str, Any]]): Pages of the catalogue.
+        pages_path (str): Path to the JSON file.
+
+    Returns:
+        List[Dict[str, Any]]: Pages saved.
+    """
+    pages = list(pages)
+    os.makedirs(os.path.dirname(pages_path) or '.', exist_ok=True)
+    temp_path = f"{pages_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as pages_file:
+        json.dump(pages, pages_file, ensure_ascii=False)
+    os.replace(temp_path, pages_path)
+    return pages
+
+
+def load_catalog_pages(pages_path: str) -> List[Dict[str, Any]]:
+    """
+    Loads the pages of the catalogue saved by `save_catalog_pages`.
+
+    Args:
+        pages_path (str): Path to the JSON file.
+
+    Returns:
+        List[Dict[str, Any]]: Pages of the catalogue, as returned by the API.
+    """
+    with open(pages_path, 'r', encoding='utf-8') as pages_file:
+        return json.load(pages_file)
+
+
+def html_to_text(value: Optional[str]) -> str:
+    """
+    Converts the HTML description of a dataset to plain text, as shown in the indicator cards.
+
+    Args:
+        value (Optional[str]): HTML description.
+
+    Returns:
+        str: Text of the description, with single spaces between words.
+    """
+    if not value:
+        return ''
+    return ' '.join(html.unescape(re.sub(r'<[^>]+>', ' ', value)).split())
+
+
+def metadata_value(value: Any) -> str:
+    # Lists (several languages or publishers) are joined as in the cards, and missing values are empty
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ', '.join(str(item) for item in value)
+    return str(value)
+
+
+def is_indicator(title: str) -> bool:
+    # Same filter as the catalogue cards: the CMS pages of the portal are not indicators
+    return title != '' and '[cms]' not in title.lower()
+
+
+def export_url(dataset_id: str, api_url: str = s.eredes_api_url, export_query: str = s.eredes_export_query) -> str:
+    """
+    Returns the CSV export link of a dataset.
+
+    Args:
+        dataset_id (str): Identifier of the dataset (src_code).
+        api_url (str): Base URL of the Explore API of the portal.
+        export_query (str): Query string of the export (language, timezone, column labels and delimiter).
+
+    Returns:
+        str: CSV export link, with the dataset identifier as the third to last path component (see `eredes_data.download_csv_file`).
+    """
+    return f"{api_url}/catalog/datasets/{dataset_id}/exports/csv?{export_query}"
+
+
+def parse_catalog(pages: Iterable[Dict[str, Any]], api_url: str = s.eredes_api_url, export_query: str = s.eredes_export_query) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """
+    Extracts the CSV export links and the metadata of the indicators from the pages of the catalogue.
+
+    Args:
+        pages (Iterable[Dict[str, Any]]): Pages of the catalogue, from the API or from a saved file.
+        api_url (str): Base URL of the Explore API of the portal.
+        export_query (str): Query string of the exports.
+
+    Returns:
+        Tuple[List[str], List[Dict[str, Any]]]:
+            - CSV export links of the datasets with records (the ones with an 'Export' tab in the portal).
+            - Metadata of each indicator, as returned by `eredes_metadata.get_metadata_items`: title, description,
+              metadata (card label -> value) and src_code.
+    """
+    urls, metadata_list = [], []
+    for page in pages:
+        for dataset in page['results']:
+            dataset_id = dataset['dataset_id']
+            default_metas = dataset.get('metas', {}).get('default', {})
+            title = (default_metas.get('title') or '').strip()
+            if not is_indicator(title):
+                continue
+            if dataset.get('has_records', True):
+                urls.append(export_url(dataset_id, api_url, export_query))
+            metadata_list.append({
+                'title': title,
+                'description': html_to_text(default_metas.get('description')),
+                'metadata': {label: metadata_value(default_metas.get(field)) for field, label in metadata_labels.items()},
+                'src_code': dataset_id
+            })
+    return urls, metadata_list
+
+
+def get_catalog(pages_path: str = s.eredes_catalog_pages, api_url: str = s.eredes_api_url, recorded: bool = False) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """
+    Lists the catalogue through the API (saving its pages), or reads a recorded catalogue.
+
+    Args:
+        pages_path (str): Path to the JSON file where the pages of the catalogue are saved.
+        api_url (str): Base URL of the Explore API of the portal.
+        recorded (bool): Whether to read the pages saved in `pages_path` instead of calling the API.
+
+    Returns:
+        Tuple[List[str], List[Dict[str, Any]]]: CSV export links and metadata of the indicators (see `parse_catalog`).
+
+    Raises:
+        requests.exceptions.RequestException: If a request to the API fails.
+        ValueError: If the API does not return the catalogue, or it has no indicators.
+    """
+    if recorded:
+        pages = load_catalog_pages(pages_path)
+    else:
+        with hu.create_session(max_connections=1) as session:
+            pages = save_catalog_pages(fetch_catalog_pages(session, api_url), pages_path)
+    try:
+        urls, metadata_list = parse_catalog(pages, api_url)
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"Unexpected catalogue format: {e}") from e
+    if not metadata_list:
+        raise ValueError("The catalogue has no indicators")
+    logging.info(f"Catalogue listed: {len(metadata_list)} indicators, {len(urls)} CSV export links")
+    return urls, metadata_list
+
+
+def main() -> None:
+    """
+    Main entry point of the script: lists the catalogue through the API and saves its pages, which can be used as a recorded catalogue.
+    """
+    urls, metadata_list = get_catalog()
+    print(f"{len(metadata_list)} indicators and {len(urls)} CSV export links saved in {s.eredes_catalog_pages}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,16 @@
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from selenium import webdriver
 from selenium.webdriver.edge.service import Service
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 from tqdm import tqdm
+from typing import Any, Dict, List, Optional, Tuple
 from webdriver_manager.microsoft import EdgeChromiumDriverManager
 
+import functools
+import queue
 import sys
 import os
 import time
@@ -47,39 +51,63 @@ As the root of the project is now in the 'sys.path', it is possible to import th
 
 # Import settings
 import app.utils.settings as s
+import app.utils.http_utils as hu
+import app.utils.http_cache as hc
+import app.indicators_data.eredes.data_extraction.eredes_catalog as ec
 
-def set_driver(url: str) -> webdriver.Edge:
+@functools.lru_cache(maxsize=None)
+def driver_path() -> str:
+    """
+    Install the Edge driver (only in the first execution) and return its path.
+    The path is kept, so the driver manager is only called once per run, instead of once per driver.
+
+    Returns:
+    - str: Path to the Edge driver executable.
+    """
+    return EdgeChromiumDriverManager().install()
+
+def set_driver(url: Optional[str] = None, headless: bool = False) -> webdriver.Edge:
     """
     Set an Edge driver with a specific configuration and the url needed to scrap the site.
 
     Args:
-    - url (str): The URL to navigate to.
+    - url (Optional[str]): The URL to navigate to (none if the driver is navigated later, as the drivers of the pool).
+    - headless (bool): Whether to run the browser without a window.
 
     Returns:
     - webdriver.Edge: Initialized instance of the Edge WebDriver.
     """
     options = webdriver.EdgeOptions()
-    options.add_experimental_option("detach", True) # Avoids the driver to automatically close after ending the session
-    driver = webdriver.Edge(options=options, service=Service(EdgeChromiumDriverManager().install())) # The driver is installed in the first execution
-    driver.get(url)
-    logging.info(f"Opened URL: {driver.title}")
+    if headless:
+        options.add_argument("--headless=new")
+    else:
+        options.add_experimental_option("detach", True) # Avoids the driver to automatically close after ending the session
+    driver = webdriver.Edge(options=options, service=Service(driver_path()))
+    if url is not None:
+        driver.get(url)
+        logging.info(f"Opened URL: {driver.title}")
     return driver
 
-def scroll_page(driver: webdriver.Edge) -> None:
+def scroll_page(driver: webdriver.Edge, timeout: float = s.eredes_page_timeout) -> None:
     """
     Scroll the page to load all content.
+    After each scroll, waits until the page grows (new cards loaded) instead of a fixed time; the page is fully
+    loaded when it does not grow within the timeout.
 
     Args:
     - driver (webdriver.Edge): Instance of the WebDriver to control the browser.
+    - timeout (float): Seconds to wait for new content after each scroll.
     """
     body_height = driver.execute_script("return document.body.scrollHeight")
     while True:
         driver.execute_script('window.scrollTo(0, document.body.scrollHeight);')
-        time.sleep(5)
-        new_body_height = driver.execute_script("return document.body.scrollHeight")
-        if new_body_height == body_height: # In this case, there is no more content to load.
+        try:
+            WebDriverWait(driver, timeout).until(
+                lambda d: d.execute_script("return document.body.scrollHeight") > body_height
+            )
+        except TimeoutException: # In this case, there is no more content to load.
             break
-        body_height = new_body_height
+        body_height = driver.execute_script("return document.body.scrollHeight")
     logging.info("Scrolling completed")
 
 def get_urls(driver: webdriver.Edge) -> list:
@@ -95,8 +123,8 @@ def get_urls(driver: webdriver.Edge) -> list:
     filtered_urls = []
     scroll_page(driver)
     try:
-        main = WebDriverWait(driver, 10).until(             # Waiting 10 seconds to let the page load the whole content
-            EC.presence_of_element_located((By.ID, "main")) # and locate the main element
+        main = WebDriverWait(driver, s.eredes_page_timeout).until( # Waiting to let the page load the whole content
+            EC.presence_of_element_located((By.ID, "main"))        # and locate the main element
         )
         logging.info("Main element located")
         ods = main.find_elements(By.TAG_NAME, "ods-catalog-card")
@@ -110,45 +138,116 @@ def get_urls(driver: webdriver.Edge) -> list:
         driver.quit()
     return filtered_urls
 
-def get_datasets_url(url: str, final_urls: list) -> None:
+def get_datasets_url(url: str, driver: webdriver.Edge, timeout: float = s.eredes_page_timeout) -> list:
     """
-    Extracts CSV export links from the export page of each indicator and appends them to the provided 'final_urls' list.
+    Extracts the CSV export links from the export page of an indicator.
+    The page is loaded in a driver of the pool, waiting until its export links are present.
 
     Args:
         url (str): The URL of the export page where the CSV export links are located.
-        final_urls (list): A list to which the extracted CSV export URLs will be appended.
+        driver (webdriver.Edge): Driver used to load the page (reused for the next pages).
+        timeout (float): Seconds to wait for the export links to be present.
+
+    Returns:
+        list: The CSV export URLs found in the page.
+    """
+    driver.get(url)
+    new_url_elements = WebDriverWait(driver, timeout).until(
+        EC.presence_of_all_elements_located((By.CLASS_NAME, "ods-dataset-export-link__link"))
+    )
+    logging.info(f"Export page links located: {url}")
+    return [href for href in (element.get_attribute("href") for element in new_url_elements) if href and "/csv" in href]
+
+def get_datasets_urls(urls: list, drivers: int = s.eredes_browser_drivers) -> list:
+    """
+    Extracts the CSV export links from the export pages of every indicator, using a pool of headless browsers.
+
+        - The drivers are created once and kept in a queue: each page is loaded by a free driver, which is returned to the
+          queue afterwards, instead of starting a new browser for each page.
+        - The pages are loaded in parallel, one per driver.
+        - A page whose export links are not found (timeout or browser error) is logged and skipped. A driver which fails
+          with a browser error is replaced by a new one.
+
+    Args:
+        urls (list): The URLs of the export pages.
+        drivers (int): Number of browsers of the pool.
+
+    Returns:
+        list: The CSV export URLs found, in the order of the export pages.
     """
-    driver = set_driver(url)
+    if not urls:
+        return []
+    drivers = max(1, min(drivers, len(urls)))
+    pool = queue.Queue()
+    started = time.perf_counter()
     try:
-        export_page = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "main"))
-        )
-        logging.info("Export page element located")
-        new_url_elements = export_page.find_elements(By.CLASS_NAME, "ods-dataset-export-link__link")
-        new_urls = [element.get_attribute("href") for element in new_url_elements if "/csv" in element.get_attribute("href")]
-        final_urls.extend(new_urls)
+        for _ in range(drivers):
+            pool.put(set_driver(headless=True))
+
+        def visit(url: str) -> list:
+            driver = pool.get()
+            try:
+                return get_datasets_url(url, driver)
+            except TimeoutException as e:
+                logging.error(f"Export links not found in {url}: {e}")
+                return []
+            except WebDriverException as e:
+                # The browser may have crashed or lost its session: it is replaced by a new one, so that the next pages
+                # are not loaded by a broken driver (the old one is kept if a new browser cannot be started)
+                logging.error(f"Export links not found in {url}, restarting the browser: {e}")
+                try:
+                    new_driver = set_driver(headless=True)
+                except WebDriverException as restart_error:
+                    logging.error(f"Browser could not be restarted: {restart_error}")
+                else:
+                    try:
+                        driver.quit()
+                    except WebDriverException:
+                        pass
+                    driver = new_driver
+                return []
+            finally:
+                pool.put(driver)
+
+        with ThreadPoolExecutor(max_workers=drivers) as executor:
+            final_urls = [new_url for new_urls in executor.map(visit, urls) for new_url in new_urls]
     finally:
-        driver.quit()
+        while not pool.empty():
+            pool.get().quit()
 
-def download_csv_file(url: str, save_folder: str, retries: int = 3) -> None:
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"Export pages: {len(urls)} pages in {elapsed:.1f}s with {drivers} drivers ({len(urls) / elapsed * 60:,.1f} pages/min), "
+          f"{len(final_urls)} CSV export links")
+    return final_urls
+
+def download_csv_file(url: str, save_folder: str, session: requests.Session, cache: hc.HttpCache, retries: int = 3) -> None:
     """
     Download the CSV data file by means of the CSV export URL for each indicator with a max. of 3 possible tried.
     The downloaded CSV file is saved into a new save_folder.
 
+    The file is streamed to disk (see `http_utils.download_file`), so the memory used does not depend on its size.
+    If the file was already downloaded, it is requested with the validators saved in the HTTP cache, and it is not
+    downloaded again (and recorded as unchanged) if it has not changed.
+
     Args:
     - url (str): CSV data file download URL.
     - save_folder (str): Folder where the downloaded CSV data files are saved.
+    - session (requests.Session): Session shared by the download threads (see `http_utils.create_session`).
+    - cache (HttpCache): HTTP cache of the E-REDES extraction.
     - retries  (int): Maximum amount of download retries allowed.
     
     """
+    src_code = url.split("/")[-3]
+    file_name = src_code + ".csv"
+    file_path = os.path.join(save_folder, file_name)
     for attempt in range(retries):
         try:
             logging.info(f"Starting download for {url}")
-            response = requests.get(url, timeout=60) # Give 60sec. to get a response
-            response.raise_for_status()
-            file_name = url.split("/")[-3] + ".csv"
-            with open(os.path.join(save_folder, file_name), "wb") as file:
-                file.write(response.content)
+            # The file is streamed to disk, and a failed attempt is resumed by the next one
+            if hu.download_file(session, url, file_path, cache, timeout=60): # Give 60sec. to get a response
+                cache.mark_unchanged(src_code)
+                logging.info(f"CSV file unchanged: {file_name}")
+                break
             logging.info(f"CSV file downloaded: {file_name}")
             break
         except requests.exceptions.RequestException as e:
@@ -158,7 +257,7 @@ def download_csv_file(url: str, save_folder: str, retries: int = 3) -> None:
             else:
                 time.sleep(5)
 
-def download_csv_files_parallel(urls: list, save_folder: str, max_workers: int = 4) -> None:
+def download_csv_files_parallel(urls: list, save_folder: str, max_workers: int = 4, cache_path: str = s.eredes_http_cache) -> None:
     """
     Using the 'download_csv_file' function, downloads multiple CSV files in parallel from the specified URLs and saves them to a designated folder.
 
@@ -175,34 +274,58 @@ def download_csv_files_parallel(urls: list, save_folder: str, max_workers: int =
         urls (list): A list of strings, where each string is a URL pointing to a CSV file to be downloaded.
         save_folder (str): The path to the folder where the downloaded CSV files will be saved.
         max_workers (int, optional): The maximum number of threads to use for downloading files concurrently. Defaults to 4.
+        cache_path (str): Path to the HTTP cache file, with the validators of the files already downloaded.
+                                    The files unchanged since the previous extraction are saved in it too.
     """
     os.makedirs(save_folder, exist_ok=True)
-    with ThreadPoolExecutor(max_workers=max_workers) as executor: # Creates a pool of 4 workers to execute parallel tasks
-        futures = [executor.submit(download_csv_file, url, save_folder) for url in urls] # Set the action 'download_csv_file' and the parameters for the action to be executed by the pool of workers
+    cache = hc.HttpCache(cache_path)
+    session = hu.create_session(max_connections=max_workers, retries=0) # The failed downloads are retried by 'download_csv_file'
+    with session, ThreadPoolExecutor(max_workers=max_workers) as executor: # Creates a pool of 4 workers to execute parallel tasks
+        futures = [executor.submit(download_csv_file, url, save_folder, session, cache) for url in urls] # Set the action 'download_csv_file' and the parameters for the action to be executed by the pool of workers
         for future in tqdm(as_completed(futures), total=len(futures), desc="Downloading CSV files"): # The tqdm library adds very basic download information such a progress bar, download speed, etc.
             try:                                                                                     # as_completed(futures) iterates over the 'future' objects while tasks are completed
                 future.result() # shows the result once each download process is completed
             except Exception as e:
                 logging.error(f"Error: {e}")
+    cache.save() # The files which have not changed are skipped by the processing scripts
 
-def main() -> None:
+def get_catalog_urls() -> Tuple[list, Optional[List[Dict[str, Any]]]]:
     """
-    Main entry point of the script. This function performs the following tasks:
-    1. Sets up the driver
-    2. Scraps and gets the 'export page' URL for each indicator
-    3. Gets the CSV data file specific download link for each indicator
-    4. Downloads the CSV files in parallel and saves them in a specific folder
+    Gets the CSV export URL of each indicator, listing the catalogue through the OpenDataSoft API of the portal (see 'eredes_catalog.py').
+    The catalogue page is only scraped with Selenium if the API fails, or if it is selected in the settings ('eredes_catalog_engine').
+
+    Returns:
+    - Tuple[list, Optional[List[Dict[str, Any]]]]:
+        - A list of strings where each string is the CSV export URL of an indicator.
+        - The metadata of the indicators listed through the API, from the same catalogue as the URLs (None if the catalogue was scraped).
     """
+    if s.eredes_catalog_engine != 'selenium':
+        try:
+            return ec.get_catalog(recorded=s.eredes_catalog_engine == 'recorded')
+        except (requests.exceptions.RequestException, ValueError, OSError) as e:
+            logging.warning(f"Could not list the catalogue through the API, scraping it with Selenium: {e}")
 
-    print("This process may take about 1 to 2 hours to complete, depending on your computer.")
+    print(f"Scraping the catalogue with {s.eredes_browser_drivers} browsers. This process may take several minutes, depending on your computer.")
     driver = set_driver(s.eredes_url)
     indicators_url = get_urls(driver)
-    final_urls = [] # The list with CSV download URLs must be outside the loop to accumulate all URLs across iterations. Otherwise, it would be reset each time.
-    for url in indicators_url:
-        get_datasets_url(url, final_urls)
-        logging.info(f"Collected URLs: {final_urls}")
+    final_urls = get_datasets_urls(indicators_url)
+    logging.info(f"Collected URLs: {final_urls}")
+    return final_urls, None
+
+def main() -> Optional[List[Dict[str, Any]]]:
+    """
+    Main entry point of the script. This function performs the following tasks:
+    1. Gets the CSV data file download link for each indicator (see 'get_catalog_urls')
+    2. Downloads the CSV files in parallel and saves them in a specific folder
+
+    Returns:
+    - Optional[List[Dict[str, Any]]]: The metadata of the indicators listed through the API, to be saved by 'eredes_metadata.py'
+      without listing the catalogue again (None if the catalogue was scraped).
+    """
+    final_urls, indicators_metadata = get_catalog_urls()
     download_csv_files_parallel(final_urls, s.eredes_raw_data)
     print("PROCESS COMPLETED. DATA EXTRACTED.")
+    return indicators_metadata
 
 
 if __name__ == "__main__":
@@ -1,16 +1,17 @@
 from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.edge.service import Service
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
-from typing import List, Dict
+from typing import Any, List, Dict, Optional
 from webdriver_manager.microsoft import EdgeChromiumDriverManager
 
 import csv
 import os
 import sys
-import time
 
+import requests
 import logging
 
 # Logging configuration
@@ -45,6 +46,7 @@ As the root of the project is now in the 'sys.path', it is possible to import th
 
 # Import settings
 import app.utils.settings as s
+import app.indicators_data.eredes.data_extraction.eredes_catalog as ec
 
 
 def set_driver(url: str) -> webdriver.Edge:
@@ -74,11 +76,14 @@ def scroll_page(driver: webdriver.Edge) -> None:
     body_height = driver.execute_script("return document.body.scrollHeight")
     while True:
         driver.execute_script('window.scrollTo(0, document.body.scrollHeight);')
-        time.sleep(5)
-        new_body_height = driver.execute_script("return document.body.scrollHeight")
-        if new_body_height == body_height:
+        try:
+            # Wait until new cards are loaded instead of a fixed time
+            WebDriverWait(driver, s.eredes_page_timeout).until(
+                lambda d: d.execute_script("return document.body.scrollHeight") > body_height
+            )
+        except TimeoutException:
             break
-        body_height = new_body_height
+        body_height = driver.execute_script("return document.body.scrollHeight")
     logging.info("Scrolling completed")
 
 def get_metadata_items(driver: webdriver.Edge) -> List[Dict[str, str]]:
@@ -172,10 +177,28 @@ def save_metadata_to_csv(metadata_list: List[Dict[str, str]], save_folder: str,
             
     logging.info(f"CSV file saved as {csv_filename}")
 
-def main() -> None:
+def main(indicators_metadata: Optional[List[Dict[str, Any]]] = None) -> None:
     """
     Main entry point of the script.
+    The metadata is taken from the catalogue listed through the OpenDataSoft API of the portal (see 'eredes_catalog.py'),
+    and the indicator cards are only scraped with Selenium if the API fails or if it is selected in the settings ('eredes_catalog_engine').
+
+    Args:
+        indicators_metadata (Optional[List[Dict[str, Any]]]): Metadata of the catalogue already listed by 'eredes_data.py', saved
+                                                              as it is, so that the data and the metadata come from the same catalogue.
     """
+    if indicators_metadata is not None:
+        save_metadata_to_csv(indicators_metadata, s.eredes_metadata_folder, 'metadata.csv')
+        return
+
+    if s.eredes_catalog_engine != 'selenium':
+        try:
+            _, indicators_metadata = ec.get_catalog(recorded=s.eredes_catalog_engine == 'recorded')
+            save_metadata_to_csv(indicators_metadata, s.eredes_metadata_folder, 'metadata.csv')
+            return
+        except (requests.exceptions.RequestException, ValueError, OSError) as e:
+            logging.warning(f"Could not list the catalogue through the API, scraping it with Selenium: {e}")
+
     driver = None
     try:
         driver = set_driver(s.eredes_url)
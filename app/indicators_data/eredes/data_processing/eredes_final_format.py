@@ -1,10 +1,9 @@
-from typing import List, Dict, Union, Any, Tuple
+from typing import AbstractSet, List, Dict, Union, Tuple, Iterable, Iterator, Mapping, Optional
 
-import csv
-import json
 import os
 import re
 import sys
+import time
 from concurrent.futures import ThreadPoolExecutor
 
 import logging
@@ -39,6 +38,10 @@ As the root of the project is now in the 'sys.path', it is possible to import th
 
 # Import settings
 import app.utils.settings as s
+import app.utils.processed_files as pf
+import app.utils.geo_index as gi
+import app.utils.http_cache as hc
+import app.indicators_data.eredes.data_processing.eredes_merge_files as merge
 
 # Function to clean 'Date' columns
 def clean_date(value: str) -> str:
@@ -116,97 +119,73 @@ def get_column_indices(headers: List[str], column_groups: Dict[str, List[str]])
 
     return column_indices
 
-def process_file(filename: str, merged_files_path: str, final_data_path: str) -> None:
+def get_timecode(row: List[str], column_indices: Dict[str, Union[int, None]]) -> str:
     """
-    Processes a CSV file by adding a 'timecode' column and saving the modified file.
+    Builds the timecode of a data row from its date or year+period (month, semester, quarter) columns.
 
     Args:
-        filename (str): The name of the CSV file to process.
-        merged_files_path (str): The path where the merged files are located.
-        final_data_path (str): The path where the processed files will be saved.
-    """
-    file_path = os.path.join(merged_files_path, filename)
-    print(f"Processing file: {file_path}")
+        row (List[str]): The data row.
+        column_indices (Dict[str, Union[int, None]]): Indices of the 'date', 'year', 'month', 'semester' and 'quarter' columns.
 
-    with open(file_path, 'r', encoding='utf-8') as csv_file:
-        reader = csv.reader(csv_file, delimiter=';')
-        headers = next(reader)
-        headers = [header.lstrip('\ufeff') for header in headers]
-
-        column_groups = {
-            'date': s.eredes_date_cols,
-            'year': s.eredes_year_cols,
-            'month': s.eredes_month_cols,
-            'semester': s.eredes_semester_cols,
-            'quarter': s.eredes_quarter_cols
-        }
-
-        column_indices = get_column_indices(headers, column_groups)
-
-        date_idx = column_indices.get('date', None)
-        year_idx = column_indices.get('year', None)
-        month_idx = column_indices.get('month', None)
-        semester_idx = column_indices.get('semester', None)
-        quarter_idx = column_indices.get('quarter', None)
-
-        headers.insert(0, "timecode")
-        new_rows = []
-
-        for row in reader:
-            new_row = row.copy()
-            timecode = ""
-            if date_idx is not None and date_idx < len(row):
-                timecode = extract_date(row[date_idx])
-            elif year_idx is not None and year_idx < len(row):
-                year_value = row[year_idx]
-                if month_idx is not None and month_idx < len(row):
-                    month_value = row[month_idx].zfill(2)
-                    timecode = combine_year_with_period(year_value, month_value)
-                elif semester_idx is not None and semester_idx < len(row):
-                    semester_value = row[semester_idx].zfill(2)
-                    if len(semester_value) == 1:
-                        semester_value = 'S' + semester_value
-                    timecode = combine_year_with_period(year_value, semester_value)
-                elif quarter_idx is not None and quarter_idx < len(row):
-                    quarter_value = row[quarter_idx].zfill(2)
-                    if len(quarter_value) == 1:
-                        quarter_value = 'Q' + quarter_value
-                    timecode = combine_year_with_period(year_value, quarter_value)
-                else:
-                    timecode = year_value
-            else:
-                if quarter_idx is not None and quarter_idx < len(row):
-                    timecode = clean_date(row[quarter_idx])
-                elif semester_idx is not None and semester_idx < len(row):
-                    timecode = clean_date(row[semester_idx])
-
-            new_row.insert(0, timecode)
-            new_rows.append(new_row)
-
-    os.makedirs(final_data_path, exist_ok=True)
-    output_file_path = os.path.join(final_data_path, f"temp_timecode_{filename}")
-    with open(output_file_path, 'w', encoding='utf-8', newline='') as output_file:
-        writer = csv.writer(output_file, delimiter=';')
-        writer.writerow(headers)
-        writer.writerows(new_rows)
-
-    print(f"File processed and saved at: {output_file_path}")
-    os.remove(file_path)
-    print(f"Original file deleted: {file_path}")
-
-def add_timecode(merged_files_path: str, final_data_path: str) -> None:
+    Returns:
+        str: The timecode of the row, or an empty string if it has no time columns.
     """
-    Adds timecodes to all CSV files in the merged files directory and saves the results.
+    date_idx = column_indices.get('date', None)
+    year_idx = column_indices.get('year', None)
+    month_idx = column_indices.get('month', None)
+    semester_idx = column_indices.get('semester', None)
+    quarter_idx = column_indices.get('quarter', None)
+
+    timecode = ""
+    if date_idx is not None and date_idx < len(row):
+        timecode = extract_date(row[date_idx])
+    elif year_idx is not None and year_idx < len(row):
+        year_value = row[year_idx]
+        if month_idx is not None and month_idx < len(row):
+            month_value = row[month_idx].zfill(2)
+            timecode = combine_year_with_period(year_value, month_value)
+        elif semester_idx is not None and semester_idx < len(row):
+            semester_value = row[semester_idx].zfill(2)
+            if len(semester_value) == 1:
+                semester_value = 'S' + semester_value
+            timecode = combine_year_with_period(year_value, semester_value)
+        elif quarter_idx is not None and quarter_idx < len(row):
+            quarter_value = row[quarter_idx].zfill(2)
+            if len(quarter_value) == 1:
+                quarter_value = 'Q' + quarter_value
+            timecode = combine_year_with_period(year_value, quarter_value)
+        else:
+            timecode = year_value
+    else:
+        if quarter_idx is not None and quarter_idx < len(row):
+            timecode = clean_date(row[quarter_idx])
+        elif semester_idx is not None and semester_idx < len(row):
+            timecode = clean_date(row[semester_idx])
+    return timecode
+
+def add_timecode_column(headers: List[str], rows: Iterable[List[str]]) -> Tuple[List[str], Iterator[List[str]]]:
+    """
+    Transform adding a 'timecode' column at the beginning of each row, one row at a time.
 
     Args:
-        merged_files_path (str): The directory containing the merged files.
-        final_data_path (str): The directory where the processed files will be saved.
+        headers (List[str]): Headers of the data file.
+        rows (Iterable[List[str]]): Rows of the data file.
+
+    Returns:
+        Tuple[List[str], Iterator[List[str]]]: Headers including 'timecode' and an iterator over the new rows.
     """
-    files = [filename for filename in os.listdir(merged_files_path) if filename.endswith(".csv")]
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        for filename in files:
-            executor.submit(process_file, filename, merged_files_path, final_data_path)
-    os.rmdir(merged_files_path)
+    headers = [header.lstrip('\ufeff') for header in headers]
+
+    column_groups = {
+        'date': s.eredes_date_cols,
+        'year': s.eredes_year_cols,
+        'month': s.eredes_month_cols,
+        'semester': s.eredes_semester_cols,
+        'quarter': s.eredes_quarter_cols
+    }
+    column_indices = get_column_indices(headers, column_groups)
+
+    return ["timecode"] + headers, ([get_timecode(row, column_indices)] + row for row in rows)
 
 
 #/////////////////////////////////////////////////////////////////////////////////////////
@@ -215,108 +194,78 @@ def add_timecode(merged_files_path: str, final_data_path: str) -> None:
 
 import os
 import re
-import csv
-import json
 from concurrent.futures import ThreadPoolExecutor
-from typing import Dict, Any, Union, Tuple
+from typing import Dict, Union, Tuple
 
-def load_dicofre_data(dicofre_path: str) -> Dict[str, Any]:
-    with open(dicofre_path, 'r', encoding='utf-8') as dicofre_file:
-        print("Loaded dicofre data")
-        return json.load(dicofre_file)
-
-def load_zipcode_data(zipcode_path: str) -> Dict[str, Any]:
-    with open(zipcode_path, 'r', encoding='utf-8') as zipcode_file:
-        print("Loaded zipcode data")
-        return json.load(zipcode_file)
-
-def load_nuts_data(nuts_path: str) -> Dict[str, Any]:
-    with open(nuts_path, 'r', encoding='utf-8') as nuts_file:
-        return json.load(nuts_file)
-
-def get_location_data_dicofre(dicofre: Union[int, str], dicofre_dict: Dict[str, Dict[str, str]]) -> Tuple[str, str, str]:
+def get_location_data_dicofre(dicofre: Union[int, str], dicofre_index: Mapping[str, Tuple[str, str, str]]) -> Tuple[str, str, str]:
     dicofre_str = str(dicofre)
-    location_data = {}
     distrito, concelho, freguesia = 'undefined', 'undefined', 'undefined'
 
     if len(dicofre_str) >= 6:
-        location_data = dicofre_dict.get(dicofre_str, {})
-        distrito = location_data.get('distrito', 'undefined')
-        concelho = location_data.get('concelho', 'undefined')
-        freguesia = location_data.get('freguesia', 'undefined')
+        distrito, concelho, freguesia = dicofre_index.get(dicofre_str, (distrito, concelho, freguesia))
     elif len(dicofre_str) >= 4:
-        for key, data in dicofre_dict.items():
-            if key.startswith(dicofre_str[:4]):
-                location_data = data
-                break
-        distrito = location_data.get('distrito', 'undefined')
-        concelho = location_data.get('concelho', 'undefined')
+        distrito, concelho, _ = dicofre_index.get(dicofre_str[:4], (distrito, concelho, freguesia))
     elif len(dicofre_str) >= 2:
-        for key, data in dicofre_dict.items():
-            if key.startswith(dicofre_str[:2]):
-                location_data = data
-                break
-        distrito = location_data.get('distrito', 'undefined')
+        distrito, _, _ = dicofre_index.get(dicofre_str[:2], (distrito, concelho, freguesia))
 
     return distrito, concelho, freguesia
 
-def get_location_data_zipcode(zipcode: Union[int, str], zipcode_dict: Dict[str, Dict[str, str]]) -> Tuple[str, str, str]:
+def get_location_data_zipcode(zipcode: Union[int, str], zipcode_index: Mapping[str, Tuple[str, str, str]]) -> Tuple[str, str, str]:
     zipcode_clean = re.sub(r'[^0-9]', '', str(zipcode))
     
     if len(zipcode_clean) == 4:
-        for key, data in zipcode_dict.items():
-            if data['ZipNoFormat'].startswith(zipcode_clean):
-                return data['distrito'], data['concelho'], 'undefined'
+        location_data = zipcode_index.get(zipcode_clean)
+        if location_data:
+            return location_data[0], location_data[1], 'undefined'
     
     if len(zipcode_clean) >= 7:
-        location_data = zipcode_dict.get(zipcode_clean, {})
+        location_data = zipcode_index.get(zipcode_clean)
         if location_data:
-            return location_data['distrito'], location_data['concelho'], location_data['freguesia']
-        else:
-            for key, data in zipcode_dict.items():
-                if data['ZipNoFormat'].startswith(zipcode_clean):
-                    return data['distrito'], data['concelho'], data['freguesia']
+            return location_data
     
     return 'undefined', 'undefined', 'undefined'
 
-def get_nuts_data(concelho: str, nuts_dict: Dict[str, Dict[str, Dict[str, Union[Dict[str, str], List[str]]]]]) -> Tuple[str, str, str]:
-    nuts1, nuts2, nuts3 = 'undefined', 'undefined', 'undefined'
-    
-    for nuts1_region, nuts1_info in nuts_dict.items():
-        for region_nuts2, nuts2_info in nuts1_info.get("NUTS 2", {}).items():
-            for nuts3_region, nuts3_data in nuts2_info.get("NUTS 3", {}).items():
-                if concelho in nuts3_data.get("Municipalities", []):
-                    return nuts1_region, region_nuts2, nuts3_region
-    
-    return nuts1, nuts2, nuts3
+def get_nuts_data(concelho: str, nuts_index: Mapping[str, Tuple[str, str, str]]) -> Tuple[str, str, str]:
+    return nuts_index.get(concelho, ('undefined', 'undefined', 'undefined'))
+
+# Columns of the geography dimension saved in the dimension dictionary of each final file
+geo_cols = ['distrito', 'concelho', 'freguesia', 'nuts1', 'nuts2', 'nuts3', 'dicofre', 'zipcode']
 
-def process_file2(file_path: str, dicofre_dict: Dict[str, Dict[str, str]], zipcode_dict: Dict[str, Dict[str, str]], nuts_dict: Dict[str, Dict[str, Dict[str, Union[Dict[str, str], List[str]]]]]) -> None:
+def add_geodata_columns(headers: List[str], rows: Iterable[List[str]], dicofre_index: Mapping[str, Tuple[str, str, str]], zipcode_index: Mapping[str, Tuple[str, str, str]], nuts_index: Mapping[str, Tuple[str, str, str]], indicator_cols: List[str], geo_keys: Dict[Tuple[str, ...], int], indicator_keys: Dict[Tuple[str, ...], int]) -> Optional[Tuple[List[str], Iterator[List]]]:
     """
-    Process a single CSV file to add geolocation data.
+    Transform adding the geolocation data of each row, one row at a time.
+
+    The geolocation and indicator metadata columns are encoded into `geo_keys` and `indicator_keys`, and each row
+    only keeps their integer keys ('id_geo', 'id_indicator').
 
     Args:
-        file_path (str): Path to the CSV file.
-        dicofre_dict (Dict[str, Dict[str, str]]): Dictionary containing dicofre data.
-        zipcode_dict (Dict[str, Dict[str, str]]): Dictionary containing zipcode data.
-        nuts_dict (Dict[str, Dict[str, Dict[str, Union[Dict[str, str], List[str]]]]]): Dictionary containing NUTS data.
+        headers (List[str]): Headers of the data file.
+        rows (Iterable[List[str]]): Rows of the data file.
+        dicofre_index (Mapping[str, Tuple[str, str, str]]): Prefix index of the dicofre codes (gazetteer 'dicofre_prefix' table).
+        zipcode_index (Mapping[str, Tuple[str, str, str]]): Prefix index of the zip codes (gazetteer 'zipcode_prefix' table).
+        nuts_index (Mapping[str, Tuple[str, str, str]]): NUTS regions of each municipality (gazetteer 'nuts_concelho' table).
+        indicator_cols (List[str]): Metadata columns merged into the data files, which describe the indicator.
+        geo_keys (Dict[Tuple[str, ...], int]): Geography dimension values encoded so far.
+        indicator_keys (Dict[Tuple[str, ...], int]): Indicator dimension values encoded so far.
+
+    Returns:
+        Optional[Tuple[List[str], Iterator[List]]]: New headers and an iterator over the new rows,
+                                                    or None if the file has no dicofre or zip code column.
     """
-    print(f"Processing file: {file_path}")
-    
-    with open(file_path, 'r', encoding='utf-8') as csv_file:
-        reader = csv.reader(csv_file, delimiter=';')
-        headers = next(reader)
-        headers = [header.lstrip('\ufeff') for header in headers]
-        headers.extend(['distrito', 'concelho', 'freguesia', 'nuts1', 'nuts2', 'nuts3','dicofre', 'zipcode'])
+    headers = [header.lstrip('\ufeff') for header in headers]
 
-        zip_col_idx = next((i for i, h in enumerate(headers) if h in ['Zip Code', 'ZipCode']), None)
-        dicofre_col_idx = next((i for i, h in enumerate(headers) if h in ['DistrictMunicipalityParishCode', 'CodDistritoConcelhoFreguesia', 'DistrictMunicipalityCode', 'MinicipalityCode', 'CodConcelho', 'CODIGO_CONCELHO']), None)
+    zip_col_idx = next((i for i, h in enumerate(headers) if h in ['Zip Code', 'ZipCode']), None)
+    dicofre_col_idx = next((i for i, h in enumerate(headers) if h in ['DistrictMunicipalityParishCode', 'CodDistritoConcelhoFreguesia', 'DistrictMunicipalityCode', 'MinicipalityCode', 'CodConcelho', 'CODIGO_CONCELHO']), None)
 
-        if zip_col_idx is None and dicofre_col_idx is None:
-            print(f"No se encontró la columna de dicofre ni zip code en el archivo: {file_path}")
-            return
+    if zip_col_idx is None and dicofre_col_idx is None:
+        return None
 
-        new_rows = []
-        for row in reader:
+    # Split the headers between the indicator metadata (dimension) and the per-row data (facts)
+    indicator_idx = [i for i, h in enumerate(headers) if h in indicator_cols]
+    fact_idx = [i for i in range(len(headers)) if i not in indicator_idx]
+
+    def geodata_rows() -> Iterator[List]:
+        for row in rows:
             distrito, concelho, freguesia = 'undefined', 'undefined', 'undefined'
             nuts1, nuts2, nuts3 = 'undefined', 'undefined', 'undefined'
             dicofre = 'undefined'
@@ -325,67 +274,152 @@ def process_file2(file_path: str, dicofre_dict: Dict[str, Dict[str, str]], zipco
             if zip_col_idx is not None:
                 zipcode = re.sub(r'[^0-9]', '', row[zip_col_idx])
                 if zipcode:
-                    distrito, concelho, freguesia = get_location_data_zipcode(zipcode, zipcode_dict)
+                    distrito, concelho, freguesia = get_location_data_zipcode(zipcode, zipcode_index)
                     if concelho != 'undefined':
                         area = concelho
-                        nuts1, nuts2, nuts3 = get_nuts_data(area, nuts_dict)
+                        nuts1, nuts2, nuts3 = get_nuts_data(area, nuts_index)
 
             elif dicofre_col_idx is not None:
                 dicofre = re.sub(r'[^0-9]', '', row[dicofre_col_idx])
                 if dicofre:
-                    distrito, concelho, freguesia = get_location_data_dicofre(dicofre, dicofre_dict)
+                    distrito, concelho, freguesia = get_location_data_dicofre(dicofre, dicofre_index)
                     if concelho != 'undefined':
                         area = concelho
-                        nuts1, nuts2, nuts3 = get_nuts_data(area, nuts_dict)
+                        nuts1, nuts2, nuts3 = get_nuts_data(area, nuts_index)
+
+            id_geo = pf.encode(geo_keys, (distrito, concelho, freguesia, nuts1, nuts2, nuts3, dicofre, zipcode))
+            id_indicator = pf.encode(indicator_keys, tuple(row[i] for i in indicator_idx))
+            yield [row[i] for i in fact_idx] + [id_geo, id_indicator]
 
-            row.extend([distrito, concelho, freguesia, nuts1, nuts2, nuts3, dicofre, zipcode])
-            new_rows.append(row)
+    new_headers = [headers[i] for i in fact_idx] + [pf.dimension_key_columns['geo'], pf.dimension_key_columns['indicator']]
+    return new_headers, geodata_rows()
 
-    # Save final processed file
-    final_file_path = os.path.join(os.path.dirname(file_path), f'final_{os.path.basename(file_path)}')
-    with open(final_file_path, 'w', encoding='utf-8', newline='') as csv_file:
-        writer = csv.writer(csv_file, delimiter=';')
-        writer.writerow(headers)
-        writer.writerows(new_rows)
+def write_final_file(final_file_path: str, headers: List[str], rows: Iterable[List], indicator_headers: List[str], geo_keys: Dict[Tuple[str, ...], int], indicator_keys: Dict[Tuple[str, ...], int], storage_format: str) -> int:
+    """
+    Writes a final data file and, once all its rows have been encoded, its dimension dictionaries.
+
+    Args:
+        final_file_path (str): Path to the final data file.
+        headers (List[str]): Headers of the final data file.
+        rows (Iterable[List]): Rows of the final data file.
+        indicator_headers (List[str]): Names of the indicator dimension columns.
+        geo_keys (Dict[Tuple[str, ...], int]): Geography dimension values.
+        indicator_keys (Dict[Tuple[str, ...], int]): Indicator dimension values.
+        storage_format (str): Storage format of the final file ('csv', 'arrow' or 'parquet').
+
+    Returns:
+        int: Number of rows written.
+    """
+    written_rows = pf.write_table(final_file_path, headers, rows, storage_format)
+    pf.write_dims(final_file_path, {
+        'geo': (geo_cols, geo_keys),
+        'indicator': (indicator_headers, indicator_keys)
+    })
+    return written_rows
+
+def process_raw_file(filename: str, raw_data: str, final_data_path: str, metadata_headers: List[str], metadata_dict: Dict[str, List[str]], dicofre_index: Mapping[str, Tuple[str, str, str]], zipcode_index: Mapping[str, Tuple[str, str, str]], nuts_index: Mapping[str, Tuple[str, str, str]], storage_format: str = 'csv', unchanged: AbstractSet[str] = frozenset()) -> None:
+    """
+    Builds the final data file of a raw data file in a single streaming pass.
+
+    Each row is read once, goes through the metadata join (`join_metadata`), the timecode (`add_timecode_column`)
+    and the geolocation (`add_geodata_columns`) transforms, and is written once, without temporary files.
+
+    Args:
+        filename (str): Name of the raw data file.
+        raw_data (str): Path to the raw data files folder.
+        final_data_path (str): Path to the folder where the final files will be saved.
+        metadata_headers (List[str]): List of headers extracted from the metadata file.
+        metadata_dict (Dict[str, List[str]]): Dictionary containing metadata values for each src_code (key value).
+        dicofre_index (Mapping[str, Tuple[str, str, str]]): Prefix index of the dicofre codes (gazetteer 'dicofre_prefix' table).
+        zipcode_index (Mapping[str, Tuple[str, str, str]]): Prefix index of the zip codes (gazetteer 'zipcode_prefix' table).
+        nuts_index (Mapping[str, Tuple[str, str, str]]): NUTS regions of each municipality (gazetteer 'nuts_concelho' table).
+        storage_format (str): Storage format of the final files ('csv', 'arrow' or 'parquet').
+        unchanged (AbstractSet[str]): Source codes of the raw files unchanged since the previous extraction, which are skipped
+                                      if their final file exists.
+    """
+    src_code = filename.replace('.csv', '') # The source code for each raw file is extracted from the filename
+    if src_code not in metadata_dict:
+        return
+
+    final_file_path = pf.data_file_path(os.path.join(final_data_path, f'final_{os.path.splitext(filename)[0]}'), storage_format)
+    if src_code in unchanged and os.path.exists(final_file_path):
+        print(f"File unchanged since the previous extraction: {filename}. Skipping...")
+        return
+
+    file_path = os.path.join(raw_data, filename)
+    print(f"Processing file: {file_path}")
+    started = time.perf_counter()
+    geo_keys, indicator_keys = {}, {}
+
+    headers, raw_rows = pf.read_table(file_path)
+    try:
+        headers, rows = merge.join_metadata(headers, raw_rows, metadata_headers, metadata_dict[src_code])
+        headers, rows = add_timecode_column(headers, rows)
+        geodata = add_geodata_columns(headers, rows, dicofre_index, zipcode_index, nuts_index, metadata_headers, geo_keys, indicator_keys)
+        if geodata is None:
+            print(f"No se encontró la columna de dicofre ni zip code en el archivo: {file_path}")
+            return
+        new_headers, new_rows = geodata
+
+        indicator_headers = [h for h in headers if h in metadata_headers]
+        written_rows = write_final_file(final_file_path, new_headers, new_rows, indicator_headers, geo_keys, indicator_keys, storage_format)
+    finally:
+        raw_rows.close() # The generators built on the rows do not close the raw file when they are left unconsumed
 
     print(f"Final file processed and saved in: {final_file_path}")
-    os.remove(file_path)  # Delete original file
-    print(f"Original file deleted: {file_path}")
+    pf.report_throughput("E-REDES processing", written_rows, started, final_file_path)
 
-def add_geodata(final_data_path: str, dicofre_dict: Dict[str, Dict[str, str]], zipcode_dict: Dict[str, Dict[str, str]], nuts_dict: Dict[str, Dict[str, Dict[str, Union[Dict[str, str], List[str]]]]], max_workers: int = 4) -> None:
+def process_raw_files(raw_data: str, final_data_path: str, metadata_headers: List[str], metadata_dict: Dict[str, List[str]], dicofre_index: Mapping[str, Tuple[str, str, str]], zipcode_index: Mapping[str, Tuple[str, str, str]], nuts_index: Mapping[str, Tuple[str, str, str]], storage_format: str = 'csv', max_workers: int = 4, unchanged: AbstractSet[str] = frozenset()) -> None:
     """
-    Add geolocation data to CSV files by retrieving relevant information using dicofre and zipcode data.
+    Builds the final data files of all the raw data files, processing several files at a time.
 
     Args:
-        final_data_path (str): Path to the folder containing CSV files to process.
-        dicofre_dict (Dict[str, Dict[str, str]]): Dictionary containing dicofre data.
-        zipcode_dict (Dict[str, Dict[str, str]]): Dictionary containing zipcode data.
-        nuts_dict (Dict[str, Dict[str, Dict[str, Union[Dict[str, str], List[str]]]]]): Dictionary containing NUTS data.
+        raw_data (str): Path to the raw data files folder.
+        final_data_path (str): Path to the folder where the final files will be saved.
+        metadata_headers (List[str]): List of headers extracted from the metadata file.
+        metadata_dict (Dict[str, List[str]]): Dictionary containing metadata values for each src_code (key value).
+        dicofre_index (Mapping[str, Tuple[str, str, str]]): Prefix index of the dicofre codes (gazetteer 'dicofre_prefix' table).
+        zipcode_index (Mapping[str, Tuple[str, str, str]]): Prefix index of the zip codes (gazetteer 'zipcode_prefix' table).
+        nuts_index (Mapping[str, Tuple[str, str, str]]): NUTS regions of each municipality (gazetteer 'nuts_concelho' table).
+        storage_format (str): Storage format of the final files ('csv', 'arrow' or 'parquet').
         max_workers (int): Maximum number of threads to use for processing.
+        unchanged (AbstractSet[str]): Source codes of the raw files unchanged since the previous extraction (see `process_raw_file`).
     """
+    os.makedirs(final_data_path, exist_ok=True)
+    raw_files = [f for f in os.listdir(raw_data) if f.endswith(".csv")]
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        csv_files = [os.path.join(final_data_path, f) for f in os.listdir(final_data_path) if f.endswith(".csv")]
-        for file_path in csv_files:
-            executor.submit(process_file2, file_path, dicofre_dict, zipcode_dict, nuts_dict)
-
+        futures = [executor.submit(process_raw_file, filename, raw_data, final_data_path, metadata_headers, metadata_dict,
+                                   dicofre_index, zipcode_index, nuts_index, storage_format, unchanged)
+                   for filename in raw_files]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error processing file: {e}")
 
 
 def main() -> None:
     """
-    Main function to process append time and geolocation data in order to obtain the final eredes data files.
+    Main function to join metadata, time and geolocation data in order to obtain the final eredes data files.
 
     This function performs the following tasks:
-    1. Adds time codes to temporary merged files by calling `add_timecode`.
-    2. Loads the Dicofre data into a dictionary by calling `load_dicofre_data`.
-    3. Loads the Zip Code data into a dictionary by calling `load_zipcode_data`.
-    4. Loads the NUTS (Nomenclature of Territorial Units for Statistics) data into a dictionary by calling `load_nuts_data`.
-    5. Adds geographic data to the final dataset by calling `add_geodata` using the previous dictionaries as parameters.
+    1. Loads the metadata headers and rows by calling `load_metadata` from `eredes_merge_files`.
+    2. Opens the gazetteer (`geo_index.open_gazetteer`), with the Dicofre and Zip Code prefix indexes and the
+       NUTS (Nomenclature of Territorial Units for Statistics) regions of each municipality.
+    3. Builds each final data file from its raw data file in a single pass by calling `process_raw_files`,
+       skipping the raw files unchanged since the previous extraction (see `http_cache.py`).
     """
-    add_timecode(merged_files_path=s.eredes_merged, final_data_path=s.eredes_final_data)
-    dicofre_dict = load_dicofre_data(dicofre_path=s.dicofre_data)
-    zipcode_dict = load_zipcode_data(zipcode_path=s.zipcode_data)
-    nuts_dict = load_nuts_data(nuts_path=s.nuts_data)
-    add_geodata(final_data_path=s.eredes_final_data, dicofre_dict=dicofre_dict, zipcode_dict=zipcode_dict, nuts_dict=nuts_dict)
+    metadata_headers, metadata_dict = merge.load_metadata(s.eredes_metadata)
+    gazetteer = gi.open_gazetteer(s.gazetteer, s.dicofre_data, s.zipcode_data, s.nuts_data)
+    dicofre_index = gazetteer['dicofre_prefix']
+    zipcode_index = gazetteer['zipcode_prefix']
+    nuts_index = gazetteer['nuts_concelho']
+    try:
+        process_raw_files(raw_data=s.eredes_raw_data, final_data_path=s.eredes_final_data, metadata_headers=metadata_headers,
+                          metadata_dict=metadata_dict, dicofre_index=dicofre_index, zipcode_index=zipcode_index, nuts_index=nuts_index,
+                          storage_format=s.eredes_storage_format, unchanged=hc.load_unchanged(s.eredes_http_cache))
+    finally:
+        gi.close_gazetteer(gazetteer)
 
 if __name__=="__main__":
     main()
\ No newline at end of file
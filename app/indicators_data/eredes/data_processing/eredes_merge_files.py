@@ -1,4 +1,4 @@
-from typing import Tuple, List, Dict
+from typing import Tuple, List, Dict, Iterable, Iterator
 
 import csv
 import os
@@ -78,46 +78,28 @@ def load_metadata(metadata: str) -> Tuple[List[str], Dict[str, List[str]]]:
             metadata_dict[src_code] = row
     return metadata_headers, metadata_dict
 
-def combine_data_and_metadata(raw_data: str, metadata_headers: List[str], metadata_dict: Dict[str, List[str]], merged_files_path: str) -> None:
+def join_metadata(headers: List[str], rows: Iterable[List[str]], metadata_headers: List[str], metadata_row: List[str]) -> Tuple[List[str], Iterator[List[str]]]:
     """
-    Combine each raw data file row with the corresponding metadata based on their src_code value, and save them into a new folder.
+    Transform combining each raw data row with the metadata of its indicator, one row at a time.
 
     Args:
-    - raw_data (str): Path to the raw data files folder.
+    - headers (List[str]): Headers of the raw data file.
+    - rows (Iterable[List[str]]): Rows of the raw data file.
     - metadata_headers (List[str]): List of headers extracted from the metadata file.
-    - metadata_dict (Dict[str, List[str]]): Dictionary containing metadata values foe each src_code (key value).
-    - merged_files_path (str): New temporary folder containing the resulting merged files.
-    """
-    
-    os.makedirs(merged_files_path, exist_ok=True)
-    
-    for filename in os.listdir(raw_data):
-        if filename.endswith(".csv"):
-            src_code = filename.replace('.csv', '') # The source code for each raw file is extracted from the filename
-            if src_code in metadata_dict:
-                metadata_row = metadata_dict[src_code]
-                file_path = os.path.join(raw_data, filename)
-                with open(file_path, "r", encoding='utf-8') as data_file:
-                    reader = csv.reader(data_file, delimiter=';')
-                    headers = next(reader)
-                    combined_rows = [headers + metadata_headers]  # Create a new headers row by combining the raw one and the metadata headers
-                    for row in reader:
-                        combined_row = row + metadata_row # Combine the raw data values and the corresponding metadata based on the src_code
-                        combined_rows.append(combined_row) # Append each new combined row to the already existing list of rows that included the headers
-
-                output_file_path = os.path.join(merged_files_path, f"temp_merged_{filename}")
-                with open(output_file_path, "w", encoding='utf-8', newline='') as output_file:
-                    writer = csv.writer(output_file, delimiter=';')
-                    writer.writerows(combined_rows)
-                print(f"Combined data written to {output_file_path}")
+    - metadata_row (List[str]): Metadata values of the indicator (src_code) of the file.
 
+    Returns:
+    - Tuple[List[str], Iterator[List[str]]]: Combined headers and an iterator over the combined rows.
+    """
+    # Combine the raw data values and the corresponding metadata based on the src_code
+    return headers + metadata_headers, (row + metadata_row for row in rows)
 
 def main() -> None:
     """
-    Main entry point of the script. This function performs the following tasks:
-    1. Deletes specified CSV files from the raw data directory.
-    2. Loads metadata from a specified file.
-    3. Combines data from raw CSV files with the metadata and saves the results to a specified directory.
+    Main entry point of the script. Deletes specified CSV files from the raw data directory.
+
+    The metadata join (`join_metadata`) is not saved into temporary merged files: it is applied row by row by
+    `eredes_final_format`, in the same pass that adds the timecode and the geolocation data.
     """
     try:
         # Delete specified CSV files
@@ -125,16 +107,6 @@ def main() -> None:
         delete_csv_files(s.eredes_raw_data, files_to_delete=s.eredes_removed_files)
         print("Files deleted successfully.")
 
-        # Load metadata
-        print("Loading metadata...")
-        metadata_headers, metadata_dict = load_metadata(s.eredes_metadata)
-        print("Metadata loaded successfully.")
-
-        # Combine data and metadata
-        print("Combining data with metadata...")
-        combine_data_and_metadata(s.eredes_raw_data, metadata_headers, metadata_dict, merged_files_path=s.eredes_merged)
-        print("Data combined and saved successfully.")
-
     except FileNotFoundError as e:
         print(f"Error: File not found - {e}", file=sys.stderr) # Catches exceptions caused by non-existing files
     except PermissionError as e:
@@ -11,13 +11,15 @@ def eredes_main() -> None:
     and formatting the final output. Any errors encountered during 
     execution are printed to the console.
     """
+    # The catalogue is listed once: the metadata step saves the metadata of the catalogue listed by the data step
+    indicators_metadata = None
     try:
-        eredes_data.main()
+        indicators_metadata = eredes_data.main()
     except Exception as e:
         print(f"Error in eredes_data.main(): {e}")
 
     try:
-        eredes_metadata.main()
+        eredes_metadata.main(indicators_metadata)
     except Exception as e:
         print(f"Error in eredes_metadata.main(): {e}")
 
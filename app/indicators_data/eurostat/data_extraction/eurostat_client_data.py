@@ -1,12 +1,17 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from eurostatapiclient import EurostatAPIClient
+from tqdm import tqdm
 
 import csv
 import json
 import sys
 import os
+import threading
+import time
 
 import logging
 import requests
+from typing import Any, Dict, Iterable, List, Optional
 
 
 # Logging configuration
@@ -41,50 +46,231 @@ As the root of the project is now in the 'sys.path', it is possible to import th
 
 # Import settings
 import app.utils.settings as s
+import app.utils.http_utils as hu
+import app.utils.http_cache as hc
 
-def download_toc(url: str, save_path: str) -> None:
+def download_toc(url: str, save_path: str, cache: Optional[hc.HttpCache] = None) -> None:
     """
     Download the TOC (Table of Contents) for the Eurostat database through a given URL and save it to a specified directory.
 
     Args:
     - url (str): The URL to download the file from.
     - save_path (str): The file path where the downloaded TOC will be saved.
+    - cache (Optional[HttpCache]): HTTP cache of the Eurostat extraction. If the TOC was already downloaded, it is requested
+      with its validators and it is not downloaded again if it has not changed.
 
     Returns:
     - None
     """
+    filename = "table_of_contents_en.txt"
+    file_path = os.path.join(save_path, filename)
     try:
-        # Send a HTTP GET request to the URL
-        response = requests.get(url)
-        # Raise an error if the request was unsuccessful
-        response.raise_for_status()
-
         os.makedirs(save_path, exist_ok=True)
 
-        filename = "table_of_contents_en.txt"
-        
-        # Write the content of the response to a file
-        with open(os.path.join(save_path, filename), 'wb') as file:
+        # Send a HTTP GET request to the URL and stream the content of the response to the file
+        with hu.create_session(max_connections=1) as session:
             print("Correct saving path. Download in progress...")
-            file.write(response.content)
+            if hu.download_file(session, url, file_path, cache):
+                print(f"The TOC has not changed since the previous download: {file_path}")
+                return
         
         print(f"File downloaded successfully and saved to {save_path}")
     except requests.exceptions.RequestException as e:
         print(f"An error occurred while downloading the file: {e}")
 
 
-def get_eurostat_data(data_save_path: str, labels_save_path: str, eurostat_toc_txt: str, labels_file: str) -> None:
+def load_labels(labels_file: str) -> Dict[str, str]:
+    """
+    Load the dataset labels saved by a previous extraction.
+
+    Args:
+    - labels_file (str): Path to the CSV file with the dataset codes and labels.
+
+    Returns:
+    - Dict[str, str]: Label of each dataset code (empty if the file does not exist).
+    """
+    if not os.path.exists(labels_file):
+        return {}
+    with open(labels_file, 'r', encoding='utf-8', newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader, None)  # Skip the headers
+        return {row[0]: row[1] for row in reader if len(row) > 1}
+
+
+def load_journal(journal_file: str) -> Dict[str, str]:
+    """
+    Load the progress journal of an interrupted extraction.
+
+    Args:
+    - journal_file (str): Path to the CSV journal file.
+
+    Returns:
+    - Dict[str, str]: Status of each dataset processed by the interrupted extraction ('saved', 'unchanged' or 'failed'),
+      empty if the previous extraction was completed.
+    """
+    if not os.path.exists(journal_file):
+        return {}
+    with open(journal_file, 'r', encoding='utf-8', newline='') as csvfile:
+        return {row[0]: row[1] for row in csv.reader(csvfile) if len(row) > 1}
+
+
+def is_dataset(row: List[str]) -> bool:
+    """
+    Check if a row of the TOC is a dataset, from its type: the folders (and the headers row) have no data to fetch.
+
+    Args:
+    - row (List[str]): Row of the TOC (title, code, type, last update of data...).
+
+    Returns:
+    - bool: True if the row is a dataset or a table.
+    """
+    return len(row) > 2 and row[2].strip('"').strip().lower() in ('dataset', 'table')
+
+
+def load_empty_datasets(empty_cache_file: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Load the negative cache of the datasets without data for Portugal.
+
+    Args:
+    - empty_cache_file (str): Path to the JSON file of the negative cache.
+
+    Returns:
+    - Dict[str, Dict[str, Any]]: For each dataset code, when it was found empty ('checked', seconds since the epoch)
+      and its date of last update in the TOC at that time ('last_update').
+    """
+    if not os.path.exists(empty_cache_file):
+        return {}
+    try:
+        with open(empty_cache_file, 'r', encoding='utf-8') as cache_file:
+            return json.load(cache_file)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Could not read the empty datasets cache {empty_cache_file}, every dataset will be fetched: {e}")
+        return {}
+
+
+def save_empty_datasets(empty_cache_file: str, empty_datasets: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Save the negative cache of the datasets without data for Portugal (under a temporary name, renamed when completed).
+
+    Args:
+    - empty_cache_file (str): Path to the JSON file of the negative cache.
+    - empty_datasets (Dict[str, Dict[str, Any]]): Negative cache entries (see `load_empty_datasets`).
+    """
+    os.makedirs(os.path.dirname(empty_cache_file) or '.', exist_ok=True)
+    temp_path = f"{empty_cache_file}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as cache_file:
+        json.dump(empty_datasets, cache_file, indent=4, ensure_ascii=False)
+    os.replace(temp_path, empty_cache_file)
+
+
+def is_known_empty(entry: Optional[Dict[str, Any]], last_update: str, ttl_days: float) -> bool:
+    """
+    Check if a dataset is known to have no data for Portugal: it was found empty within the TTL, and it has not been
+    updated in the TOC since then.
+
+    Args:
+    - entry (Optional[Dict[str, Any]]): Negative cache entry of the dataset, if any.
+    - last_update (str): Date of the last update of the dataset in the TOC.
+    - ttl_days (float): Days during which an empty dataset is not fetched again.
+
+    Returns:
+    - bool: True if the dataset does not have to be fetched.
+    """
+    return (entry is not None and entry.get('last_update') == last_update
+            and time.time() - entry.get('checked', 0) < ttl_days * 86400)
+
+
+def fetch_dataset(client: EurostatAPIClient, code: str, params: Dict[str, str], path: str, limiter: Optional[hu.TokenBucket] = None) -> Optional[str]:
+    """
+    Fetch a dataset with the Eurostat API client and save it as a Parquet file.
+
+    Args:
+    - client (EurostatAPIClient): API client of the thread.
+    - code (str): Code of the dataset.
+    - params (Dict[str, str]): Query parameters (filter for Portugal).
+    - path (str): Path where the Parquet file is saved.
+    - limiter (Optional[TokenBucket]): Rate limiter of the Eurostat API requests.
+
+    Returns:
+    - Optional[str]: Label of the dataset, or None if the dataset has no data for Portugal (nothing is saved, and the file saved
+      by a previous extraction is removed).
+    """
+    if limiter is not None:
+        limiter.acquire()
+    try:
+        # Get data from the server for the code + query parameters specified
+        filtered_dataset = client.get_dataset(code, params=params)
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404: # No results for the query parameters
+            remove_dataset_file(path)
+            return None
+        raise
+    # Convert the dataset into a pandas dataframe
+    filtered_dataframe = filtered_dataset.to_dataframe()
+    if filtered_dataframe.empty:
+        remove_dataset_file(path)
+        return None
+    # Save the dataframe as it is (typed columns) under a temporary name, renamed when completed
+    temp_path = f"{path}.tmp"
+    filtered_dataframe.to_parquet(temp_path, index=False)
+    os.replace(temp_path, path)
+    # The JSON file saved by previous versions is replaced by the Parquet file
+    legacy_path = f"{os.path.splitext(path)[0]}.json"
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+    return filtered_dataset.label
+
+
+def remove_dataset_file(path: str) -> None:
+    """
+    Remove the file of a dataset saved by a previous extraction (and its legacy JSON file), so that a dataset without data is not
+    processed again from stale data.
+
+    Args:
+    - path (str): Path of the Parquet file of the dataset.
+    """
+    for file_path in (path, f"{os.path.splitext(path)[0]}.json"):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def get_eurostat_data(data_save_path: str, labels_save_path: str, eurostat_toc_txt: str, labels_file: str, cache: Optional[hc.HttpCache] = None,
+                      journal_file: str = s.eurostat_fetch_journal, max_workers: int = s.eurostat_fetch_workers,
+                      requests_per_second: float = s.eurostat_requests_per_second, empty_cache_file: str = s.eurostat_empty_cache,
+                      empty_ttl_days: float = s.eurostat_empty_ttl_days) -> None:
     """
     Fetch and save Eurostat data for specified codes using EurostatAPIClient.
 
-    The data is filtered based on predefined parameters (for Portugal) and saved as JSON files. 
+    The data is filtered based on predefined parameters (for Portugal) and saved as Parquet files, straight from the
+    pandas DataFrame (typed columns, compressed), which the processing reads back without decoding any JSON.
     Additionally, a CSV file with the dataset codes and labels is created.
 
+        - The datasets of the TOC are fetched by a pool of threads (one API client per thread), several at a time, and the
+          rate of requests sent to the Eurostat API by all the threads is limited by a token bucket.
+        - The label of each dataset is written to the CSV file as soon as the dataset is saved, instead of keeping them all until the end.
+        - The status of each dataset is written to a progress journal too. If the extraction is interrupted, the next one
+          resumes it: the datasets already saved are not fetched again, and the CSV file is completed. The journal is removed
+          when the extraction is completed.
+
+    The Eurostat API client does not send conditional requests, so the validator of each dataset is the date of its last
+    update in the TOC: the datasets already saved whose date has not changed since they were fetched are not fetched again.
+
+    Most rows of the TOC have no data to fetch for Portugal, so they are filtered before any request:
+        - The folders of the TOC are skipped (`is_dataset`).
+        - The datasets found without data for Portugal are saved in a negative cache, and they are not fetched again until
+          the TTL expires or their date of last update in the TOC changes (`is_known_empty`).
+
     Args:
-    - data_save_path (str): The directory where the JSON files with the datasets will be saved.
+    - data_save_path (str): The directory where the Parquet files with the datasets will be saved.
     - labels_save_path (str): The directory where the CSV file with the dataset labels will be saved.
     - eurostat_toc_txt (str): Path to the file containing the Eurostat Table of Contents (TOC) with the codes.
     - labels_file (str): Path where the CSV file with the dataset codes and labels will be saved.
+    - cache (Optional[HttpCache]): HTTP cache of the Eurostat extraction, where the date of the last update of each dataset is saved.
+    - journal_file (str): Path to the progress journal of the extraction.
+    - max_workers (int): Maximum number of datasets fetched at a time.
+    - requests_per_second (float): Maximum rate of requests sent to the Eurostat API.
+    - empty_cache_file (str): Path to the negative cache of the datasets without data for Portugal.
+    - empty_ttl_days (float): Days during which a dataset without data for Portugal is not fetched again.
 
     Returns:
     - None
@@ -96,71 +282,141 @@ def get_eurostat_data(data_save_path: str, labels_save_path: str, eurostat_toc_t
     # Specify language: 'en', 'fr', 'de'
     language = 'en'
 
-    client = EurostatAPIClient(version, data_format, language)
+    # The API client is not shared between threads: each thread creates its own client
+    clients = threading.local()
+
+    def thread_client() -> EurostatAPIClient:
+        if not hasattr(clients, 'client'):
+            clients.client = EurostatAPIClient(version, data_format, language)
+        return clients.client
+
+    def fetch(code: str, path: str) -> str:
+        return fetch_dataset(thread_client(), code, params, path, limiter)
 
     # Required query parameters (Filter only for Portugal data)
     params = {
         'geo': 'PT',
     }
+    limiter = hu.TokenBucket(requests_per_second)
     
     # Ensure the directory where data will be saved exists
     os.makedirs(data_save_path, exist_ok=True)
     # Ensure the directory where data will be saved exists
     os.makedirs(labels_save_path, exist_ok=True)
 
-    # Initialize a list to store code and label information
-    code_label_list = []
-
-    # Read the Eurostat indicators Table of contents (TOC) file
-    with open(eurostat_toc_txt, 'r', encoding='utf-8') as codes_file:
-        reader = csv.reader(codes_file, delimiter='\t', quotechar='"', quoting=csv.QUOTE_NONE)
-        for row in reader:
-            code = row[1].strip('"')  # Extract the code for the indicator in each row
-            print(code)
-            path = os.path.join(data_save_path, f"{code}.json")  # Define a code adjustable path to save the JSON datasets
-            print(path)
-            try:
-                # Get data from the server for the code + query parameters specified
-                filtered_dataset = client.get_dataset(code, params=params)
-                # Get the label for the dataset
-                label = filtered_dataset.label
-                print(label)
-                # Append the code and label to the list
-                code_label_list.append((code, label))
-                # Convert the dataset into a pandas dataframe
-                filtered_dataframe = filtered_dataset.to_dataframe()
-                # Convert the dataframe into JSON. orient='records': each row from the df is converted into a dict. The result is a list of dictionaries. 
-                filtered_dataframe_json = filtered_dataframe.to_json(orient='records')
-                print("DataFrame converted to JSON.")
-                # Create/open the code adjustable path in 'write' mode
-                with open(path, 'w', encoding='utf-8') as dataset:
-                    json.dump(filtered_dataframe_json, dataset, indent=4, ensure_ascii=False)  # Dump the JSON data into the file
-                    print(f"Data for {code} saved.")
-
-            except requests.exceptions.RequestException as e:
-                print(f"An exception occurred for code {code}: {e}")
-                continue
-
-    # Write the code and label information to a CSV file
-    with open(labels_file, 'w', encoding='utf-8', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['Code', 'Label'])
-        writer.writerows(code_label_list)
+    # Labels of the datasets which are not fetched again
+    previous_labels = load_labels(labels_file)
+    # Datasets already processed by an interrupted extraction
+    journal = load_journal(journal_file) if os.path.exists(labels_file) else {}
+    if journal:
+        print(f"Resuming the interrupted extraction: {sum(status != 'failed' for status in journal.values())} datasets already processed.")
+    # Datasets without data for Portugal found by the previous extractions
+    empty_datasets = load_empty_datasets(empty_cache_file)
+
+    counts = {'saved': 0, 'unchanged': 0, 'empty': 0, 'failed': 0, 'resumed': 0, 'folders': 0, 'known_empty': 0}
+    with open(labels_file, 'a' if journal else 'w', encoding='utf-8', newline='') as labels_csv, \
+         open(journal_file, 'a' if journal else 'w', encoding='utf-8', newline='') as journal_csv:
+        labels_writer = csv.writer(labels_csv)
+        journal_writer = csv.writer(journal_csv)
+        if not journal:
+            labels_writer.writerow(['Code', 'Label'])
+
+        def record(code: str, label: Optional[str], status: str) -> None:
+            # The label is written before the status, so a dataset is only skipped by a resumed extraction if its label was saved
+            if label is not None:
+                labels_writer.writerow([code, label])
+                labels_csv.flush()
+            journal_writer.writerow([code, status])
+            journal_csv.flush()
+            counts[status] += 1
+
+        def check_results(done: Iterable[Future]) -> None:
+            for future in done:
+                code, validators = pending.pop(future)
+                try:
+                    label = future.result()
+                except Exception as e:
+                    # A failed dataset (request, malformed payload, conversion or write error) does not stop the extraction
+                    logging.error(f"An exception occurred for code {code}: {e!r}")
+                    record(code, None, 'failed')
+                    continue
+                if label is None:
+                    empty_datasets[code] = {'checked': time.time(), 'last_update': validators['Last-Modified']}
+                    record(code, None, 'empty')
+                    continue
+                empty_datasets.pop(code, None)
+                record(code, label, 'saved')
+                if cache is not None:
+                    cache.store(code, validators)
+
+        pending = {}
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            # Read the Eurostat indicators Table of contents (TOC) file
+            with open(eurostat_toc_txt, 'r', encoding='utf-8') as codes_file:
+                reader = csv.reader(codes_file, delimiter='\t', quotechar='"', quoting=csv.QUOTE_NONE)
+                for row in tqdm(reader, desc="Fetching Eurostat datasets"):
+                    if not is_dataset(row):
+                        counts['folders'] += 1
+                        continue
+                    code = row[1].strip('"')  # Extract the code for the indicator in each row
+                    path = os.path.join(data_save_path, f"{code}.parquet")  # Define a code adjustable path to save the datasets
+                    if journal.get(code) in ('saved', 'unchanged', 'empty'):
+                        if journal[code] == 'unchanged' and cache is not None:
+                            cache.mark_unchanged(code)
+                        counts['resumed'] += 1
+                        continue
+                    # Date of the last update of the dataset ('last update of data' column of the TOC)
+                    validators = {'Last-Modified': row[3].strip('"') if len(row) > 3 else ''}
+                    if is_known_empty(empty_datasets.get(code), validators['Last-Modified'], empty_ttl_days):
+                        counts['known_empty'] += 1
+                        continue
+                    if cache is not None and validators['Last-Modified'] and os.path.exists(path) and cache.matches(code, validators):
+                        cache.mark_unchanged(code)
+                        record(code, previous_labels.get(code, row[0].strip('"')), 'unchanged')
+                        continue
+                    if len(pending) >= 2 * max_workers: # Wait for a thread before reading more datasets from the TOC
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        check_results(done)
+                    pending[executor.submit(fetch, code, path)] = (code, validators)
+            check_results(list(wait(pending).done))
+        except BaseException:
+            # Interrupted (KeyboardInterrupt, or an error reading the TOC): the datasets not started yet are cancelled,
+            # and the journal is kept to resume the extraction
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        finally:
+            save_empty_datasets(empty_cache_file, empty_datasets)
+        executor.shutdown()
+
+    # Completed: the next extraction starts from the beginning
+    os.remove(journal_file)
+    print(f"Eurostat datasets: {counts['saved']} saved, {counts['unchanged']} unchanged, {counts['empty']} without data for Portugal, "
+          f"{counts['failed']} failed, {counts['resumed']} processed by the interrupted extraction")
+    print(f"Skipped before fetching: {counts['folders']} folders, {counts['known_empty']} datasets known to have no data for Portugal")
 
 def main() -> None:
     """
     Main function to download the TOC and fetch Eurostat data.
     """
+    # Validators of the TOC and the datasets saved by the previous extraction
+    cache = hc.HttpCache(s.eurostat_http_cache)
+
     # Download the Eurostat TOC file
-    download_toc(url=s.eurostat_toc_url_txt, save_path=s.eurostat_toc_folder)
+    download_toc(url=s.eurostat_toc_url_txt, save_path=s.eurostat_toc_folder, cache=cache)
     
     # Fetch and save the Eurostat data
-    get_eurostat_data(
-        data_save_path=s.eurostat_raw_data,
-        labels_save_path=s.eurostat_comp_files,
-        eurostat_toc_txt=s.eurostat_toc_txt,
-        labels_file=s.eurostat_dataset_def
-    )
+    try:
+        get_eurostat_data(
+            data_save_path=s.eurostat_raw_data,
+            labels_save_path=s.eurostat_comp_files,
+            eurostat_toc_txt=s.eurostat_toc_txt,
+            labels_file=s.eurostat_dataset_def,
+            cache=cache
+        )
+    finally:
+        # The datasets which have not changed are skipped by the processing scripts
+        cache.save()
 
 # Call main() within the if statement
 if __name__ == "__main__":
@@ -1,12 +1,14 @@
 import os
 import re
-import time
 import requests
+import shutil
+import threading
 import zipfile
 import csv
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
 from urllib.parse import urljoin
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer, Tag
 
 import logging
 import sys
@@ -42,6 +44,18 @@ As the root of the project is now in the 'sys.path', it is possible to import th
 """
 
 import app.utils.settings as s
+import app.utils.http_utils as hu
+import app.utils.http_cache as hc
+
+# Parser of the metadata pages: lxml (faster) if it is installed, the Python parser otherwise
+try:
+    import lxml  # noqa: F401
+    html_parser = "lxml"
+except ImportError:
+    html_parser = "html.parser"
+
+# Link found instead of the metadata file when the file has to be downloaded manually
+adobe_reader_link = "http://www.adobe.com/products/acrobat/readstep.html"
 
 def read_metadata_links_from_csv(csv_file: str) -> List[str]:
     """
@@ -77,103 +91,126 @@ def any_country_condition(link: str, eurostat_country_codes) -> bool:
     """
     return any(f"{code}.htm" in link.lower() for code in eurostat_country_codes)
 
-def process_metadata_links(links: List[str], headers: Dict[str, str]) -> List[Dict[str, str]]:
+def fetch_page(url: str, headers: Dict[str, str], session: requests.Session, limiter: hu.HostRateLimiter, cache: Optional[hc.ResponseCache] = None) -> Tuple[str, BeautifulSoup]:
+    """
+    Get a metadata page from the response cache, or request it (waiting for the rate limiter of its host) and save it in the cache.
+
+    Only the links of the page are parsed ('SoupStrainer'), with the fastest parser available (`html_parser`).
+
+    Args:
+        url (str): The URL of the page.
+        headers (Dict[str, str]): Headers to use for the HTTP requests.
+        session (requests.Session): Session shared by the crawler threads.
+        limiter (HostRateLimiter): Rate limiter of each host.
+        cache (Optional[ResponseCache]): Response cache of the metadata pages.
+
+    Returns:
+        Tuple[str, BeautifulSoup]: Final URL of the page (after redirects) and its links.
+
+    Raises:
+        requests.exceptions.RequestException: If the request fails or the server does not answer '200 OK'.
+    """
+    page = cache.get(url) if cache is not None else None
+    if page is None:
+        response = hu.get(session, url, limiter.for_url(url), headers=headers)
+        if response.status_code != 200:
+            raise requests.exceptions.HTTPError(f"Error in webpage request: {response.status_code}", response=response)
+        page = response.url, response.content
+        if cache is not None:
+            cache.put(url, *page)
+    final_url, content = page
+    return final_url, BeautifulSoup(content, html_parser, parse_only=SoupStrainer("a"))
+
+def download_link_entry(metadata_link: str, url: str, download_link: Tag) -> Tuple[str, Dict[str, str]]:
+    """
+    Build the entry of a metadata link with the 'Download' link found for it.
+
+    Args:
+        metadata_link (str): The metadata link.
+        url (str): URL the 'Download' link is relative to.
+        download_link (Tag): The 'Download' link element.
+
+    Returns:
+        Tuple[str, Dict[str, str]]: 'manual' and the page to download the file manually from, if the link points to
+                                    the Adobe Reader page, or 'download' and the complete download link.
+    """
+    complete_download_link = urljoin(url, download_link["href"])
+    print(f"Download link added: {download_link['href']}")
+    if complete_download_link == adobe_reader_link:
+        return "manual", {"htm_link": metadata_link, "download_link": f"Manually download from {metadata_link}"}
+    return "download", {"htm_link": metadata_link, "download_link": complete_download_link}
+
+def process_metadata_link(metadata_link: str, headers: Dict[str, str], session: requests.Session, limiter: hu.HostRateLimiter,
+                          cache: Optional[hc.ResponseCache] = None) -> Optional[Tuple[str, Dict[str, str]]]:
+    """
+    Process a metadata link to extract its download link.
+
+    The metadata page of a country has the 'Download' link. Otherwise, the 'Download' link of the Portugal page linked
+    from the metadata page is used, or the 'Download' link of the metadata page if there is none.
+
+    Args:
+        metadata_link (str): The metadata link.
+        headers (Dict[str, str]): Headers to use for the HTTP requests.
+        session (requests.Session): Session shared by the crawler threads.
+        limiter (HostRateLimiter): Rate limiter of each host.
+        cache (Optional[ResponseCache]): Response cache of the metadata pages.
+
+    Returns:
+        Optional[Tuple[str, Dict[str, str]]]: The entry of the metadata link (see `download_link_entry`), or None if no
+                                              'Download' link is found.
+    """
+    try:
+        url, metadata_soup = fetch_page(metadata_link, headers, session, limiter, cache)
+    except requests.exceptions.RequestException as e:
+        print(f"HTTP request error for metadata page: {e}")
+        return None
+
+    if not any_country_condition(metadata_link, s.eurostat_country_codes):
+        for portugal_link in metadata_soup.find_all("a", string=re.compile(r"Portugal")):
+            portugal_href = urljoin(url, portugal_link.get('href'))
+            print(f"Processing Portugal link: {portugal_href}")
+            try:
+                _, portugal_soup = fetch_page(portugal_href, headers, session, limiter, cache)
+            except requests.exceptions.RequestException as e:
+                print(f"HTTP request error for Portugal page: {e}")
+                continue
+            download_link = portugal_soup.find("a", string=re.compile(r"Download\s*"))
+            if download_link:
+                return download_link_entry(metadata_link, url, download_link)
+            print(f"No 'Download' link found on Portugal page: {portugal_href}")
+
+    download_link = metadata_soup.find("a", string=re.compile(r"Download\s*"))
+    if download_link:
+        return download_link_entry(metadata_link, url, download_link)
+    print(f"No 'Download' link found on metadata page: {metadata_link}")
+    return None
+
+def process_metadata_links(links: List[str], headers: Dict[str, str], session: requests.Session, limiter: hu.HostRateLimiter,
+                           cache: Optional[hc.ResponseCache] = None, max_workers: int = s.eurostat_crawler_workers) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
     """
     Process the metadata links to extract the download links.
 
+    The metadata pages are crawled by several threads at a time, sharing a keep-alive session and a rate limiter per host
+    (instead of sleeping 1 second after each request). The pages are kept in the response cache, so the next runs read
+    them from disk.
+
     Args:
         links (List[str]): The list of metadata links.
         headers (Dict[str, str]): Headers to use for the HTTP requests.
+        session (requests.Session): Session shared by the crawler threads (see `http_utils.create_session`).
+        limiter (HostRateLimiter): Rate limiter of each host.
+        cache (Optional[ResponseCache]): Response cache of the metadata pages.
+        max_workers (int): Maximum number of pages crawled at a time.
 
     Returns:
-        List[Dict[str, str]]: A list of dictionaries containing the links.
+        Tuple[List[Dict[str, str]], List[Dict[str, str]]]: The download links and the manual download links,
+                                                           in the order of the metadata links.
     """
-    download_links = []
-    manual_download_links = []
-
-    for metadata_link in links:
-        try:
-            response = requests.get(metadata_link, headers=headers)
-            time.sleep(1)  # Add a 1-second delay
-
-            if response.status_code == 200:
-                metadata_soup = BeautifulSoup(response.content, "html.parser")
-                url = response.url
-
-                if any_country_condition(metadata_link, s.eurostat_country_codes):
-                    download_link = metadata_soup.find("a", string=re.compile(r"Download\s*"))
-                    if download_link:
-                        complete_download_link = urljoin(url, download_link["href"])
-                        if complete_download_link == "http://www.adobe.com/products/acrobat/readstep.html":
-                            manual_download_links.append({
-                                "htm_link": metadata_link,
-                                "download_link": f"Manually download from {metadata_link}"
-                            })
-                        else:
-                            download_links.append({
-                                "htm_link": metadata_link,
-                                "download_link": complete_download_link
-                            })
-                            print(f"Download link added: {download_link['href']}")
-                    else:
-                        print(f"No 'Download' link found on metadata page: {metadata_link}")
-                else:
-                    portugal_links = metadata_soup.find_all("a", string=re.compile(r"Portugal"))
-                    portugal_download_found = False
-
-                    if portugal_links:
-                        for portugal_link in portugal_links:
-                            portugal_href = urljoin(url, portugal_link.get('href'))
-                            print(f"Processing Portugal link: {portugal_href}")
-                            try:
-                                portugal_response = requests.get(portugal_href, headers=headers)
-                                time.sleep(1)  # Add a 1-second delay
-                                if portugal_response.status_code == 200:
-                                    portugal_soup = BeautifulSoup(portugal_response.content, "html.parser")
-                                    download_link = portugal_soup.find("a", string=re.compile(r"Download\s*"))
-                                    if download_link:
-                                        complete_download_link = urljoin(url, download_link["href"])
-                                        if complete_download_link == "http://www.adobe.com/products/acrobat/readstep.html":
-                                            manual_download_links.append({
-                                                "htm_link": metadata_link,
-                                                "download_link": f"Manually download from {metadata_link}"
-                                            })
-                                        else:
-                                            download_links.append({
-                                                "htm_link": metadata_link,
-                                                "download_link": complete_download_link
-                                            })
-                                        portugal_download_found = True
-                                        print(f"Download link added: {download_link['href']}")
-                                        break
-                                    else:
-                                        print(f"No 'Download' link found on Portugal page: {portugal_href}")
-                            except requests.exceptions.RequestException as e:
-                                print(f"HTTP request error for Portugal page: {e}")
-
-                    if not portugal_download_found:
-                        download_link = metadata_soup.find("a", string=re.compile(r"Download\s*"))
-                        if download_link:
-                            complete_download_link = urljoin(url, download_link["href"])
-                            if complete_download_link == "http://www.adobe.com/products/acrobat/readstep.html":
-                                manual_download_links.append({
-                                    "htm_link": metadata_link,
-                                    "download_link": f"Manually download from {metadata_link}"
-                                })
-                            else:
-                                download_links.append({
-                                    "htm_link": metadata_link,
-                                    "download_link": complete_download_link
-                                })
-                            print(f"Download link added: {download_link['href']}")
-                        else:
-                            print(f"No 'Download' link found on metadata page: {metadata_link}")
-
-            else:
-                print(f"Error in main webpage request: {response.status_code}")
-        except requests.exceptions.RequestException as e:
-            print(f"HTTP request error for metadata page: {e}")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        entries = list(executor.map(lambda link: process_metadata_link(link, headers, session, limiter, cache), links))
 
+    download_links = [entry for kind, entry in filter(None, entries) if kind == "download"]
+    manual_download_links = [entry for kind, entry in filter(None, entries) if kind == "manual"]
     print(f"Final download links: {download_links}")
     print(f"Manual download links: {manual_download_links}")
     return download_links, manual_download_links
@@ -195,48 +232,86 @@ def save_links_to_csv(links: List[Dict[str, str]], save_path: str) -> None:
             writer.writerow(link)
     print(f"Links saved to {save_path}")
 
-def download_metadata(save_path: str, link: str, download_link: str, headers: Dict[str, str]) -> None:
+def extract_sdmx_files(zip_path: str, save_path: str) -> List[str]:
     """
-    Download and extract a metadata file from the given link.
+    Extract only the SDMX metadata files ('.sdmx.xml') of a metadata zip file.
+
+    Each file is streamed from the zip file straight to its final path in the metadata folder, named after the metadata
+    code (the name looked up by the processing), under a temporary name renamed when completed. The rest of the members
+    are not extracted, so no intermediate folders have to be moved and removed afterwards.
+
+    Args:
+        zip_path (str): Path to the metadata zip file.
+        save_path (str): The metadata folder.
+
+    Returns:
+        List[str]: Names of the SDMX metadata files extracted.
+    """
+    extracted_files = []
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        for member in zip_ref.infolist():
+            file_name = os.path.basename(member.filename)
+            if member.is_dir() or not file_name.endswith(".sdmx.xml"):
+                continue
+            file_path = os.path.join(save_path, file_name)
+            temp_path = f"{file_path}.{threading.get_ident()}.tmp"
+            with zip_ref.open(member) as source, open(temp_path, "wb") as target:
+                shutil.copyfileobj(source, target, hu.download_chunk_size)
+            os.replace(temp_path, file_path)
+            extracted_files.append(file_name)
+    return extracted_files
+
+def download_metadata(save_path: str, link: str, download_link: str, headers: Dict[str, str], session: requests.Session, limiter: Optional[hu.TokenBucket] = None) -> None:
+    """
+    Download a metadata zip file from the given link and extract its SDMX metadata file (see `extract_sdmx_files`).
+
+    The file is streamed to disk (see `http_utils.download_file`), so the memory used does not depend on its size.
 
     Args:
+        save_path (str): The metadata folder.
         link (str): The htm link for reference.
         download_link (str): The download link.
         headers (dict): Headers to use for the HTTP request.
+        session (requests.Session): Session shared by the metadata downloads (see `http_utils.create_session`).
+        limiter (Optional[TokenBucket]): Rate limiter of the host of the download link.
     """
-    print(f"Downloading from: {download_link}")
+    print(f"Downloading from: {download_link} (metadata page: {link})")
 
     os.makedirs(save_path, exist_ok=True)
-    save_dir = os.path.join(save_path, os.path.basename(link).split('.')[0])
+    file_name = os.path.basename(download_link)
+    file_path = os.path.join(save_path, file_name)
     try:
-        response = requests.get(download_link, headers=headers)
-        time.sleep(1)  # Add a 1-second delay
+        hu.download_file(session, download_link, file_path, limiter=limiter, headers=headers)
+        print(f"File saved as: {file_name}")
+    except requests.exceptions.HTTPError as e:
+        print(f"Could not download the file: {download_link} ({e})")
+        return
     except requests.exceptions.RequestException as e:
         print(f"HTTP request error: {e}")
         return
 
-    if response.status_code == 200:
-        if not os.path.exists(save_dir):
-            os.makedirs(save_dir)
-            print(f"Directory created: {save_dir}")
-
-        file_name = os.path.basename(download_link)
-        file_path = os.path.join(save_dir, file_name)
-
-        with open(file_path, "wb") as file:
-            file.write(response.content)
-            print(f"File saved as: {file_name}")
+    if zipfile.is_zipfile(file_path):
+        extracted_files = extract_sdmx_files(file_path, save_path)
+        os.remove(file_path)
+        print(f"Metadata extracted and .zip deleted: {file_name} -> {', '.join(extracted_files) or 'no .sdmx.xml file'}")
+    else:
+        print(f"The file is not a valid ZIP file: {file_name}")
 
-        if zipfile.is_zipfile(file_path):
-            with zipfile.ZipFile(file_path, "r") as zip_ref:
-                zip_ref.extractall(save_dir)
-            os.remove(file_path)
-            print(f"File extracted and .zip deleted: {file_name}")
-        else:
-            print(f"The file is not a valid ZIP file: {file_name}")
+def extract_manual_metadata(save_path: str = s.eurostat_metadata_folder) -> None:
+    """
+    Extract the SDMX metadata files of the metadata zip files downloaded manually (see 'manual_metadata.csv') and
+    saved in the metadata folder, removing the zip files.
 
-    else:
-        print(f"Could not download the file: {download_link}")
+    Args:
+        save_path (str): The metadata folder.
+    """
+    if not os.path.isdir(save_path):
+        return
+    for entry in os.scandir(save_path):
+        if entry.is_file() and entry.name.endswith(".zip") and zipfile.is_zipfile(entry.path):
+            extracted_files = extract_sdmx_files(entry.path, save_path)
+            os.remove(entry.path)
+            print(f"Metadata extracted and .zip deleted: {entry.name} -> {', '.join(extracted_files) or 'no .sdmx.xml file'}")
 
 def main() -> None:
     """
@@ -245,27 +320,33 @@ def main() -> None:
     # Read metadata links from a CSV file
     metadata_links = read_metadata_links_from_csv(csv_file=s.eurostat_datacodes)
 
-    # Process metadata links to get download and manual download links
-    download_links, manual_download_links = process_metadata_links(links=metadata_links, headers=s.headers)
-
-    # Save download and manual download links to CSV files
-    save_links_to_csv(links=download_links, save_path=s.eurostat_download_metadata)
-    save_links_to_csv(links=manual_download_links, save_path=s.eurostat_manual_metadata)
-
-    # Initialize a set to keep track of processed download links
-    processed_links = set()  # Set to track processed download links
-
-    # Iterate over the download links and download the metadata files
-    for link_info in download_links:
-        if link_info["download_link"] not in processed_links:
-            download_metadata(
+    # The crawler and the downloads share the session, and the rate limit of each host
+    cache = hc.ResponseCache(s.eurostat_page_cache, s.eurostat_page_cache_days)
+    limiter = hu.HostRateLimiter(s.eurostat_requests_per_host)
+    with hu.create_session(max_connections=s.eurostat_crawler_workers) as session:
+        # Process metadata links to get download and manual download links
+        download_links, manual_download_links = process_metadata_links(metadata_links, s.headers, session, limiter, cache)
+        cache.report()
+
+        # Save download and manual download links to CSV files
+        save_links_to_csv(links=download_links, save_path=s.eurostat_download_metadata)
+        save_links_to_csv(links=manual_download_links, save_path=s.eurostat_manual_metadata)
+
+        # Each download link is processed once (the first metadata link pointing to it)
+        unique_links = {}
+        for link_info in download_links:
+            unique_links.setdefault(link_info["download_link"], link_info)
+
+        # Download the metadata files, several at a time
+        with ThreadPoolExecutor(max_workers=s.eurostat_crawler_workers) as executor:
+            list(executor.map(lambda link_info: download_metadata(
                 s.eurostat_metadata_folder,
                 link=link_info["htm_link"],
                 download_link=link_info["download_link"],
-                headers=s.headers
-            )
-            # Add the processed link to the set to avoid reprocessing
-            processed_links.add(link_info["download_link"])
+                headers=s.headers,
+                session=session,
+                limiter=limiter.for_url(link_info["download_link"])
+            ), unique_links.values()))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
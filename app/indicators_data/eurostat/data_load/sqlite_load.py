@@ -1,9 +1,16 @@
 import os
-import csv
+import sys
+import time
 import sqlite3
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 import sqlite_queries as sq
 
+# Get the path of the root directory (irradiare-app) and add it to sys.path to import the utils modules
+irradiare_app_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..'))
+sys.path.append(irradiare_app_path)
+
+import app.utils.processed_files as pf
+
 
 def extract_and_save_row(input_csv: str, output_csv: str, row_number: int) -> Optional[List[str]]:
     """
@@ -23,18 +30,8 @@ def extract_and_save_row(input_csv: str, output_csv: str, row_number: int) -> Op
 
     last_row = None
 
-    with open(input_csv, 'r', encoding='utf-8') as infile:
-        lines = infile.readlines()
-
-        # Obtain the data written in the specified row number
-        if row_number < len(lines):
-            row = lines[row_number].strip()  # Remove spaces and break lines
-            # Divide the row elements by ;
-            row_data = row.split(',')
-            # Remove double quotes from any element
-            row_data = [field.strip('"') for field in row_data]
-        else:
-            row_data = None
+    # Obtain the data written in the specified row number
+    row_data = pf.read_row(input_csv, row_number, delimiter=',')
 
      # If there's no output file, a new one is created inserting the first 2 rows (filename and data)
     if not os.path.exists(output_csv):
@@ -100,7 +97,29 @@ def extract_and_save_row(input_csv: str, output_csv: str, row_number: int) -> Op
         return last_row
 
 
-def insert_into_stagging(database: sqlite3.Connection, csv_folder: str) -> None:
+def get_stagging_key(cursor: sqlite3.Cursor, query: str, values: Tuple, keys: Dict[Tuple, int]) -> int:
+    """
+    Returns the staging key of a set of repeated values (indicator, geography or attributes),
+    inserting them into their staging table only the first time they are seen during the run.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor used to insert into the staging tables.
+        query (str): INSERT query of the staging table holding the values.
+        values (Tuple): Values to encode.
+        keys (Dict[Tuple, int]): Already encoded values and their staging keys.
+
+    Returns:
+        int: Staging key of the values.
+    """
+    key = keys.get(values)
+    if key is None:
+        cursor.execute(query, values)
+        key = cursor.lastrowid
+        keys[values] = key
+    return key
+
+
+def insert_into_stagging(database: sqlite3.Connection, csv_folder: str) -> int:
     """
     Inserts data from CSV files into a staging table in the database.
 
@@ -109,197 +128,184 @@ def insert_into_stagging(database: sqlite3.Connection, csv_folder: str) -> None:
         csv_folder (str): Path to the folder containing the CSV files.
 
     Returns:
-        None
+        int: Number of rows written to the staging table.
     """
+    staged_rows = 0
+    indicator_keys, geo_keys, attribute_keys = {}, {}, {}
+
+    cursor = database.cursor()
     try:
         for filename in os.listdir(csv_folder):
-            if filename.endswith('.csv'):
+            if pf.is_data_file(filename):
                 file_path = os.path.join(csv_folder, filename)
-                with open(file_path, 'r', encoding='utf-8') as data_file:
-                    # Get the last data saved for the filename in savepoint.csv and update it with info from input file
-                    last_row = extract_and_save_row(
-                        input_csv=file_path,
-                        output_csv="app/indicators_data/eurostat/eurostat_data/savepoint.csv",
-                        row_number=2
-                    )
-                    reader = csv.reader(data_file, delimiter=',')
-                    headers = next(reader)
-
-                    # Identify the columns
-                    timecode_idx = headers.index('time')
-                    data_value_idx = headers.index('value')
-                    name_indicator_idx = headers.index('dataset_name')
-                    description_idx = headers.index('description')
-                    units_idx = headers.index('unit')
-                    units_desc_idx = headers.index('units_description')
-                    calculation_idx = headers.index('calculation')
-                    source_idx = headers.index('source')
-                    source_code_idx = headers.index('data_code')
-
-                    cursor = database.cursor()
-
-                    # Process each row of the file
-                    for row in reader:
-                        # Check for the `last_row`inside the new file
-                        if row == last_row:
-                            print(f"Se alcanzó la última fila: {last_row}. Deteniendo la inserción de más filas.")
-                            break  # If the last row is found in the input file, the insertion process ends
-
-                        nuts1 = 'Portugal(all)'
-                        nuts2 = 'Undefined'
-                        nuts3 = 'Undefined'
-                        geocode = 'Undefined'
-                        type = 'Undefined'
-                        distrito = 'Undefined'
-                        concelho = 'Undefined'
-                        freguesia = 'Undefined'
-                        timecode = row[timecode_idx] if timecode_idx is not None else 'Undefined'
-                        data_value = row[data_value_idx] if data_value_idx is not None else 'Undefined'
-                        name_indicator = row[name_indicator_idx] if name_indicator_idx is not None else 'Undefined'
-                        description = row[description_idx]  if description_idx is not None else 'Undefined'
-                        units = row[units_idx]  if units_idx is not None else 'Undefined'
-                        units_desc = row[units_desc_idx]  if units_desc_idx is not None else 'Undefined'
-                        calculation = row[calculation_idx]  if calculation_idx is not None else 'Undefined'
-                        source = row[source_idx]  if source_idx is not None else 'Undefined'
-                        source_code = row[source_code_idx]  if source_code_idx is not None else 'Undefined'
-                        attributes = 'Undefined'
-                        name_attribute = 'Undefined'
-                        value_attribute = 'Undefined'
-                        value_tag = 'Undefined'
-
-                        # INSERT into the db
-                        cursor.execute(sq.INSERT_DATA_STAGGING, (
-                            nuts1, nuts2, nuts3, geocode, type, distrito, concelho, freguesia, timecode, data_value,
-                            name_indicator, description, units, units_desc, calculation, source, source_code,
-                            attributes, name_attribute, value_attribute, value_tag
-                            ))
+                started, file_first_row = time.perf_counter(), staged_rows
+                # Get the last data saved for the filename in savepoint.csv and update it with info from input file
+                last_row = extract_and_save_row(
+                    input_csv=file_path,
+                    output_csv="app/indicators_data/eurostat/eurostat_data/savepoint.csv",
+                    row_number=2
+                )
+                headers, reader = pf.read_table(file_path, delimiter=',')
+
+                # Identify the columns
+                indicator_idx = headers.index(pf.dimension_key_columns['indicator'])
+                timecode_idx = headers.index('time')
+                data_value_idx = headers.index('value')
+
+                # Stage each entry of the file indicator dictionary once, keeping its staging key by position
+                dims = pf.read_dims(file_path)
+                stg_indicator_ids = [
+                    get_stagging_key(cursor, sq.INSERT_STG_INDICATOR, (
+                        indicator.get('dataset_name', 'Undefined'), indicator['description'], indicator['unit'], indicator['units_description'],
+                        indicator['calculation'], indicator['source'], indicator['data_code'], 'Undefined'
+                    ), indicator_keys)
+                    for indicator in dims['indicator']
+                ]
+                id_stg_geo = get_stagging_key(cursor, sq.INSERT_STG_GEO, (
+                    'Portugal(all)', 'Undefined', 'Undefined', 'Undefined', 'Undefined', 'Undefined', 'Undefined', 'Undefined'
+                ), geo_keys)
+                id_stg_attribute = get_stagging_key(cursor, sq.INSERT_STG_ATTRIBUTE, (
+                    'Undefined', 'Undefined', 'Undefined'
+                ), attribute_keys)
+
+                # Process each row of the file
+                for row in reader:
+                    # Check for the `last_row`inside the new file
+                    if row == last_row:
+                        print(f"Se alcanzó la última fila: {last_row}. Deteniendo la inserción de más filas.")
+                        break  # If the last row is found in the input file, the insertion process ends
+
+                    timecode = row[timecode_idx] if timecode_idx is not None else 'Undefined'
+                    data_value = row[data_value_idx] if data_value_idx is not None else 'Undefined'
+
+                    try:
+                        value = None if data_value == '' else float(data_value)
+                    except ValueError:
+                        value = None
+
+                    # INSERT into the db
+                    cursor.execute(sq.INSERT_DATA_STAGGING, (
+                        stg_indicator_ids[int(row[indicator_idx])], id_stg_geo, id_stg_attribute, timecode, value
+                    ))
+                    staged_rows += 1
+                pf.report_throughput(f"Eurostat staging {filename}", staged_rows - file_first_row, started, file_path)
         # Changes commited to the db
         database.commit()
         print("Stagging completed.")
         
     except Exception as e:
         database.rollback()
+        staged_rows = 0
         print(f"Error processing the file {filename}: {e}")
 
     finally:
         cursor.close()
 
+    return staged_rows
+
 
-def stg_to_datawarehouse(database: sqlite3.Connection) -> None:
+def stg_to_datawarehouse(database: sqlite3.Connection) -> int:
     """
-    Processes the data from the staging table and inserts it into the destination tables.
+    Processes the data from the staging tables and inserts it into the destination tables.
+
+    Each distinct geography, indicator and attribute staged during the run is resolved against the
+    data warehouse tables only once; the value rows are then promoted using the resolved ids.
 
     Args:
         database (sqlite3.Connection): Connection to the SQLite database.
 
     Returns:
-        None
+        int: Number of values promoted to the `data_values` table.
     """
+    promoted_rows = 0
     cursor = database.cursor()
 
     try:
         cursor.execute('BEGIN TRANSACTION')
-        cursor.execute('SELECT * FROM stg_table')
-        rows = cursor.fetchall()
-
-        for row in rows:
-            row_dict = {
-                'nuts1': row[0],
-                'nuts2': row[1],
-                'nuts3': row[2],
-                'geocode': row[3],
-                'type': row[4],
-                'distrito': row[5],
-                'concelho': row[6],
-                'freguesia': row[7],
-                'timecode': row[8],
-                'data_value': row[9],
-                'name_indicator': row[10],
-                'description': row[11],
-                'units': row[12],
-                'units_desc': row[13],
-                'calculation': row[14],
-                'source': row[15],
-                'source_code': row[16],
-                'attributes': row[17],
-                'name_attribute': row[18],
-                'value_attribute': row[19],
-                'value_tag': row[20]
-            }
-
-            # Insert data into `nuts` table
+
+        # Resolve each staged geography into `nuts`, `geolevel` and `geodata`
+        geodata_ids = {}
+        for id_stg_geo, nuts1, nuts2, nuts3, geocode, type, distrito, concelho, freguesia in cursor.execute(
+                'SELECT * FROM stg_geo').fetchall():
             cursor.execute('INSERT OR IGNORE INTO nuts (nuts1, nuts2, nuts3) VALUES (?, ?, ?)', 
-                           (row_dict['nuts1'], row_dict['nuts2'], row_dict['nuts3']))
-            id_nuts = cursor.execute('SELECT id_nuts FROM nuts WHERE nuts1 = ? AND nuts2 = ? AND nuts3 = ?',
-                                     (row_dict['nuts1'], row_dict['nuts2'], row_dict['nuts3'])).fetchone()[0]
+                           (nuts1, nuts2, nuts3))
+            id_nuts = cursor.execute('SELECT id_nuts FROM nuts WHERE nuts1 = ? AND nuts2 = ? AND nuts3 = ?', 
+                                     (nuts1, nuts2, nuts3)).fetchone()[0]
 
-            # Insert data into `geolevel` table
             cursor.execute('INSERT OR IGNORE INTO geolevel (distrito, concelho, freguesia) VALUES (?, ?, ?)', 
-                           (row_dict['distrito'], row_dict['concelho'], row_dict['freguesia']))
-            id_geolevel = cursor.execute('SELECT id_geolevel FROM geolevel WHERE distrito = ? AND concelho = ? AND freguesia = ?',
-                                         (row_dict['distrito'], row_dict['concelho'], row_dict['freguesia'])).fetchone()[0]
+                           (distrito, concelho, freguesia))
+            id_geolevel = cursor.execute('SELECT id_geolevel FROM geolevel WHERE distrito = ? AND concelho = ? AND freguesia = ?', 
+                                         (distrito, concelho, freguesia)).fetchone()[0]
 
-            # Insert data into `geodata` table
             cursor.execute('INSERT OR IGNORE INTO geodata (id_nuts, id_geolevel, geocode, type) VALUES (?, ?, ?, ?)', 
-                           (id_nuts, id_geolevel, row_dict['geocode'], row_dict['type']))
-            id_geodata = cursor.execute('SELECT id_geodata FROM geodata WHERE id_nuts = ? AND id_geolevel = ? AND geocode = ? AND type = ?',
-                                        (id_nuts, id_geolevel, row_dict['geocode'], row_dict['type'])).fetchone()[0]
-
-            # Insert data into `indicator` table
+                           (id_nuts, id_geolevel, geocode, type))
+            geodata_ids[id_stg_geo] = cursor.execute('SELECT id_geodata FROM geodata WHERE id_nuts = ? AND id_geolevel = ? AND geocode = ? AND type = ?', 
+                                                     (id_nuts, id_geolevel, geocode, type)).fetchone()[0]
+
+        # Resolve each staged indicator into `indicator`, `tags` and `type`
+        indicator_ids = {}
+        for (id_stg_indicator, name_indicator, description, units, units_desc,
+             calculation, source, source_code, value_tag) in cursor.execute('SELECT * FROM stg_indicator').fetchall():
             cursor.execute('INSERT OR IGNORE INTO indicator (name, description, units, units_desc, calculation, source, source_code) VALUES (?, ?, ?, ?, ?, ?, ?)', 
-                           (row_dict['name_indicator'], row_dict['description'], row_dict['units'], row_dict['units_desc'],
-                            row_dict['calculation'], row_dict['source'], row_dict['source_code']))
-            id_indicator = cursor.execute('SELECT id_indicator FROM indicator WHERE name = ? AND source_code = ?',
-                                          (row_dict['name_indicator'], row_dict['source_code'])).fetchone()[0]
-
-            # Insert data into `data_values` table
-            try:
-                data_value = row_dict['data_value']
-                if data_value == '' or data_value is None:
-                    data_value = None
-                else:
-                    data_value = float(data_value)  # Converted to float just if not empty
-
-                cursor.execute('INSERT INTO data_values (id_geodata, id_indicator, timecode, value, attributes) VALUES (?, ?, ?, ?, ?)', 
-                            (id_geodata, id_indicator, row_dict['timecode'], data_value, row_dict['attributes']))
-                id_value = cursor.lastrowid
-
-            except sqlite3.IntegrityError:
-                print(f"Duplicado encontrado y saltado: {row_dict}")
-                continue
-
+                           (name_indicator, description, units, units_desc, calculation, source, source_code))
+            id_indicator = cursor.execute('SELECT id_indicator FROM indicator WHERE name = ? AND source_code = ?', 
+                                          (name_indicator, source_code)).fetchone()[0]
+            indicator_ids[id_stg_indicator] = id_indicator
+
+            if value_tag != 'Undefined':
+                cursor.execute('INSERT OR IGNORE INTO tags (value) VALUES (?)', (value_tag,))
+                id_tag = cursor.execute('SELECT id_tag FROM tags WHERE value = ?', (value_tag,)).fetchone()[0]
+                cursor.execute('INSERT OR IGNORE INTO type (id_indicator, id_tag) VALUES (?, ?)', 
+                               (id_indicator, id_tag))
 
-            # Insert data into `attributes` table
-            if row_dict['name_attribute'] != 'Undefined' and row_dict['value_attribute'] != 'Undefined':
+        # Resolve each staged attribute into `attributes`
+        attribute_ids = {}
+        attribute_strings = {}
+        for id_stg_attribute, attributes, name_attribute, value_attribute in cursor.execute(
+                'SELECT * FROM stg_attribute').fetchall():
+            attribute_strings[id_stg_attribute] = attributes
+            if name_attribute != 'Undefined' and value_attribute != 'Undefined':
                 cursor.execute('INSERT OR IGNORE INTO attributes (name, value) VALUES (?, ?)', 
-                               (row_dict['name_attribute'], row_dict['value_attribute']))
-                id_attribute = cursor.execute('SELECT id_attribute FROM attributes WHERE name = ? AND value = ?', 
-                                              (row_dict['name_attribute'], row_dict['value_attribute'])).fetchone()[0]
+                               (name_attribute, value_attribute))
+                attribute_ids[id_stg_attribute] = cursor.execute('SELECT id_attribute FROM attributes WHERE name = ? AND value = ?', 
+                                                                 (name_attribute, value_attribute)).fetchone()[0]
+
+        # Promote the value rows using the resolved ids
+        values_cursor = database.cursor()
+        try:
+            for id_stg_indicator, id_stg_geo, id_stg_attribute, timecode, data_value in values_cursor.execute(
+                    'SELECT id_stg_indicator, id_stg_geo, id_stg_attribute, timecode, data_value FROM stg_table'):
+                try:
+                    cursor.execute('INSERT INTO data_values (id_geodata, id_indicator, timecode, value, attributes) VALUES (?, ?, ?, ?, ?)', 
+                                   (geodata_ids[id_stg_geo], indicator_ids[id_stg_indicator], timecode, data_value,
+                                    attribute_strings[id_stg_attribute]))
+                    id_value = cursor.lastrowid
+                    promoted_rows += 1
+                except sqlite3.IntegrityError:
+                    print(f"Duplicated found and skipped: {(id_stg_indicator, id_stg_geo, timecode, data_value)}")
+                    continue
 
                 # Insert data into `val_attr` table
-                cursor.execute('INSERT OR IGNORE INTO val_attr (id_value, id_attribute) VALUES (?, ?)', 
-                               (id_value, id_attribute))
-
-            # Insert data into `tags` table
-            if row_dict['value_tag'] != 'Undefined':
-                cursor.execute('INSERT OR IGNORE INTO tags (value) VALUES (?)', 
-                               (row_dict['value_tag'],))
-                id_tag = cursor.execute('SELECT id_tag FROM tags WHERE value = ?', 
-                                        (row_dict['value_tag'],)).fetchone()[0]
-
-                # Insert data into `type` table
-                cursor.execute('INSERT OR IGNORE INTO type (id_indicator, id_tag) VALUES (?, ?)', 
-                               (id_indicator, id_tag))
+                id_attribute = attribute_ids.get(id_stg_attribute)
+                if id_attribute is not None:
+                    cursor.execute('INSERT OR IGNORE INTO val_attr (id_value, id_attribute) VALUES (?, ?)', 
+                                   (id_value, id_attribute))
+        finally:
+            values_cursor.close()
 
         database.commit()
 
     except sqlite3.Error as e:
         print(f"Error processing stagging data: {e}")
         database.rollback()
+        promoted_rows = 0
 
     finally:
         cursor.close()
 
+    return promoted_rows
+
+
 def truncate_all_tables(database: sqlite3.Connection) -> None:
     """
     Empties all specified tables in the database.
@@ -329,9 +335,12 @@ def truncate_all_tables(database: sqlite3.Connection) -> None:
         cursor.close()
 
     
-def truncate_stagging(database: sqlite3.Connection) -> None:
+def create_stagging(database: sqlite3.Connection) -> None:
     """
-    Empties the staging table in the database.
+    Creates the staging tables as TEMP tables bound to the current connection.
+
+    The TEMP tables shadow any legacy `stg_table` kept in the database file and are dropped
+    automatically when the connection is closed, so every loading run starts from an empty staging area.
 
     Args:
         database (sqlite3.Connection): Connection to the SQLite database.
@@ -342,20 +351,39 @@ def truncate_stagging(database: sqlite3.Connection) -> None:
     cursor = database.cursor()
 
     try:
-        tables = ['stg_table']
-        
-        for table in tables:
-            cursor.execute(f'DELETE FROM {table}')
-            cursor.execute(f'DELETE FROM sqlite_sequence WHERE name="{table}";')
+        cursor.execute(sq.CREATE_TEMP_STG_INDICATOR)
+        cursor.execute(sq.CREATE_TEMP_STG_GEO)
+        cursor.execute(sq.CREATE_TEMP_STG_ATTRIBUTE)
+        cursor.execute(sq.CREATE_TEMP_STAGGING_TABLE)
+        database.commit()
+    finally:
+        cursor.close()
+
+
+def truncate_stagging(database: sqlite3.Connection) -> None:
+    """
+    Empties the per-run staging tables once their rows have been promoted.
+
+    Args:
+        database (sqlite3.Connection): Connection to the SQLite database.
+
+    Returns:
+        None
+    """
+    cursor = database.cursor()
 
+    try:
+        for table in ['stg_table', 'stg_indicator', 'stg_geo', 'stg_attribute']:
+            cursor.execute(f'DELETE FROM temp.{table}')
         database.commit()
-        print("All tables empty.")
+        print("Stagging tables emptied.")
     except sqlite3.Error as e:
         database.rollback()
-        print(f"Error emptying the tables: {e}")
+        print(f"Error emptying the stagging tables: {e}")
     finally:
         cursor.close()
 
+
 def main() -> None:
     """
     Main function that manages the database connection, inserts data from CSV into staging,
@@ -367,14 +395,15 @@ def main() -> None:
         print("Connected to the database (SQLITE).")
         
         # Insert data into staging from Eurostat CSVs
-        insert_into_stagging(database=database, csv_folder="app/indicators_data/eurostat/eurostat_data/processed/")
-        print("Stagging table completed")
+        create_stagging(database)
+        staged_rows = insert_into_stagging(database=database, csv_folder="app/indicators_data/eurostat/eurostat_data/processed/")
 
         # Move data from staging to the data warehouse
-        stg_to_datawarehouse(database)
+        promoted_rows = stg_to_datawarehouse(database)
+        print(f"Eurostat: {staged_rows} rows staged, {promoted_rows} values promoted.")
 
-        # Uncomment this if you want to truncate the stg_table after processing
-        #truncate_stagging(database=database)
+        # The staging table only lives for this run
+        truncate_stagging(database=database)
 
         # Uncomment this if you want to truncate all tables after processing
         # truncate_all_tables(database=database)
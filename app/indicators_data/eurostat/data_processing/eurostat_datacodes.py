@@ -38,6 +38,7 @@ As the root of the project is now in the 'sys.path', it is possible to import th
 """
 
 import app.utils.settings as s
+import app.utils.http_utils as hu
 
 
 def download_toc(url: str, save_path: str) -> None:
@@ -52,79 +53,88 @@ def download_toc(url: str, save_path: str) -> None:
         None
     """
     try:
-        # Send a HTTP GET request to the URL
-        response = requests.get(url)
-        # Raise an error if the request was unsuccessful
-        response.raise_for_status()
-        
-        # Write the content of the response to a file
-        with open(save_path, 'wb') as file:
+        # Send a HTTP GET request to the URL and stream the content of the response to the file
+        with hu.create_session(max_connections=1) as session:
             print("Correct saving path. Download in progress...")
-            file.write(response.content)
+            hu.download_file(session, url, save_path)
         
         print(f"File downloaded successfully and saved to {save_path}")
     except requests.exceptions.RequestException as e:
         print(f"An error occurred while downloading the file: {e}")
 
+def get_data_codes(path: str) -> List[str]:
+    """
+    Get the codes of the datasets saved in a directory: Parquet files, and JSON files saved by previous versions.
+
+    Args:
+        path (str): The directory containing the dataset files.
+
+    Returns:
+        List[str]: The dataset codes (file names without extension), each one once.
+    """
+    return list(dict.fromkeys(os.path.splitext(archivo)[0] for archivo in sorted(os.listdir(path)) if archivo.endswith(('.parquet', '.json'))))
+
 def get_data_names(path: str, output_file: str) -> None:
     """
-    Write the names of JSON files in a directory to a text file.
+    Write the codes of the dataset files in a directory to a text file.
 
     Args:
-        path (str): The directory containing JSON files.
-        output_file (str): The file where the names of the JSON files will be saved.
+        path (str): The directory containing the dataset files.
+        output_file (str): The file where the codes of the datasets will be saved.
 
     Returns:
         None
     """
     with open(output_file, 'w') as f:
-        for archivo in os.listdir(path):
-            if archivo.endswith('.json'):
-                f.write(os.path.splitext(archivo)[0] + '\n')
+        for code in get_data_codes(path):
+            f.write(code + '\n')
     print(f"Filenames CSV saved in: {output_file}")
 
-def find_link(code: str, file_xml: str) -> Optional[str]:
+def build_metadata_index(file_xml: str) -> Dict[str, Optional[str]]:
     """
-    Find the metadata link for a given code in an XML file.
+    Build the index of the HTML metadata links of the datasets in the TOC XML file, in a single pass.
+
+    The file is streamed ('iterparse') and each leaf is cleared once read, so the whole tree is never kept in memory.
+    Every metadata link is then looked up in the index, instead of parsing and scanning the file again for each dataset.
 
     Args:
-        codigo (str): The code to search for in the XML.
-        archivo_xml (str): The XML file to search in.
+        file_xml (str): The TOC XML file.
 
     Returns:
-        Optional[str]: The metadata link if found, otherwise None.
+        Dict[str, Optional[str]]: The HTML metadata link of each dataset code (the first leaf of the code with an HTML metadata link).
     """
-    tree = ET.parse(file_xml)
-    root = tree.getroot()
     # Namespace of the XML file
-    ns = {'nt': 'urn:eu.europa.ec.eurostat.navtree'}
-
-    for leaf in root.findall(".//nt:leaf", ns):
-        code_element = leaf.find("nt:code", ns)
-        if code_element is not None and code_element.text == code:
-            metadata_element = leaf.find("nt:metadata[@format='html']", ns)
-            if metadata_element is not None:
-                print(f"Found {metadata_element.text} for {code}")
-                return metadata_element.text
-    return None
+    ns = '{urn:eu.europa.ec.eurostat.navtree}'
+    metadata_index = {}
+    for _, element in ET.iterparse(file_xml, events=('end',)):
+        if element.tag == f"{ns}leaf":
+            code_element = element.find(f"{ns}code")
+            metadata_element = element.find(f"{ns}metadata[@format='html']")
+            if code_element is not None and metadata_element is not None:
+                metadata_index.setdefault(code_element.text, metadata_element.text)
+            element.clear()
+    return metadata_index
 
 def fill_metadata_list(names_json: List[str], file_xml: str, metadata_dict: Dict[str, str]) -> Dict[str, str]:
     """
     Fill the metadata dictionary with links found in an XML file.
 
     Args:
-        names_json (List[str]): The list of JSON file names to search for.
+        names_json (List[str]): The list of dataset codes to search for.
         file_xml (str): The XML file to search in.
         metadata_dict (Dict[str, str]): The dictionary to fill with metadata links.
 
     Returns:
         Dict[str, str]: The updated metadata dictionary.
     """
+    # The TOC is parsed once, and the link of each dataset is looked up in the index
+    metadata_index = build_metadata_index(file_xml)
     # Fill the dictionary with the metadata links
     for name in names_json:
-        link = find_link(name, file_xml)
+        link = metadata_index.get(name)
         if link:
             metadata_dict[name] = link
+    print(f"Metadata links found for {len(metadata_dict)} of {len(names_json)} datasets")
     return metadata_dict
 
 def merge_datacode_metadata_link(csv_file: str, metadata_dict: Dict[str, str], updated_csv_file: str) -> None:
@@ -173,17 +183,17 @@ def main() -> None:
     download_toc(url=s.eurostat_toc_url_xml, save_path=s.eurostat_toc_xml)
     get_data_names(path=s.eurostat_raw_data, output_file=s.eurostat_datacodes)
     
-    # Get JSON filenames without extension
-    nombres_json = [f.split('.')[0] for f in os.listdir(s.eurostat_raw_data) if f.endswith('.json')]
+    # Get the dataset codes (filenames without extension)
+    nombres_json = get_data_codes(s.eurostat_raw_data)
     
     # Create a dict to save metadata links
     metadata_links: Dict[str, str] = {}
     
     # Fill the dict
-    metadata_dict = fill_metadata_list(nombres_json=nombres_json, archivo_xml=s.eurostat_toc_xml, metadata_dict=metadata_links)
+    metadata_dict = fill_metadata_list(names_json=nombres_json, file_xml=s.eurostat_toc_xml, metadata_dict=metadata_links)
     
     # Update the CSV with the metadata dict info
-    merge_datacode_metadata_link(archivo_csv=s.eurostat_datacodes, metadata_dict=metadata_dict, archivo_csv_actualizado=s.eurostat_datacodes)
+    merge_datacode_metadata_link(csv_file=s.eurostat_datacodes, metadata_dict=metadata_dict, updated_csv_file=s.eurostat_datacodes)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
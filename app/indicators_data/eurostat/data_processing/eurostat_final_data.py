@@ -1,14 +1,20 @@
 import csv
 import json
 import os
+import sqlite3
 import xml.etree.ElementTree as ET
 import html
+import html.entities
+import re
+import functools
+from html.parser import HTMLParser
 import concurrent.futures
 from bs4 import BeautifulSoup
-from typing import Optional, Dict
+from typing import Any, AbstractSet, Iterable, List, Optional, Dict, Tuple
 
 import logging
 import sys
+import time
 
 # Logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -41,6 +47,199 @@ As the root of the project is now in the 'sys.path', it is possible to import th
 """
 
 import app.utils.settings as s
+import app.utils.processed_files as pf
+import app.utils.http_cache as hc
+
+# Namespaces used in the SDMX metadata files
+namespaces = {
+    'genericmetadata': 'http://www.SDMX.org/resources/SDMXML/schemas/v2_0/genericmetadata',
+    'common': 'http://www.SDMX.org/resources/SDMXML/schemas/v2_0/common'
+}
+
+# SDMX concept of each metadata field saved in the indicator columns
+metadata_concepts = {
+    'description': 'DATA_DESCR',
+    'source': 'CONTACT_ORGANISATION',
+    'calculation': 'DATA_COMP',
+    'units_description': 'UNIT_MEASURE'
+}
+
+# Columns of the raw data files read by the processing (value, unit and time period of each observation)
+raw_data_columns = ('values', 'unit', 'time')
+
+# Number of distinct metadata texts whose cleaned text is kept in memory (many metadata files share the same texts)
+text_cache_size = 4096
+
+# Markup that BeautifulSoup does not read as plain data: the content of these tags is left out of (or added to) the text,
+# or keeps its whitespace. The texts with any of them are cleaned with BeautifulSoup.
+bs4_markup = re.compile(r'<(?:script|style|template|rt|rp|pre|textarea)\b|<!\[CDATA\[', re.IGNORECASE)
+
+# Entity references left after the first unescaping. BeautifulSoup decodes the numeric ones and the ones without
+# a semicolon with its own rules, so only the named references ending with a semicolon are decoded without it.
+entity_reference = re.compile(r'&(#|[a-zA-Z][-.a-zA-Z0-9]*;?)')
+
+# Whitespace of the text nodes replaced by BeautifulSoup (ASCII whitespace only, a non-breaking space is kept)
+ascii_spaces = ' \t\n\f\r'
+
+class TextExtractor(HTMLParser):
+    """
+    HTML parser keeping only the text of the document, as `BeautifulSoup(text, 'html.parser').get_text()` does
+    for the texts without the markup of `bs4_markup` and the entity references it decodes with its own rules, without building
+    the document tree.
+
+    As in BeautifulSoup, the text between two tags (or other markup) made only of ASCII whitespace is replaced
+    by a line break, or by a space if it has no line breaks.
+    """
+
+    def __init__(self):
+        # The entity references are decoded by `handle_entityref`, so that the markup left unfinished at the end
+        # of the text is kept as it is, as BeautifulSoup does
+        super().__init__(convert_charrefs=False)
+        self.parts = []
+        self.node = []
+
+    def handle_data(self, data: str) -> None:
+        self.node.append(data)
+
+    def handle_entityref(self, name: str) -> None:
+        self.node.append(html.entities.html5.get(f"{name};", f"&{name}"))
+
+    def end_node(self) -> None:
+        if self.node:
+            node = ''.join(self.node)
+            if not node.strip(ascii_spaces):
+                node = '\n' if '\n' in node else ' '
+            self.parts.append(node)
+            self.node = []
+
+    # Any markup ends the text node before it
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.end_node()
+
+    def handle_endtag(self, tag: str) -> None:
+        self.end_node()
+
+    def handle_comment(self, data: str) -> None:
+        self.end_node()
+
+    def handle_decl(self, decl: str) -> None:
+        self.end_node()
+
+    def handle_pi(self, data: str) -> None:
+        self.end_node()
+
+    def unknown_decl(self, data: str) -> None:
+        self.end_node()
+
+    def text(self) -> str:
+        self.end_node()
+        return ''.join(self.parts)
+
+def raw_data_path(data_folder: str, data_code: str) -> str:
+    """
+    Get the path of the raw data file of a dataset: the Parquet file saved by the extraction, or the JSON file saved by
+    previous versions if there is no Parquet file.
+
+    Args:
+        data_folder (str): The directory containing the raw data files.
+        data_code (str): The data code of the dataset.
+
+    Returns:
+        str: Path to the raw data file (the Parquet path if none exists).
+    """
+    parquet_path = os.path.join(data_folder, f"{data_code}.parquet")
+    legacy_path = os.path.join(data_folder, f"{data_code}.json")
+    return legacy_path if not os.path.exists(parquet_path) and os.path.exists(legacy_path) else parquet_path
+
+def read_raw_data(data_file_path: str) -> Optional[List[Tuple[Any, ...]]]:
+    """
+    Read the observations of a raw data file.
+
+    The Parquet files are read column by column, only the columns needed (`raw_data_columns`). The JSON files saved by previous
+    versions (a JSON string with the list of records, inside a JSON file) are read with `read_legacy_json`.
+
+    Args:
+        data_file_path (str): Path to the raw data file.
+
+    Returns:
+        Optional[List[Tuple[Any, ...]]]: The (value, unit, time) of each observation, None for the missing columns,
+                                         or None if the file cannot be read.
+    """
+    if data_file_path.endswith('.json'):
+        return read_legacy_json(data_file_path)
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    try:
+        available_columns = set(pq.read_schema(data_file_path).names)
+        table = pq.read_table(data_file_path, columns=[column for column in raw_data_columns if column in available_columns])
+    except (pa.ArrowException, OSError) as e:
+        logging.error(f"Error reading Parquet file {data_file_path}: {e}")
+        return None
+    columns = table.to_pydict()
+    return list(zip(*(columns.get(column, [None] * table.num_rows) for column in raw_data_columns)))
+
+def read_legacy_json(data_file_path: str) -> Optional[List[Tuple[Any, ...]]]:
+    """
+    Read the observations of a raw data file saved in JSON format by previous versions of the extraction.
+
+    Args:
+        data_file_path (str): Path to the JSON file.
+
+    Returns:
+        Optional[List[Tuple[Any, ...]]]: The (value, unit, time) of each record, or None if the file cannot be decoded.
+    """
+    with open(data_file_path, 'r', encoding='utf-8') as datafile:
+        try:
+            json_str = datafile.read().strip()
+
+            if json_str.startswith('"') and json_str.endswith('"'):
+                json_str = json_str[1:-1]
+
+            json_str = json_str.replace('\\"', '"')
+
+            data = json.loads(json_str)
+        except json.JSONDecodeError as e:
+            logging.error(f"Error decoding JSON from {data_file_path}: {e}")
+            return None
+
+    if not isinstance(data, list):
+        logging.error(f"Unexpected JSON format in {data_file_path}. Expected a list.")
+        return None
+
+    records = []
+    for record in data:
+        if not isinstance(record, dict):
+            logging.error(f"Unexpected record format in {data_file_path}: {record}")
+            continue
+        records.append(tuple(record.get(column, None) for column in raw_data_columns))
+    return records
+
+@functools.lru_cache(maxsize=text_cache_size)
+def html_to_text(text: str) -> str:
+    """
+    Remove the HTML markup of a metadata text, keeping the same text as BeautifulSoup ('html.parser').
+
+    The texts without markup are returned as they are, and the texts with markup are read with `TextExtractor`.
+    BeautifulSoup is only used for the texts with the markup or the entity references it handles differently
+    (`bs4_markup`, `entity_reference`).
+
+    Args:
+        text (str): Metadata text, with the HTML entities of the XML value already decoded.
+
+    Returns:
+        str: The text without markup.
+    """
+    if '<' not in text and '&' not in text and text.strip(ascii_spaces):
+        return text
+    if bs4_markup.search(text) or any(not reference.endswith(';') or reference not in html.entities.html5
+                                         for reference in entity_reference.findall(text)):
+        return BeautifulSoup(text, 'html.parser').get_text()
+    extractor = TextExtractor()
+    extractor.feed(text)
+    extractor.close()
+    return extractor.text()
 
 def extract_text(element: ET.Element, tag: str, namespaces: Dict[str, str]) -> Optional[str]:
     """
@@ -57,115 +256,219 @@ def extract_text(element: ET.Element, tag: str, namespaces: Dict[str, str]) -> O
     value = element.find(tag, namespaces)
     if value is not None and value.text:
         # Decodificar entidades HTML y limpiar HTML
-        text = html.unescape(value.text)
-        soup = BeautifulSoup(text, 'html.parser')
-        return soup.get_text()  # Devuelve solo el texto limpio
+        return html_to_text(html.unescape(value.text))  # Devuelve solo el texto limpio
     return None
 
+@functools.lru_cache(maxsize=None)
+def read_metadata(metadata_file_path: str) -> Tuple[Optional[str], ...]:
+    """
+    Parse an SDMX metadata file and extract its cleaned metadata fields.
+
+    The fields only depend on the metadata file, so each file is parsed once per process: the datasets sharing
+    a metadata code reuse the fields already extracted, and the records of a dataset are not parsed again.
+
+    Args:
+        metadata_file_path (str): Path to the SDMX metadata XML file.
+
+    Returns:
+        Tuple[Optional[str], ...]: The cleaned text of each field of `metadata_concepts` (description, source,
+                                   calculation, units_description), None if not found.
+
+    Raises:
+        ET.ParseError: If the XML file cannot be parsed.
+    """
+    root = ET.parse(metadata_file_path).getroot()
+    return tuple(
+        extract_text(root, f".//genericmetadata:ReportedAttribute[@conceptID='{concept}']/genericmetadata:Value", namespaces)
+        for concept in metadata_concepts.values()
+    )
+
+def build_metadata_table(metadata_codes: Iterable[str], metadata_folder: str, table_path: str) -> int:
+    """
+    Extract the metadata fields of every metadata code into a SQLite table, in a single pass before the datasets are processed.
+
+    Many datasets share the same metadata code, so each metadata file is parsed and cleaned only once, and the processes
+    working on the datasets read its fields from the table (see `lookup_metadata`) instead of parsing the file again.
+    The table is written under a temporary name and renamed when completed.
+
+    Args:
+        metadata_codes (Iterable[str]): Metadata codes of the datasets to process (repeated codes are extracted once).
+        metadata_folder (str): The directory containing the metadata XML files.
+        table_path (str): Path to the SQLite file of the metadata table.
+
+    Returns:
+        int: Number of metadata codes saved in the table (the codes with a missing or invalid XML file are not saved).
+    """
+    os.makedirs(os.path.dirname(table_path) or '.', exist_ok=True)
+    temp_path = f"{table_path}.tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    saved_codes = 0
+    connection = sqlite3.connect(temp_path)
+    try:
+        columns = list(metadata_concepts)
+        connection.execute(f"CREATE TABLE metadata (metadata_code TEXT PRIMARY KEY, {', '.join(f'{column} TEXT' for column in columns)})")
+        insert_query = f"INSERT INTO metadata VALUES ({', '.join('?' * (len(columns) + 1))})"
+        for metadata_code in sorted(set(metadata_codes)):
+            metadata_file_path = os.path.join(metadata_folder, f"{metadata_code}.sdmx.xml")
+            if not os.path.exists(metadata_file_path):
+                logging.warning(f"XML file does not exist: {metadata_file_path}")
+                continue
+            try:
+                connection.execute(insert_query, (metadata_code,) + read_metadata(metadata_file_path))
+                saved_codes += 1
+            except ET.ParseError as e:
+                logging.error(f"Error parsing XML from {metadata_file_path}: {e}")
+        connection.commit()
+    finally:
+        connection.close()
+    read_metadata.cache_clear()  # The fields are read from the table from now on
+
+    os.replace(temp_path, table_path)
+    logging.info(f"Metadata table saved: {saved_codes} metadata codes")
+    return saved_codes
+
+@functools.lru_cache(maxsize=None)
+def metadata_table_connection(table_path: str) -> sqlite3.Connection:
+    # Read-only connection to the metadata table, opened once per process
+    return sqlite3.connect(f"file:{os.path.abspath(table_path)}?mode=ro", uri=True)
+
+def lookup_metadata(table_path: str, metadata_code: str) -> Optional[Tuple[Optional[str], ...]]:
+    """
+    Read the metadata fields of a metadata code from the metadata table built by `build_metadata_table`.
+
+    Args:
+        table_path (str): Path to the SQLite file of the metadata table.
+        metadata_code (str): The metadata code.
+
+    Returns:
+        Optional[Tuple[Optional[str], ...]]: The fields of `metadata_concepts`, or None if the code is not in the table.
+    """
+    query = f"SELECT {', '.join(metadata_concepts)} FROM metadata WHERE metadata_code = ?"
+    return metadata_table_connection(table_path).execute(query, (metadata_code,)).fetchone()
+
+def load_definitions(reference_csv_path: str) -> Dict[str, str]:
+    """
+    Read the dataset definitions (labels) saved by the extraction, once for every dataset processed.
+
+    Args:
+        reference_csv_path (str): Path to the CSV file containing the data codes and their definitions.
+
+    Returns:
+        Dict[str, str]: Definition of each data code (empty if the file does not exist).
+    """
+    if not os.path.exists(reference_csv_path):
+        logging.warning(f"Dataset definitions file does not exist: {reference_csv_path}")
+        return {}
+    with open(reference_csv_path, mode='r', encoding='utf-8', newline='') as reference_file:
+        return {row[0]: row[1] for row in csv.reader(reference_file) if len(row) > 1}
+
 def process_file(
     data_code: str,
     metadata_code: str,
     data_folder: str,
     metadata_folder: str,
-    output_folder: str
+    output_folder: str,
+    storage_format: str = 'csv',
+    metadata_table: Optional[str] = None,
+    dataset_name: Optional[str] = None
 ) -> None:
     """
     Process data and metadata files, and write the results to a CSV file.
 
     Args:
-        data_code (str): The data code used to locate the JSON file.
+        data_code (str): The data code used to locate the data file.
         metadata_code (str): The metadata code used to locate the XML file.
-        data_folder (str): The directory containing the data JSON files.
+        data_folder (str): The directory containing the raw data files (Parquet, or JSON saved by previous versions).
         metadata_folder (str): The directory containing the metadata XML files.
         output_folder (str): The directory where the output CSV file will be saved.
+        storage_format (str): Storage format of the output file ('csv', 'arrow' or 'parquet').
+        metadata_table (Optional[str]): Path to the metadata table built by `build_metadata_table`. If not given,
+                                        the metadata fields are read from the XML file.
+        dataset_name (Optional[str]): Definition of the dataset, saved in the 'dataset_name' column of the indicator
+                                      dimension dictionary (the column is not added if the dataset has no definition).
 
     Returns:
         None
     """
-    # Define the namespaces used in the XML
-    namespaces = {
-        'genericmetadata': 'http://www.SDMX.org/resources/SDMXML/schemas/v2_0/genericmetadata',
-        'common': 'http://www.SDMX.org/resources/SDMXML/schemas/v2_0/common'
-    }
-
-    data_file_path = os.path.join(data_folder, f"{data_code}.json")
+    data_file_path = raw_data_path(data_folder, data_code)
     metadata_file_path = os.path.join(metadata_folder, f"{metadata_code}.sdmx.xml")
 
     if not os.path.exists(data_file_path):
-        logging.warning(f"JSON file does not exist: {data_file_path}")
-        return
-
-    if not os.path.exists(metadata_file_path):
-        logging.warning(f"XML file does not exist: {metadata_file_path}")
+        logging.warning(f"Data file does not exist: {data_file_path}")
         return
 
-    os.makedirs(output_folder, exist_ok=True)
-    output_csv = os.path.join(output_folder, f"{data_code}.csv")
-
-    with open(output_csv, 'w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow(['data_code', 'metadata_code', 'value', 'unit', 'time', 'description', 'source', 'calculation', 'units_description'])
-
-        with open(data_file_path, 'r', encoding='utf-8') as datafile:
-            try:
-                json_str = datafile.read().strip()
-
-                if json_str.startswith('"') and json_str.endswith('"'):
-                    json_str = json_str[1:-1]
+    if metadata_table is not None:
+        metadata = lookup_metadata(metadata_table, metadata_code)
+        if metadata is None:
+            logging.warning(f"No metadata for {metadata_code} in the metadata table: {metadata_file_path}")
+            return
+    else:
+        if not os.path.exists(metadata_file_path):
+            logging.warning(f"XML file does not exist: {metadata_file_path}")
+            return
 
-                json_str = json_str.replace('\\"', '"')
-
-                data = json.loads(json_str)
-            except json.JSONDecodeError as e:
-                logging.error(f"Error decoding JSON from {data_file_path}: {e}")
-                return
-
-            if not isinstance(data, list):
-                logging.error(f"Unexpected JSON format in {data_file_path}. Expected a list.")
-                return
-
-            for record in data:
-                if not isinstance(record, dict):
-                    logging.error(f"Unexpected record format in {data_file_path}: {record}")
-                    continue
-
-                value = record.get('values', None)
-                unit = record.get('unit', None)
-                time = record.get('time', None)
+        try:
+            metadata = read_metadata(metadata_file_path)  # Parsed once, not once per record
+        except ET.ParseError as e:
+            logging.error(f"Error parsing XML from {metadata_file_path}: {e}")
+            return
 
-                try:
-                    # Usar xml.etree.ElementTree para parsear el XML
-                    tree = ET.parse(metadata_file_path)
-                    root = tree.getroot()
+    os.makedirs(output_folder, exist_ok=True)
+    output_csv = pf.data_file_path(os.path.join(output_folder, data_code), storage_format)
+    started = time.perf_counter()
+
+    # The indicator columns are saved once per distinct value in the dimension dictionary sidecar
+    indicator_cols = ['data_code', 'metadata_code', 'unit'] + list(metadata_concepts)
+    indicator_keys = {}
+    if dataset_name is not None:
+        indicator_cols.append('dataset_name')
+        metadata += (dataset_name,)
+
+    records = read_raw_data(data_file_path)
+    if records is None:
+        return
 
-                    # Usar el namespace correcto en las consultas XPath
-                    description = extract_text(root, ".//genericmetadata:ReportedAttribute[@conceptID='DATA_DESCR']/genericmetadata:Value", namespaces)
-                    source = extract_text(root, ".//genericmetadata:ReportedAttribute[@conceptID='CONTACT_ORGANISATION']/genericmetadata:Value", namespaces)
-                    calculation = extract_text(root, ".//genericmetadata:ReportedAttribute[@conceptID='DATA_COMP']/genericmetadata:Value", namespaces)
-                    units_description = extract_text(root, ".//genericmetadata:ReportedAttribute[@conceptID='UNIT_MEASURE']/genericmetadata:Value", namespaces)
-                except ET.ParseError as e:
-                    logging.error(f"Error parsing XML from {metadata_file_path}: {e}")
-                    continue
+    rows = []
+    for value, unit, time_period in records:
+        id_indicator = pf.encode(indicator_keys, (data_code, metadata_code, unit) + metadata)
+        rows.append([id_indicator, value, time_period])
 
-                writer.writerow([data_code, metadata_code, value, unit, time, description, source, calculation, units_description])
+    written_rows = pf.write_table(output_csv, [pf.dimension_key_columns['indicator'], 'value', 'time'], rows, storage_format, delimiter=',')
+    pf.write_dims(output_csv, {'indicator': (indicator_cols, indicator_keys)})
+    pf.report_throughput(f"Eurostat {data_code}", written_rows, started, output_csv)
 
 def process_data_and_metadata(
     data_csv: str,
     data_folder: str,
     metadata_folder: str,
-    output_folder: str
+    output_folder: str,
+    storage_format: str = 'csv',
+    unchanged: AbstractSet[str] = frozenset(),
+    metadata_table: str = s.eurostat_metadata_table,
+    max_workers: Optional[int] = s.eurostat_max_workers,
+    definitions_csv: str = s.eurostat_dataset_def
 ) -> None:
     """
     Process data and metadata files based on the information provided in a CSV file.
 
-    This function reads data codes and metadata codes from a CSV file, then processes each pair of codes by calling 
-    the `process_file` function. It utilizes concurrent processing to handle multiple files in parallel.
+    This function reads data codes and metadata codes from a CSV file, extracts the metadata fields of every metadata code
+    into the metadata table (`build_metadata_table`), then processes each pair of codes by calling the `process_file` function,
+    which saves the definition of the dataset along with its metadata fields. It utilizes concurrent processing to handle
+    multiple files in parallel.
 
     Args:
         data_csv (str): Path to the CSV file containing data codes and metadata codes.
         data_folder (str): Path to the folder containing data JSON files.
         metadata_folder (str): Path to the folder containing metadata XML files.
         output_folder (str): Path to the folder where output CSV files will be saved.
+        storage_format (str): Storage format of the output files ('csv', 'arrow' or 'parquet').
+        unchanged (AbstractSet[str]): Data codes of the datasets unchanged since the previous extraction, which are not
+                                      processed again if their output file exists.
+        metadata_table (str): Path to the SQLite file of the metadata table, read by the processes.
+        max_workers (Optional[int]): Number of processes (None: one per CPU).
+        definitions_csv (str): Path to the CSV file containing the dataset definitions, read once before the processing.
 
     Returns:
         None
@@ -179,11 +482,17 @@ def process_data_and_metadata(
             metadata_code = row[1] if len(row) > 1 else None
 
             if data_code and metadata_code and 'BulkDownloadListing' not in metadata_code:
+                if data_code in unchanged and os.path.exists(pf.data_file_path(os.path.join(output_folder, data_code), storage_format)):
+                    continue  # Skip the datasets which have not changed since they were processed
                 data_codes.append((data_code, metadata_code))
 
-    # Limit the number of processes to 4 or adjust according to your system
-    with concurrent.futures.ProcessPoolExecutor(max_workers=4) as executor:
-        futures = [executor.submit(process_file, data_code, metadata_code, data_folder, metadata_folder, output_folder)
+    build_metadata_table((metadata_code for _, metadata_code in data_codes), metadata_folder, metadata_table)
+    definitions = load_definitions(definitions_csv)
+
+    # The number of processes is set in the settings ('eurostat_max_workers'), one per CPU by default
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(process_file, data_code, metadata_code, data_folder, metadata_folder, output_folder, storage_format,
+                                   metadata_table, definitions.get(data_code))
                    for data_code, metadata_code in data_codes]
         try:
             for future in concurrent.futures.as_completed(futures):
@@ -193,65 +502,11 @@ def process_data_and_metadata(
             executor.shutdown(wait=False)  # Optionally, you can set wait=True to wait for currently running tasks to finish
             sys.exit(1)
 
-def add_definition_to_csv_files(
-    input_folder: str,
-    reference_csv_path: str,
-    output_folder: str
-) -> None:
-    """
-    Add dataset definitions from a reference CSV file to multiple CSV files in a specified input folder.
-
-    This function reads a reference CSV file to get dataset definitions, then it iterates over all CSV files in the
-    input folder, adding a 'dataset_name' column with the corresponding definitions if a match is found.
-
-    Args:
-        input_folder (str): Path to the folder containing input CSV files.
-        reference_csv_path (str): Path to the CSV file containing dataset definitions.
-        output_folder (str): Path to the folder where modified CSV files will be saved.
-
-    Returns:
-        None
-    """
-    # Read the reference file
-    reference_dict = {}
-    with open(reference_csv_path, mode='r', encoding='utf-8') as reference_file:
-        reference_reader = csv.reader(reference_file)
-        for row in reference_reader:
-            if row: 
-                reference_dict[row[0]] = row[1]
-
-
-    os.makedirs(output_folder, exist_ok=True)
-
-    for root, _, files in os.walk(input_folder):
-        for file in files:
-            if file.endswith('.csv'):
-                file_path = os.path.join(root, file)
-                file_name = os.path.splitext(file)[0]
-
-                with open(file_path, mode='r', encoding='utf-8') as input_file:
-                    reader = csv.reader(input_file)
-                    rows = list(reader)
-
-                if file_name in reference_dict:
-                    definition = reference_dict[file_name]
-                    if rows:
-                        rows[0].append('dataset_name')
-                        for row in rows[1:]:
-                            row.append(definition)
-
-                    output_path = os.path.join(output_folder, file)
-                    with open(output_path, mode='w', newline='', encoding='utf-8') as output_file:
-                        writer = csv.writer(output_file)
-                        writer.writerows(rows)
-    print("Process completed")    
-
 def main() -> None:
     """
-    Main function to process data and metadata, and update CSV files with dataset definitions.
+    Main function to process data and metadata, with the dataset definitions.
 
-    This function processes data and metadata files by calling `process_data_and_metadata`, 
-    then adds dataset definitions to CSV files using `add_definition_to_csv_files`.
+    This function processes data and metadata files by calling `process_data_and_metadata`.
 
     Args:
         None
@@ -267,15 +522,12 @@ def main() -> None:
     
     try:
         logging.info("Starting merge")
-        process_data_and_metadata(data_csv, data_folder, metadata_folder, output_folder)
+        process_data_and_metadata(data_csv, data_folder, metadata_folder, output_folder, s.eurostat_storage_format,
+                                  hc.load_unchanged(s.eurostat_http_cache))
     except KeyboardInterrupt:
         logging.info("Main process interrupted by user.")
         sys.exit(1)
     logging.info("Merge completed.")
-    
-    logging.info("Starting data completion.")
-    add_definition_to_csv_files(s.eurostat_processed_data, s.eurostat_dataset_def, s.eurostat_processed_data)
-    logging.info("Data completion completed.")
 
 if __name__ == "__main__":
     main()
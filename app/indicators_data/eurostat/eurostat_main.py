@@ -1,5 +1,5 @@
 from data_extraction import eurostat_client_data, eurostat_get_metadata
-from data_processing import eurostat_datacodes, extract_xml_files, eurostat_join_codes, eurostat_final_data
+from data_processing import eurostat_datacodes, eurostat_join_codes, eurostat_final_data
 
 
 def eurostat_main():
@@ -22,14 +22,14 @@ def eurostat_main():
     # Pause execution here until the user types 'continue'
     user_input = input(
     "Metadata automatically downloaded. Please add the remaining files that could not be downloaded automatically.\n"
-    "Check the manual links in eurostat/eurostat_data/eurostat_comp_files/manual_metadata.csv.\n"
+    "Check the manual links in eurostat/eurostat_data/eurostat_comp_files/manual_metadata.csv, and save the .zip files in eurostat/eurostat_metadata.\n"
     "Type 'continue' to proceed: ")
     while user_input.lower() != "continue":
         user_input = input("Please type 'continue' to proceed: ")
 
 
     try:
-        extract_xml_files.main()
+        eurostat_get_metadata.extract_manual_metadata()
     except Exception as e:
         print(f"Error: {e}")
 
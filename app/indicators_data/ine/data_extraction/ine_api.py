@@ -1,10 +1,10 @@
 import xml.etree.ElementTree as ET
 import json
 from requests.exceptions import JSONDecodeError
-import time
 import os
 import sys
-from typing import Dict, Any
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Any, Iterable, Iterator, Optional, Tuple
 
 import requests
 import logging
@@ -42,139 +42,255 @@ As the root of the project is now in the 'sys.path', it is possible to import th
 
 # Import settings
 import app.utils.settings as s
+import app.utils.http_utils as hu
+import app.utils.http_cache as hc
 
 
-def extract_catalog(host_url: str, lang: str) -> Dict[str, Any]:
+def extract_catalog(host_url: str, lang: str, session: requests.Session, limiter: Optional[hu.TokenBucket] = None) -> Iterator[Dict[str, str]]:
     """
-    Extract catalog data for indicators in XML format and return as JSON data.
+    Extract catalog data for indicators in XML format, yielding each indicator as soon as it is received.
+
+    The XML response is streamed and parsed incrementally, so the memory used does not depend on the catalog size
+    and the indicators can be extracted while the catalog is still being downloaded.
 
     Args:
     - host_url (str): The host URL for the data source.
     - lang (str): The language code for the data.
+    - session (requests.Session): Session shared with the extraction threads (see `http_utils.create_session`).
+    - limiter (Optional[TokenBucket]): Rate limiter of the INE API requests.
 
-    Returns:
-    - Dict[str, Any]: A dictionary containing the catalog data in JSON format.
+    Yields:
+    - Dict[str, str]: The catalog data of each indicator (tag=key, text=value of each child of the <indicator> element).
     """
     url = f"{host_url}/ine/xml_indic.jsp?opc=3&lang={lang}" # Create the custom download link for indicators catalog
-    response = requests.get(url) # Make a request to get the catalog data
-    root = ET.fromstring(response.content) # ElementTree module to parse the data put it in a ET element (root is the higher level)
-    catalog_data = {} 
-    indicators = [] 
-# Create a JSON dict with the XML data
-    for indicator in root.findall('.//indicator'): # Find all <indicator> elements in the tree
-        indicator_data = {}
-        for child in indicator:
-            indicator_data[child.tag] = child.text # From all childs in each indicator tag=key, text=value in the dict.
-        indicators.append(indicator_data) # Append each indicator data dict. in a list
-    catalog_data["indicators"] = indicators # Create a dic including the list with indicators dicts.
-    return catalog_data
-
-
-def save_catalog(save_path: str, filename: str, catalog_data: Dict[str, Any]) -> None:
+    with hu.get(session, url, limiter, timeout=s.ine_request_timeout, stream=True) as response: # Make a streamed request to get the catalog data
+        response.raise_for_status()
+        response.raw.decode_content = True # Decompress the body (gzip, deflate) while it is read
+        events = ET.iterparse(response.raw, events=("start", "end")) # Parse the XML elements as they arrive
+        _, root = next(events) # The root element is kept to release the indicators already parsed
+        for event, element in events:
+            if event == "end" and element.tag == "indicator":
+                yield {child.tag: child.text for child in element} # From all childs in each indicator tag=key, text=value in the dict.
+                root.clear()
+
+
+def save_catalog(save_path: str, filename: str, indicators: Iterable[Dict[str, str]]) -> Iterator[Dict[str, str]]:
     """
-    Save the extracted catalog data to a JSON file.
+    Save the extracted catalog data to a JSON file while it is being extracted, yielding again each indicator.
 
     Args:
     - save_path (str): Path where indicators catalog is saved.
-    - catalog_data (Dict[str, Any]): The catalog data to save. JSON dict.
+    - filename (str): Name of the catalog file.
+    - indicators (Iterable[Dict[str, str]]): The catalog data of each indicator, as yielded by `extract_catalog`.
+
+    Yields:
+    - Dict[str, str]: The catalog data of each indicator, once written to the catalog file.
     """
     os.makedirs(save_path, exist_ok=True) # Create the folder if it doesn't exist
-    with open(os.path.join(save_path, filename), "w", encoding="utf-8") as catalog_file:
-        json.dump(catalog_data, catalog_file, indent=4, ensure_ascii=False) # Dump content avoiding ascii sequences
-    print("Catalog of indicators saved in catalogo_indicadores.json")
+    catalog_path = os.path.join(save_path, filename)
+    temp_path = f"{catalog_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as catalog_file:
+        # Same layout as json.dump(..., indent=4) of {"indicators": [...]}, written one indicator at a time
+        catalog_file.write('{\n    "indicators": [')
+        separator = "\n"
+        for indicator in indicators:
+            indicator_json = json.dumps(indicator, indent=4, ensure_ascii=False) # Dump content avoiding ascii sequences
+            catalog_file.write(separator + "\n".join(f"        {line}" for line in indicator_json.splitlines()))
+            separator = ",\n"
+            yield indicator
+        catalog_file.write("\n    ]\n}" if separator != "\n" else "]\n}")
+    os.replace(temp_path, catalog_path)
+    print(f"Catalog of indicators saved in {catalog_path}")
+
+
+def fetch_json(url: str, description: str, session: requests.Session, limiter: Optional[hu.TokenBucket] = None, cache: Optional[hc.HttpCache] = None, revalidate: bool = False) -> Tuple[Optional[Any], bool]:
+    """
+    Fetch a JSON file from the INE API, with a conditional request if an HTTP cache is given.
 
+    Args:
+    - url (str): URL of the JSON file.
+    - description (str): Description of the file for the log messages.
+    - session (requests.Session): Session shared by the extraction threads (see `http_utils.create_session`).
+    - limiter (Optional[TokenBucket]): Rate limiter of the INE API requests.
+    - cache (Optional[HttpCache]): HTTP cache of the INE extraction, where the validators of the file are saved.
+    - revalidate (bool): Whether to check if the file has changed (the file was already saved in a previous extraction).
 
-def extract_data(host_url: str, varcd_cod: str, lang: str) -> Dict[str, Any]:
-    """
-    Extract data for a specific indicator.
+    Returns:
+    - Tuple[Optional[Any], bool]: The JSON content (None if the file could not be fetched or it has not changed),
+      and whether the file has not changed since the previous extraction.
     """
-    url = f"{host_url}/ine/json_indicador/pindica.jsp?op=2&varcd={varcd_cod}&lang={lang}"
-    response = requests.get(url)
+    if cache is None:
+        response = hu.get(session, url, limiter, timeout=s.ine_request_timeout)
+    else:
+        response = hu.conditional_get(session, url, cache, revalidate, limiter, timeout=s.ine_request_timeout)
+        if revalidate and cache.is_unchanged(url, response):
+            return None, True
 
     if response.status_code != 200:
-        logging.error(f"Failed to fetch data for varcd {varcd_cod}. Status code: {response.status_code}")
-        return None  # Return None if the response is not successful (i.e., not 200)
+        logging.error(f"Failed to fetch {description}. Status code: {response.status_code}")
+        return None, False  # Return None if the response is not successful (i.e., not 200)
 
     try:
-        return response.json()
+        content = response.json()
     except JSONDecodeError as e:
-        logging.error(f"Failed to decode JSON for varcd {varcd_cod}: {e}")
+        logging.error(f"Failed to decode JSON for {description}: {e}")
         logging.error(f"Response content: {response.text}")
-        return None
+        return None, False
 
+    if cache is not None:
+        cache.store(url, response.headers, hc.content_digest(response.content))
+    return content, False
 
-def extract_metadata(host_url:str, varcd_cod: str, lang: str) -> Dict[str, Any]:
+
+def extract_data(host_url: str, varcd_cod: str, lang: str, session: requests.Session, limiter: Optional[hu.TokenBucket] = None, cache: Optional[hc.HttpCache] = None, revalidate: bool = False) -> Tuple[Optional[Dict[str, Any]], bool]:
     """
-    Extract metadata for a specific indicator.
+    Extract data for a specific indicator.
 
     Args:
     - host_url (str): The host URL for the data source.
     - varcd_cod (str): The variable code for the indicator.
-    - lang (str): The language code for the metadata.
+    - lang (str): The language code for the data.
+    - session (requests.Session): Session shared by the extraction threads (see `http_utils.create_session`).
+    - limiter (Optional[TokenBucket]): Rate limiter of the INE API requests.
+    - cache (Optional[HttpCache]): HTTP cache of the INE extraction.
+    - revalidate (bool): Whether to check if the data has changed since the previous extraction.
 
     Returns:
-    - Dict[str, Any]: The extracted metadata.
+    - Tuple[Optional[Dict[str, Any]], bool]: The extracted data (None if it could not be fetched or it has not changed),
+      and whether it has not changed.
     """
-    url = f"{host_url}/ine/json_indicador/pindicaMeta.jsp?varcd={varcd_cod}&lang={lang}" # Complete custom url
-    response = requests.get(url)
-    return response.json()
+    url = f"{host_url}/ine/json_indicador/pindica.jsp?op=2&varcd={varcd_cod}&lang={lang}"
+    return fetch_json(url, f"data for varcd {varcd_cod}", session, limiter, cache, revalidate)
 
 
-def get_save_data(save_path: str, catalog_data: Dict[str, Any], lang: str) -> None:
+def extract_metadata(host_url:str, varcd_cod: str, lang: str, session: requests.Session, limiter: Optional[hu.TokenBucket] = None, cache: Optional[hc.HttpCache] = None, revalidate: bool = False) -> Tuple[Optional[Dict[str, Any]], bool]:
     """
-    Use the function 'extract_data' and save the data for each indicator in the catalog
+    Extract metadata for a specific indicator.
 
     Args:
-    - catalog_data (Dict[str, Any]): The catalog data containing indicators.
-    - lang (str): The language code for the data.
-    """
-    # Ensure the directory exists
-    os.makedirs(save_path, exist_ok=True)
-    for indicator in catalog_data["indicators"]:
-        varcd_cod = indicator["varcd"]
-        data_path = os.path.join(save_path, f"data_{varcd_cod}.json")
+    - host_url (str): The host URL for the data source.
+    - varcd_cod (str): The variable code for the indicator.
+    - lang (str): The language code for the metadata.
+    - session (requests.Session): Session shared by the extraction threads (see `http_utils.create_session`).
+    - limiter (Optional[TokenBucket]): Rate limiter of the INE API requests.
+    - cache (Optional[HttpCache]): HTTP cache of the INE extraction.
+    - revalidate (bool): Whether to check if the metadata has changed since the previous extraction.
 
-        if os.path.exists(data_path):
-            logging.info(f"Indicator {varcd_cod} files already exist. Skipping...")
-            continue  # Skip to the next indicator if the file already exists
+    Returns:
+    - Tuple[Optional[Dict[str, Any]], bool]: The extracted metadata (None if it could not be fetched or it has not changed),
+      and whether it has not changed.
+    """
+    url = f"{host_url}/ine/json_indicador/pindicaMeta.jsp?varcd={varcd_cod}&lang={lang}" # Complete custom url
+    return fetch_json(url, f"metadata for varcd {varcd_cod}", session, limiter, cache, revalidate)
 
-        data = extract_data(s.ine_url, varcd_cod, lang)
-        if not data:  # Ensure data was successfully extracted
-            logging.warning(f"No data found for indicator {varcd_cod}. Skipping...")
-            continue
 
-        with open(data_path, "w", encoding="utf-8") as data_file:
-            json.dump(data, data_file, indent=4, ensure_ascii=False)
-        logging.info(f"Data from indicator {varcd_cod} saved in {data_path}")
+def save_json(file_path: str, content: Any) -> None:
+    """
+    Save a JSON file, writing it under a temporary name so that an interrupted extraction does not leave incomplete files.
 
-        time.sleep(1)  # Adding a delay to prevent API rate limits
+    Args:
+    - file_path (str): Path of the JSON file.
+    - content (Any): JSON content.
+    """
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as json_file:
+        json.dump(content, json_file, indent=4, ensure_ascii=False) # Dump content avoiding ascii sequences
+    os.replace(temp_path, file_path)
 
 
-def get_save_metadata(save_path: str, catalog_data: Dict[str, Any], lang: str) -> None:
+def get_save_indicator(host_url: str, data_path: str, metadata_path: str, varcd_cod: str, lang: str, session: requests.Session, limiter: Optional[hu.TokenBucket] = None, cache: Optional[hc.HttpCache] = None) -> None:
     """
-    Use the function 'extract_metadata' and save the data for each indicator in the catalog
+    Use the functions 'extract_data' and 'extract_metadata' to fetch and save together the data and metadata of an indicator.
+
+    Without an HTTP cache, the indicators already saved are skipped. With an HTTP cache, the files already saved are
+    requested again with their validators, and the indicator is recorded as unchanged if neither of them has changed.
 
     Args:
-    - catalog_data (Dict[str, Any]): The catalog data containing indicators.
-    - lang (str): The language code for the metadata.
+    - host_url (str): The host URL for the data source.
+    - data_path (str): Folder where the data files are saved.
+    - metadata_path (str): Folder where the metadata files are saved.
+    - varcd_cod (str): The variable code for the indicator.
+    - lang (str): The language code for the data and metadata.
+    - session (requests.Session): Session shared by the extraction threads.
+    - limiter (Optional[TokenBucket]): Rate limiter of the INE API requests.
+    - cache (Optional[HttpCache]): HTTP cache of the INE extraction.
     """
+    data_file_path = os.path.join(data_path, f"data_{varcd_cod}.json")
+    metadata_file_path = os.path.join(metadata_path, f"metadata_{varcd_cod}.json") # Create a custom path to store metadata for each indicator
+    data_exists, metadata_exists = os.path.exists(data_file_path), os.path.exists(metadata_file_path)
+
+    if cache is None and data_exists and metadata_exists:
+        logging.info(f"Indicator {varcd_cod} files already exist. Skipping...")
+        return  # Skip to the next indicator if the files already exist
+
+    data_unchanged = metadata_unchanged = False
+    if cache is not None or not data_exists:
+        data, data_unchanged = extract_data(host_url, varcd_cod, lang, session, limiter, cache, revalidate=data_exists)
+        if not data and not data_unchanged:  # Ensure data was successfully extracted
+            logging.warning(f"No data found for indicator {varcd_cod}.")
+        elif not data_unchanged:
+            save_json(data_file_path, data)
+            logging.info(f"Data from indicator {varcd_cod} saved in {data_file_path}")
+
+    # The metadata is fetched even if the data could not be, as each file is saved independently
+
+    if cache is not None or not metadata_exists:
+        metadata, metadata_unchanged = extract_metadata(host_url, varcd_cod, lang, session, limiter, cache, revalidate=metadata_exists)
+        if metadata is None and not metadata_unchanged:
+            logging.warning(f"No metadata found for indicator {varcd_cod}.")
+        elif not metadata_unchanged:
+            save_json(metadata_file_path, metadata)
+            logging.info(f"Metadata from indicator {varcd_cod} saved in {metadata_file_path}")
+
+    if data_unchanged and metadata_unchanged:
+        cache.mark_unchanged(varcd_cod)
+        logging.info(f"Indicator {varcd_cod} has not changed. Skipping...")
+
+
+def get_save_indicators(host_url: str, data_path: str, metadata_path: str, indicators: Iterable[Dict[str, str]], lang: str, session: requests.Session, limiter: Optional[hu.TokenBucket] = None, max_workers: int = 4, cache: Optional[hc.HttpCache] = None) -> None:
+    """
+    Use the function 'get_save_indicator' to save the data and metadata of each indicator in the catalog, several indicators at a time.
 
-    os.makedirs(save_path, exist_ok=True) # Create the folder if it doesn't exist
-    for indicator in catalog_data["indicators"]:
-        varcd_cod = indicator["varcd"]
-        metadata_path = os.path.join(save_path, f"metadata_{varcd_cod}.json") # Create a custom path to store data for each indicator
-
-        if os.path.exists(metadata_path):
-            print(f"Indicator {varcd_cod} files already exists. Skipping...")
-            continue
-
-        metadata = extract_metadata(s.ine_url, varcd_cod, lang) # Extract data for each indicator
+    The indicators are submitted to the threads as they are read from the catalog, keeping a bounded number of them pending.
+    The threads share a keep-alive session, which retries the failed requests with exponential backoff,
+    and a token bucket which limits the rate of requests sent to the INE API.
 
-        with open(metadata_path, "w", encoding="utf-8") as metadata_file:
-            json.dump(metadata, metadata_file, indent=4, ensure_ascii=False) # Store the metadata in the custom indicator's data path
-        print(f"Metadata from indicator {varcd_cod} saved in {metadata_path}")
+    Args:
+    - host_url (str): The host URL for the data source.
+    - data_path (str): Folder where the data files are saved.
+    - metadata_path (str): Folder where the metadata files are saved.
+    - indicators (Iterable[Dict[str, str]]): The catalog data of each indicator.
+    - lang (str): The language code for the data and metadata.
+    - session (requests.Session): Session shared by the extraction threads (see `http_utils.create_session`).
+    - limiter (Optional[TokenBucket]): Rate limiter of the INE API requests.
+    - max_workers (int): Maximum number of indicators extracted at a time.
+    - cache (Optional[HttpCache]): HTTP cache of the INE extraction, shared by the threads.
+    """
+    os.makedirs(data_path, exist_ok=True) # Create the folders if they don't exist
+    os.makedirs(metadata_path, exist_ok=True)
+
+    def check_results(done: Iterable[Future]) -> None:
+        for future in done:
+            varcd_cod = pending.pop(future)
+            try:
+                future.result()
+            except Exception as e:
+                # A failed indicator (request, malformed response or write error) does not stop the extraction
+                logging.error(f"Failed to extract indicator {varcd_cod}: {e!r}")
+                failed.append(varcd_cod)
+
+    pending, failed = {}, []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for indicator in indicators:
+            if len(pending) >= 2 * max_workers: # Wait for a thread before reading more indicators from the catalog
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                check_results(done)
+            future = executor.submit(get_save_indicator, host_url, data_path, metadata_path, indicator["varcd"], lang, session, limiter, cache)
+            pending[future] = indicator["varcd"]
+        check_results(list(wait(pending).done))
+    if failed:
+        print(f"{len(failed)} indicators could not be extracted: {', '.join(failed)}")
 
-        time.sleep(1)
 
 def main():
     """
@@ -182,10 +298,18 @@ def main():
     """
     # Indicate language: PT or EN
     lang = "PT"
-    catalog_data = extract_catalog(host_url=s.ine_url, lang=lang)
-    save_catalog(save_path=s.ine_catalog_path, filename=s.ine_catalog_filename, catalog_data=catalog_data)
-    get_save_data(save_path=s.ine_data_path, catalog_data=catalog_data, lang=lang)
-    get_save_metadata(save_path=s.ine_metadata_path, catalog_data=catalog_data, lang=lang)
+    # The catalog download keeps one connection of the session while the indicators are extracted
+    session = hu.create_session(max_connections=s.ine_max_workers + 1)
+    limiter = hu.TokenBucket(s.ine_requests_per_second)
+    cache = hc.HttpCache(s.ine_http_cache)
+    with session:
+        try:
+            indicators = extract_catalog(host_url=s.ine_url, lang=lang, session=session, limiter=limiter)
+            indicators = save_catalog(save_path=s.ine_catalog_path, filename=s.ine_catalog_filename, indicators=indicators)
+            get_save_indicators(host_url=s.ine_url, data_path=s.ine_data_path, metadata_path=s.ine_metadata_path, indicators=indicators,
+                                lang=lang, session=session, limiter=limiter, max_workers=s.ine_max_workers, cache=cache)
+        finally:
+            cache.save() # The indicators which have not changed are skipped by the processing scripts
 
 
 if __name__ == "__main__":
@@ -1,9 +1,76 @@
+# The staging area is dictionary-encoded: repeated indicator, geography and attribute strings are
+# stored once in their own TEMP tables and every value row only keeps their integer keys.
+
+CREATE_TEMP_STG_INDICATOR = """
+CREATE TEMP TABLE IF NOT EXISTS stg_indicator(
+    id_stg_indicator INTEGER PRIMARY KEY,
+    name_indicator TEXT,
+    description TEXT,
+    units TEXT,
+    units_desc TEXT,
+    calculation TEXT,
+    source TEXT,
+    source_code TEXT,
+    value_tag TEXT
+);
+"""
+
+CREATE_TEMP_STG_GEO = """
+CREATE TEMP TABLE IF NOT EXISTS stg_geo(
+    id_stg_geo INTEGER PRIMARY KEY,
+    nuts1 TEXT,
+    nuts2 TEXT,
+    nuts3 TEXT,
+    geocode TEXT,
+    type TEXT,
+    distrito TEXT,
+    concelho TEXT,
+    freguesia TEXT
+);
+"""
+
+CREATE_TEMP_STG_ATTRIBUTE = """
+CREATE TEMP TABLE IF NOT EXISTS stg_attribute(
+    id_stg_attribute INTEGER PRIMARY KEY,
+    attributes TEXT,
+    name_attribute TEXT,
+    value_attribute TEXT
+);
+"""
+
+CREATE_TEMP_STAGGING_TABLE = """
+CREATE TEMP TABLE IF NOT EXISTS stg_table(
+    id_stg_indicator INTEGER,
+    id_stg_geo INTEGER,
+    id_stg_attribute INTEGER,
+    timecode TEXT,
+    data_value REAL
+);
+"""
+
+INSERT_STG_INDICATOR = """
+INSERT INTO stg_indicator (
+    name_indicator, description, units, units_desc,
+    calculation, source, source_code, value_tag
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+INSERT_STG_GEO = """
+INSERT INTO stg_geo (
+    nuts1, nuts2, nuts3, geocode, type,
+    distrito, concelho, freguesia
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+INSERT_STG_ATTRIBUTE = """
+INSERT INTO stg_attribute (
+    attributes, name_attribute, value_attribute
+) VALUES (?, ?, ?)
+"""
+
 INSERT_DATA_STAGGING = """
 INSERT INTO stg_table (
-    nuts1, nuts2, nuts3, geocode, type, distrito, 
-    concelho, freguesia, timecode, data_value, 
-    name_indicator, description, units, units_desc, 
-    calculation, source, source_code, attributes, 
-    name_attribute, value_attribute, value_tag
-) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    id_stg_indicator, id_stg_geo, id_stg_attribute,
+    timecode, data_value
+) VALUES (?, ?, ?, ?, ?)
 """
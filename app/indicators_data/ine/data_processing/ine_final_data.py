@@ -1,9 +1,9 @@
-import csv
 import re
 import os
 import sys
-import json
-from typing import Dict, Any, Union, List, Tuple
+import time
+from functools import lru_cache
+from typing import AbstractSet, Callable, Union, List, Mapping, Tuple
 
 import logging
 
@@ -40,6 +40,9 @@ As the root of the project is now in the 'sys.path', it is possible to import th
 
 # Import settings
 import app.utils.settings as s
+import app.utils.processed_files as pf
+import app.utils.geo_index as gi
+import app.utils.http_cache as hc
 
 def get_timecode_area(headers: List[str]) -> Tuple[Union[int, None], Union[int, None]]:
     """
@@ -72,68 +75,28 @@ def clean_timecode(row: List[str], timecode_idx: int) -> str:
     return timecode
 
 
-def load_nuts_data(nuts_path: str) -> Dict[str, Any]:
-    """
-    Loads NUTS data from a JSON file.
-
-    Args:
-        nuts_path (str): Path to the JSON file containing NUTS data.
-
-    Returns:
-        Dict[str, Any]: NUTS data loaded from the file.
-    """
-    with open(nuts_path, 'r', encoding='utf-8') as nuts_file:
-        return json.load(nuts_file)
-
-
-def load_dicofre_data(dicofre_path: str) -> Dict[str, Any]:
-    """
-    Loads DICOFRE data from a JSON file.
-
-    Args:
-        dicofre_path (str): Path to the JSON file containing DICOFRE data.
-
-    Returns:
-        Dict[str, Any]: DICOFRE data loaded from the file.
-    """
-    with open(dicofre_path, 'r', encoding='utf-8') as dicofre_file:
-        return json.load(dicofre_file)
-
-
-def match_location(name: str, dicofre_data: Dict[str, Dict[str, str]]) -> Tuple[str, str, str]:
+def match_location(name: str, location_index: Mapping[str, Tuple[str, str, str]]) -> Tuple[str, str, str]:
     """
     Matches a name with the location in the DICOFRE data.
 
     Args:
         name (str): Name of the location to match.
-        dicofre_data (Dict[str, Dict[str, str]]): DICOFRE data.
+        location_index (Mapping[str, Tuple[str, str, str]]): Location of each freguesia, concelho and distrito name (gazetteer 'location_name' table).
 
     Returns:
         Tuple[str, str, str]: Tuple containing district, municipality, and parish.
     """
-    for key, value in dicofre_data.items():
-        if name == value["freguesia"]:
-            return value["distrito"], value["concelho"], value["freguesia"]
-    
-    for key, value in dicofre_data.items():
-        if name == value["concelho"]:
-            return value["distrito"], value["concelho"], "undefined"
-    
-    for key, value in dicofre_data.items():
-        if name == value["distrito"]:
-            return value["distrito"], "undefined", "undefined"
-    
-    return "undefined", "undefined", "undefined"
-
-
-def match_nuts_location(area: str, dicofre_data: Dict[str, Dict[str, str]], nuts_dict: Dict[str, Dict[str, Dict[str, Union[Dict[str, str], List[str]]]]]) -> Tuple[str, str, str, str, str, str]:
+    return location_index.get(gi.normalise_name(name), ("undefined", "undefined", "undefined"))
+
+
+def match_nuts_location(area: str, location_index: Mapping[str, Tuple[str, str, str]], nuts_index: Mapping[str, Tuple[str, str, str]]) -> Tuple[str, str, str, str, str, str]:
     """
     Matches an area with the corresponding NUTS location in the DICOFRE and NUTS data.
 
     Args:
         area (str): Name of the area to match.
-        dicofre_data (Dict[str, Dict[str, str]]): DICOFRE data.
-        nuts_dict (Dict[str, Dict[str, Dict[str, Union[Dict[str, str], List[str]]]]]): NUTS data.
+        location_index (Mapping[str, Tuple[str, str, str]]): Location of each freguesia, concelho and distrito name (gazetteer 'location_name' table).
+        nuts_index (Mapping[str, Tuple[str, str, str]]): NUTS regions of each municipality or NUTS region name (gazetteer 'nuts_area' table).
 
     Returns:
         Tuple[str, str, str, str, str, str]: Tuple containing district, municipality, parish, and NUTS codes.
@@ -145,76 +108,130 @@ def match_nuts_location(area: str, dicofre_data: Dict[str, Dict[str, str]], nuts
     elif area == 'Centro':
         area = 'Centro Region'
 
-    nuts1 = 'undefined'
-    nuts2 = 'undefined'
-    nuts3 = 'undefined'
-
-    distrito, concelho, freguesia = match_location(area, dicofre_data)
+    distrito, concelho, freguesia = match_location(area, location_index)
 
     if concelho != 'undefined':
         area = concelho
 
-    for nuts1_region, nuts1_info in nuts_dict.items():
-        for region_nuts2, nuts2_info in nuts1_info.get("NUTS 2", {}).items():
-            for nuts3_region, nuts3_data in nuts2_info.get("NUTS 3", {}).items():
-                if area in nuts3_data.get("Municipalities", []):
-                    return distrito, concelho, freguesia, nuts1_region, region_nuts2, nuts3_region
-                elif area == region_nuts2:
-                    return distrito, concelho, freguesia, nuts1_region, region_nuts2, nuts3
-                elif area == nuts1_region:
-                    return distrito, concelho, freguesia, nuts1_region, nuts2, nuts3
+    nuts1, nuts2, nuts3 = nuts_index.get(gi.normalise_name(area), (area, 'undefined', 'undefined'))
+    return distrito, concelho, freguesia, nuts1, nuts2, nuts3
 
-    return distrito, concelho, freguesia, area, nuts2, nuts3
 
+def area_resolver(location_index: Mapping[str, Tuple[str, str, str]], nuts_index: Mapping[str, Tuple[str, str, str]], cache_size: int) -> Callable[[str], Tuple[str, str, str, str, str, str]]:
+    """
+    Returns a memoised version of `match_nuts_location`, keyed by the normalised area name.
 
-def main(final_data_path: str, dicofre_path: str, nuts_path: str) -> None:
+    There are only a few thousand distinct area names, so each of them is resolved once per run instead of once per row.
+
+    Args:
+        location_index (Mapping[str, Tuple[str, str, str]]): Location of each freguesia, concelho and distrito name (gazetteer 'location_name' table).
+        nuts_index (Mapping[str, Tuple[str, str, str]]): NUTS regions of each municipality or NUTS region name (gazetteer 'nuts_area' table).
+        cache_size (int): Maximum number of area names kept in memory (least recently used names are discarded first).
+
+    Returns:
+        Callable[[str], Tuple[str, str, str, str, str, str]]: Function returning the location and NUTS regions of an area name,
+                                                             with the cache statistics available through its `cache_info()` method.
+    """
+    @lru_cache(maxsize=cache_size)
+    def resolve_normalised_area(area: str) -> Tuple[str, str, str, str, str, str]:
+        return match_nuts_location(area, location_index, nuts_index)
+
+    def resolve_area(area: str) -> Tuple[str, str, str, str, str, str]:
+        return resolve_normalised_area(gi.normalise_name(area))
+
+    resolve_area.cache_info = resolve_normalised_area.cache_info
+    return resolve_area
+
+
+def report_cache_stats(resolve_area: Callable[[str], Tuple[str, str, str, str, str, str]]) -> None:
+    """
+    Prints the statistics of the area names cache.
+
+    Args:
+        resolve_area (Callable[[str], Tuple[str, str, str, str, str, str]]): Function returned by `area_resolver`.
+    """
+    cache_info = resolve_area.cache_info()
+    lookups = cache_info.hits + cache_info.misses
+    hit_rate = cache_info.hits / lookups * 100 if lookups else 0.0
+    print(f"INE area cache: {lookups} lookups, {cache_info.hits} hits, {cache_info.misses} misses ({hit_rate:.1f}% hit rate), "
+          f"{cache_info.currsize}/{cache_info.maxsize} area names cached")
+
+
+def main(final_data_path: str, gazetteer_path: str, dicofre_path: str, zipcode_path: str, nuts_path: str, storage_format: str = 'csv', area_cache_size: int = 4096, unchanged: AbstractSet[str] = frozenset()) -> None:
     """
     Processes CSV files in the final_data_path directory, adding location and NUTS information.
 
+    The area, location, NUTS and indicator columns are saved once per distinct value in the dimension dictionary
+    sidecar of each file, and the rows only keep their integer keys ('id_geo', 'id_indicator').
+
     Args:
         final_data_path (str): Path of the directory containing the CSV files to process.
-        dicofre_dict (Dict[str, Dict[str, str]]): DICOFRE data.
-        nuts_dict (Dict[str, Dict[str, Dict[str, Union[Dict[str, str], List[str]]]]]): NUTS data.
+        gazetteer_path (str): Path to the gazetteer with the location and NUTS indexes (see `geo_index.open_gazetteer`).
+        dicofre_path (str): Path to the JSON file containing DICOFRE data (compiled into the gazetteer).
+        zipcode_path (str): Path to the JSON file containing zipcode data (compiled into the gazetteer).
+        nuts_path (str): Path to the JSON file containing NUTS data (compiled into the gazetteer).
+        storage_format (str): Storage format of the processed files ('csv', 'arrow' or 'parquet').
+        area_cache_size (int): Maximum number of distinct area names whose location is kept in memory.
+        unchanged (AbstractSet[str]): Codes of the indicators unchanged since the previous extraction, which are skipped
+                                      if their file was already processed (it has a dimension dictionary sidecar).
 
     Returns:
         None
     """
-    dicofre_dict = load_dicofre_data(dicofre_path)
-    nuts_dict = load_nuts_data(nuts_path)
-
-    os.makedirs(final_data_path, exist_ok=True)
-    for filename in os.listdir(final_data_path):
-        if filename.endswith('.csv'):
-            csv_file = os.path.join(final_data_path, filename)
-            with open(csv_file, 'r', encoding='utf-8') as file:
-                reader = csv.reader(file)
-                try:
-                    headers = next(reader)
-                except StopIteration:
+    gazetteer = gi.open_gazetteer(gazetteer_path, dicofre_path, zipcode_path, nuts_path)
+    resolve_area = area_resolver(gazetteer['location_name'], gazetteer['nuts_area'], area_cache_size)
+
+    try:
+        os.makedirs(final_data_path, exist_ok=True)
+        for filename in os.listdir(final_data_path):
+            if pf.is_data_file(filename):
+                csv_file = os.path.join(final_data_path, filename)
+                if os.path.splitext(filename)[0].split('_')[-1] in unchanged and os.path.exists(pf.dims_path(csv_file)):
+                    print(f"Indicator unchanged since the previous extraction: {filename}. Skipping...")
+                    continue
+                started = time.perf_counter()
+                headers, reader = pf.read_table(csv_file, delimiter=',')
+                if not headers:
                     print(f"Empty file: {filename}")
                     continue
-                
+            
                 timecode_idx, area_idx = get_timecode_area(headers)
                 if timecode_idx is None or area_idx is None:
                     print(f"The file does not have the required columns: {filename}")
+                    reader.close()
                     continue
 
-                headers.extend(['distrito', 'concelho', 'freguesia', 'nuts1', 'nuts2', 'nuts3'])
+                # Split the headers between the indicator columns (dimension) and the per-row data (facts)
+                indicator_cols = [h for h in headers if h in ['name', 'description', 'units', 'source_cod']]
+                indicator_idx = [headers.index(h) for h in indicator_cols]
+                fact_idx = [i for i in range(len(headers)) if i not in indicator_idx and i != area_idx]
+                geo_cols = ['area', 'distrito', 'concelho', 'freguesia', 'nuts1', 'nuts2', 'nuts3']
+                geo_keys, indicator_keys = {}, {}
+
+                new_headers = [headers[i] for i in fact_idx] + [pf.dimension_key_columns['geo'], pf.dimension_key_columns['indicator']]
                 new_rows = []
                 for row in reader:
                     row[timecode_idx] = clean_timecode(row, timecode_idx)
                     area = row[area_idx]
-                    distrito, concelho, freguesia, nuts1, nuts2, nuts3 = match_nuts_location(area, dicofre_dict, nuts_dict)
-                    row.extend([distrito, concelho, freguesia, nuts1, nuts2, nuts3])
-                    new_rows.append(row)
+                    distrito, concelho, freguesia, nuts1, nuts2, nuts3 = resolve_area(area)
+                    id_geo = pf.encode(geo_keys, (area, distrito, concelho, freguesia, nuts1, nuts2, nuts3))
+                    id_indicator = pf.encode(indicator_keys, tuple(row[i] for i in indicator_idx))
+                    new_rows.append([row[i] for i in fact_idx] + [id_geo, id_indicator])
+
+                output_file = pf.data_file_path(os.path.join(final_data_path, filename), storage_format)
+                written_rows = pf.write_table(output_file, new_headers, new_rows, storage_format)
+                pf.write_dims(output_file, {
+                    'geo': (geo_cols, geo_keys),
+                    'indicator': (indicator_cols, indicator_keys)
+                })
 
-            output_file = os.path.join(final_data_path, filename)
-            with open(output_file, 'w', encoding='utf-8', newline='') as file:
-                writer = csv.writer(file, delimiter=';')
-                writer.writerow(headers)
-                writer.writerows(new_rows)
+                print(f"File processed and saved in: {output_file}")
+                pf.report_throughput("INE geodata", written_rows, started, output_file)
 
-            print(f"File processed and saved in: {output_file}")
+        report_cache_stats(resolve_area)
+    finally:
+        gi.close_gazetteer(gazetteer)
 
 if __name__ == "__main__":
-    main(s.ine_processed_data, s.dicofre_data, s.nuts_data)
\ No newline at end of file
+    main(s.ine_processed_data, s.gazetteer, s.dicofre_data, s.zipcode_data, s.nuts_data, s.ine_storage_format, s.ine_area_cache_size,
+         hc.load_unchanged(s.ine_http_cache))
\ No newline at end of file
@@ -1,7 +1,8 @@
 import os
 import json
-import csv
 import sys
+import time
+from typing import AbstractSet
 
 import logging
 
@@ -38,9 +39,11 @@ As the root of the project is now in the 'sys.path', it is possible to import th
 
 # Import settings
 import app.utils.settings as s
+import app.utils.processed_files as pf
+import app.utils.http_cache as hc
 
 
-def merge_data(raw_data_path: str, metadata_path: str, output_folder: str) -> None:
+def merge_data(raw_data_path: str, metadata_path: str, output_folder: str, storage_format: str = 'csv', unchanged: AbstractSet[str] = frozenset()) -> None:
     """
     Merge data from JSON files in raw_data_path and metadata_path, then save the combined data to CSV files.
 
@@ -51,6 +54,9 @@ def merge_data(raw_data_path: str, metadata_path: str, output_folder: str) -> No
         raw_data_path (str): The directory path where raw data JSON files are located.
         metadata_path (str): The directory path where metadata JSON files are located.
         output_folder (str): The directory path where the output CSV files will be saved.
+        storage_format (str): Storage format of the output files ('csv', 'arrow' or 'parquet').
+        unchanged (AbstractSet[str]): Codes of the indicators unchanged since the previous extraction, which are not merged again
+                                      if their output file exists.
 
     Returns:
         None
@@ -65,6 +71,12 @@ def merge_data(raw_data_path: str, metadata_path: str, output_folder: str) -> No
 
     # Find the codes present in both folders
     matching_ids = data_ids.intersection(metadata_ids)
+    # Skip the indicators which have not changed since they were merged
+    skipped_ids = {file_id for file_id in matching_ids & unchanged
+                   if os.path.exists(os.path.join(output_folder, pf.data_file_path(f'combined_data_{file_id}', storage_format)))}
+    if skipped_ids:
+        print(f'{len(skipped_ids)} indicators unchanged since the previous extraction. Skipping...')
+    matching_ids -= skipped_ids
 
     # Create an empty dict to save metadata
     metadata_dict = {}
@@ -82,6 +94,7 @@ def merge_data(raw_data_path: str, metadata_path: str, output_folder: str) -> No
     # Read and process data files
     for file_id in matching_ids:
         data_filename = f"data_{file_id}.json"
+        started = time.perf_counter()
         combined_data = []
         with open(os.path.join(raw_data_path, data_filename), 'r', encoding='utf-8') as data_file:
             data_json = json.load(data_file)
@@ -127,25 +140,20 @@ def merge_data(raw_data_path: str, metadata_path: str, output_folder: str) -> No
         fieldnames = list(set().union(*(entry.keys() for entry in combined_data)))
 
         # Save the combined data
-        filename = f'combined_data_{file_id}.csv'
+        filename = pf.data_file_path(f'combined_data_{file_id}', storage_format)
         output_file = os.path.join(output_folder, filename)
         os.makedirs(output_folder, exist_ok=True)
-        with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            # Write the headers
-            writer.writeheader()
-            
-            # Write the combined data rows
-            for entry in combined_data:
-                writer.writerow(entry)
+        written_rows = pf.write_table(output_file, fieldnames, ([entry.get(field, '') for field in fieldnames] for entry in combined_data),
+                                      storage_format, delimiter=',')
 
-        print(f'CSV file generated: {filename}')
+        print(f'Data file generated: {filename}')
+        pf.report_throughput("INE merge", written_rows, started, output_file)
 
 
 def main():
     try:
-        merge_data(raw_data_path=s.ine_data_path, metadata_path=s.ine_metadata_path, output_folder=s.ine_processed_data)
+        merge_data(raw_data_path=s.ine_data_path, metadata_path=s.ine_metadata_path, output_folder=s.ine_processed_data, storage_format=s.ine_storage_format,
+                   unchanged=hc.load_unchanged(s.ine_http_cache))
     except Exception as e:
         print(f"Error: {e}")
 
@@ -1,6 +1,15 @@
-import requests
 import zipfile
 import os
+import sys
+from typing import Optional
+
+# Get the path of the root directory (irradiare-app) and add it to sys.path to import the utils modules
+irradiare_app_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..'))
+sys.path.append(irradiare_app_path)
+
+import app.utils.settings as s
+import app.utils.http_utils as hu
+import app.utils.http_cache as hc
 
 
 def create_directories(paths: list[str]) -> None:
@@ -17,20 +26,24 @@ def create_directories(paths: list[str]) -> None:
         os.makedirs(path, exist_ok=True)
 
 
-def download_zip_file(url: str, zip_path: str) -> None:
+def download_zip_file(url: str, zip_path: str, cache: Optional[hc.HttpCache] = None) -> bool:
     """
     Download a ZIP file from the specified URL and save it to the given path.
 
+    The ZIP file is streamed to disk (see `http_utils.download_file`), so the memory used does not depend on its size.
+    If the ZIP file was already downloaded and an HTTP cache is given, it is requested with its validators
+    and it is not downloaded again if it has not changed.
+
     Args:
         url (str): The URL to download the ZIP file from.
         zip_path (str): The path where the downloaded ZIP file will be saved.
+        cache (Optional[HttpCache]): HTTP cache of the World Bank extraction.
 
     Returns:
-        None
+        bool: True if the ZIP file has not changed since the previous download.
     """
-    response = requests.get(url)
-    with open(zip_path, 'wb') as f:
-        f.write(response.content)
+    with hu.create_session(max_connections=1) as session:
+        return hu.download_file(session, url, zip_path, cache)
 
 
 def extract_zip_file(zip_path: str, extract_to: str, file_names: list[str]) -> None:
@@ -69,12 +82,21 @@ def main() -> None:
     # Create necessary directories
     create_directories([complementary_path, data_path, metadata_path])
 
-    # Download the ZIP file
-    download_zip_file(url, zip_path)
-
-    # Extract the data and the metadata CSV files
-    extract_zip_file(zip_path, data_path, ['API_PRT_DS2_en_csv_v2_3412148.csv'])
-    extract_zip_file(zip_path, metadata_path, ['Metadata_Indicator_API_PRT_DS2_en_csv_v2_3412148.csv'])
+    # Download the ZIP file, unless it has not changed since the previous download
+    cache = hc.HttpCache(s.wb_http_cache)
+    unchanged = download_zip_file(url, zip_path, cache)
+    data_file = os.path.join(data_path, 'API_PRT_DS2_en_csv_v2_3412148.csv')
+    metadata_file = os.path.join(metadata_path, 'Metadata_Indicator_API_PRT_DS2_en_csv_v2_3412148.csv')
+
+    if unchanged and os.path.exists(data_file) and os.path.exists(metadata_file):
+        # The processing script skips the data extracted from an unchanged ZIP file
+        cache.mark_unchanged(os.path.basename(zip_path))
+        print("The ZIP file has not changed since the previous download.")
+    else:
+        # Extract the data and the metadata CSV files
+        extract_zip_file(zip_path, data_path, [os.path.basename(data_file)])
+        extract_zip_file(zip_path, metadata_path, [os.path.basename(metadata_file)])
+    cache.save()
 
     print("Process completed.")
 
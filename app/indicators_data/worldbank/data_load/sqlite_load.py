@@ -1,6 +1,7 @@
 import os
 import csv
 import sqlite3
+from typing import Dict, List, Optional, Tuple
 import sqlite_queries as sq
 
 
@@ -97,7 +98,29 @@ def extract_and_save_row(input_csv: str, output_csv: str, row_number: int) -> Op
         return last_row
 
 
-def insert_into_stagging(database: sqlite3.Connection, csv_folder: str) -> None:
+def get_stagging_key(cursor: sqlite3.Cursor, query: str, values: Tuple, keys: Dict[Tuple, int]) -> int:
+    """
+    Returns the staging key of a set of repeated values (indicator, geography or attributes),
+    inserting them into their staging table only the first time they are seen during the run.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor used to insert into the staging tables.
+        query (str): INSERT query of the staging table holding the values.
+        values (Tuple): Values to encode.
+        keys (Dict[Tuple, int]): Already encoded values and their staging keys.
+
+    Returns:
+        int: Staging key of the values.
+    """
+    key = keys.get(values)
+    if key is None:
+        cursor.execute(query, values)
+        key = cursor.lastrowid
+        keys[values] = key
+    return key
+
+
+def insert_into_stagging(database: sqlite3.Connection, csv_folder: str) -> int:
     """
     Inserts data from CSV files into a staging table in the database.
 
@@ -106,8 +129,11 @@ def insert_into_stagging(database: sqlite3.Connection, csv_folder: str) -> None:
         csv_folder (str): Path to the folder containing the CSV files.
 
     Returns:
-        None
+        int: Number of rows written to the staging table.
     """
+    staged_rows = 0
+    indicator_keys, geo_keys, attribute_keys = {}, {}, {}
+
     try:
         cursor = database.cursor()
         
@@ -162,12 +188,22 @@ def insert_into_stagging(database: sqlite3.Connection, csv_folder: str) -> None:
                         value_attribute = 'Undefined'
                         value_tag = 'Undefined'
 
+                        value = float(data_value) if data_value else None
+
                         # INSERT into the db
+                        id_stg_indicator = get_stagging_key(cursor, sq.INSERT_STG_INDICATOR, (
+                            name_indicator, description, units, units_desc, calculation, source, source_code, value_tag
+                        ), indicator_keys)
+                        id_stg_geo = get_stagging_key(cursor, sq.INSERT_STG_GEO, (
+                            nuts1, nuts2, nuts3, geocode, type, distrito, concelho, freguesia
+                        ), geo_keys)
+                        id_stg_attribute = get_stagging_key(cursor, sq.INSERT_STG_ATTRIBUTE, (
+                            attributes, name_attribute, value_attribute
+                        ), attribute_keys)
                         cursor.execute(sq.INSERT_DATA_STAGGING, (
-                            nuts1, nuts2, nuts3, geocode, type, distrito, concelho, freguesia, timecode, data_value,
-                            name_indicator, description, units, units_desc, calculation, source, source_code,
-                            attributes, name_attribute, value_attribute, value_tag
+                            id_stg_indicator, id_stg_geo, id_stg_attribute, timecode, value
                         ))
+                        staged_rows += 1
                     
         # Changes commited to the db
         database.commit()
@@ -175,124 +211,116 @@ def insert_into_stagging(database: sqlite3.Connection, csv_folder: str) -> None:
 
     except Exception as e:
         database.rollback()
+        staged_rows = 0
         print(f"Error processing file {filename}: {e}")
 
     finally:
         cursor.close()
 
+    return staged_rows
 
-def stg_to_datawarehouse(database: sqlite3.Connection) -> None:
+
+def stg_to_datawarehouse(database: sqlite3.Connection) -> int:
     """
-    Transfers data from the staging table to the corresponding data warehouse tables.
-    
+    Processes the data from the staging tables and inserts it into the destination tables.
+
+    Each distinct geography, indicator and attribute staged during the run is resolved against the
+    data warehouse tables only once; the value rows are then promoted using the resolved ids.
+
     Args:
-        database (sqlite3.Connection): A connection object to the SQLite database.
+        database (sqlite3.Connection): Connection to the SQLite database.
 
     Returns:
-        None
+        int: Number of values promoted to the `data_values` table.
     """
+    promoted_rows = 0
     cursor = database.cursor()
 
     try:
         cursor.execute('BEGIN TRANSACTION')
-        cursor.execute('SELECT * FROM stg_table')
-        rows = cursor.fetchall()
-
-        for row in rows:
-            row_dict = {
-                'nuts1': row[0],
-                'nuts2': row[1],
-                'nuts3': row[2],
-                'geocode': row[3],
-                'type': row[4],
-                'distrito': row[5],
-                'concelho': row[6],
-                'freguesia': row[7],
-                'timecode': row[8],
-                'data_value': row[9],
-                'name_indicator': row[10],
-                'description': row[11],
-                'units': row[12],
-                'units_desc': row[13],
-                'calculation': row[14],
-                'source': row[15],
-                'source_code': row[16],
-                'attributes': row[17],
-                'name_attribute': row[18],
-                'value_attribute': row[19],
-                'value_tag': row[20]
-            }
-
-            # Insert data into `nuts` table
+
+        # Resolve each staged geography into `nuts`, `geolevel` and `geodata`
+        geodata_ids = {}
+        for id_stg_geo, nuts1, nuts2, nuts3, geocode, type, distrito, concelho, freguesia in cursor.execute(
+                'SELECT * FROM stg_geo').fetchall():
             cursor.execute('INSERT OR IGNORE INTO nuts (nuts1, nuts2, nuts3) VALUES (?, ?, ?)', 
-                           (row_dict['nuts1'], row_dict['nuts2'], row_dict['nuts3']))
-            id_nuts = cursor.execute('SELECT id_nuts FROM nuts WHERE nuts1 = ? AND nuts2 = ? AND nuts3 = ?',
-                                     (row_dict['nuts1'], row_dict['nuts2'], row_dict['nuts3'])).fetchone()[0]
+                           (nuts1, nuts2, nuts3))
+            id_nuts = cursor.execute('SELECT id_nuts FROM nuts WHERE nuts1 = ? AND nuts2 = ? AND nuts3 = ?', 
+                                     (nuts1, nuts2, nuts3)).fetchone()[0]
 
-            # Insert data into `geolevel` table
             cursor.execute('INSERT OR IGNORE INTO geolevel (distrito, concelho, freguesia) VALUES (?, ?, ?)', 
-                           (row_dict['distrito'], row_dict['concelho'], row_dict['freguesia']))
-            id_geolevel = cursor.execute('SELECT id_geolevel FROM geolevel WHERE distrito = ? AND concelho = ? AND freguesia = ?',
-                                         (row_dict['distrito'], row_dict['concelho'], row_dict['freguesia'])).fetchone()[0]
+                           (distrito, concelho, freguesia))
+            id_geolevel = cursor.execute('SELECT id_geolevel FROM geolevel WHERE distrito = ? AND concelho = ? AND freguesia = ?', 
+                                         (distrito, concelho, freguesia)).fetchone()[0]
 
-            # Insert data into `geodata` table
             cursor.execute('INSERT OR IGNORE INTO geodata (id_nuts, id_geolevel, geocode, type) VALUES (?, ?, ?, ?)', 
-                           (id_nuts, id_geolevel, row_dict['geocode'], row_dict['type']))
-            id_geodata = cursor.execute('SELECT id_geodata FROM geodata WHERE id_nuts = ? AND id_geolevel = ? AND geocode = ? AND type = ?',
-                                        (id_nuts, id_geolevel, row_dict['geocode'], row_dict['type'])).fetchone()[0]
-
-            # Insert data into `indicator` table
+                           (id_nuts, id_geolevel, geocode, type))
+            geodata_ids[id_stg_geo] = cursor.execute('SELECT id_geodata FROM geodata WHERE id_nuts = ? AND id_geolevel = ? AND geocode = ? AND type = ?', 
+                                                     (id_nuts, id_geolevel, geocode, type)).fetchone()[0]
+
+        # Resolve each staged indicator into `indicator`, `tags` and `type`
+        indicator_ids = {}
+        for (id_stg_indicator, name_indicator, description, units, units_desc,
+             calculation, source, source_code, value_tag) in cursor.execute('SELECT * FROM stg_indicator').fetchall():
             cursor.execute('INSERT OR IGNORE INTO indicator (name, description, units, units_desc, calculation, source, source_code) VALUES (?, ?, ?, ?, ?, ?, ?)', 
-                           (row_dict['name_indicator'], row_dict['description'], row_dict['units'], row_dict['units_desc'],
-                            row_dict['calculation'], row_dict['source'], row_dict['source_code']))
-            id_indicator = cursor.execute('SELECT id_indicator FROM indicator WHERE name = ? AND source_code = ?',
-                                          (row_dict['name_indicator'], row_dict['source_code'])).fetchone()[0]
-            
-            # Validating data_value's value
-            data_value = row_dict['data_value']
-            if not data_value:
-                data_value = None
-
-            # Insert data into `data_values` table
-            try:
-                cursor.execute('INSERT INTO data_values (id_geodata, id_indicator, timecode, value, attributes) VALUES (?, ?, ?, ?, ?)', 
-                               (id_geodata, id_indicator, row_dict['timecode'], float(data_value) if data_value else None, row_dict['attributes']))
-                id_value = cursor.lastrowid
-            except sqlite3.IntegrityError:
-                print(f"Duplicated found and skipped: {row_dict}")
-                continue
-
-            # Insert data into `attributes` table
-            if row_dict['name_attribute'] != 'Undefined' and row_dict['value_attribute'] != 'Undefined':
+                           (name_indicator, description, units, units_desc, calculation, source, source_code))
+            id_indicator = cursor.execute('SELECT id_indicator FROM indicator WHERE name = ? AND source_code = ?', 
+                                          (name_indicator, source_code)).fetchone()[0]
+            indicator_ids[id_stg_indicator] = id_indicator
+
+            if value_tag != 'Undefined':
+                cursor.execute('INSERT OR IGNORE INTO tags (value) VALUES (?)', (value_tag,))
+                id_tag = cursor.execute('SELECT id_tag FROM tags WHERE value = ?', (value_tag,)).fetchone()[0]
+                cursor.execute('INSERT OR IGNORE INTO type (id_indicator, id_tag) VALUES (?, ?)', 
+                               (id_indicator, id_tag))
+
+        # Resolve each staged attribute into `attributes`
+        attribute_ids = {}
+        attribute_strings = {}
+        for id_stg_attribute, attributes, name_attribute, value_attribute in cursor.execute(
+                'SELECT * FROM stg_attribute').fetchall():
+            attribute_strings[id_stg_attribute] = attributes
+            if name_attribute != 'Undefined' and value_attribute != 'Undefined':
                 cursor.execute('INSERT OR IGNORE INTO attributes (name, value) VALUES (?, ?)', 
-                               (row_dict['name_attribute'], row_dict['value_attribute']))
-                id_attribute = cursor.execute('SELECT id_attribute FROM attributes WHERE name = ? AND value = ?', 
-                                              (row_dict['name_attribute'], row_dict['value_attribute'])).fetchone()[0]
+                               (name_attribute, value_attribute))
+                attribute_ids[id_stg_attribute] = cursor.execute('SELECT id_attribute FROM attributes WHERE name = ? AND value = ?', 
+                                                                 (name_attribute, value_attribute)).fetchone()[0]
+
+        # Promote the value rows using the resolved ids
+        values_cursor = database.cursor()
+        try:
+            for id_stg_indicator, id_stg_geo, id_stg_attribute, timecode, data_value in values_cursor.execute(
+                    'SELECT id_stg_indicator, id_stg_geo, id_stg_attribute, timecode, data_value FROM stg_table'):
+                try:
+                    cursor.execute('INSERT INTO data_values (id_geodata, id_indicator, timecode, value, attributes) VALUES (?, ?, ?, ?, ?)', 
+                                   (geodata_ids[id_stg_geo], indicator_ids[id_stg_indicator], timecode, data_value,
+                                    attribute_strings[id_stg_attribute]))
+                    id_value = cursor.lastrowid
+                    promoted_rows += 1
+                except sqlite3.IntegrityError:
+                    print(f"Duplicated found and skipped: {(id_stg_indicator, id_stg_geo, timecode, data_value)}")
+                    continue
 
                 # Insert data into `val_attr` table
-                cursor.execute('INSERT OR IGNORE INTO val_attr (id_value, id_attribute) VALUES (?, ?)', 
-                               (id_value, id_attribute))
-
-            # Insert data into `tags` table
-            if row_dict['value_tag'] != 'Undefined':
-                cursor.execute('INSERT OR IGNORE INTO tags (value) VALUES (?)', 
-                               (row_dict['value_tag'],))
-                id_tag = cursor.execute('SELECT id_tag FROM tags WHERE value = ?', 
-                                        (row_dict['value_tag'],)).fetchone()[0]
-
-                # Insert data into `type` table
-                cursor.execute('INSERT OR IGNORE INTO type (id_indicator, id_tag) VALUES (?, ?)', 
-                               (id_indicator, id_tag))
+                id_attribute = attribute_ids.get(id_stg_attribute)
+                if id_attribute is not None:
+                    cursor.execute('INSERT OR IGNORE INTO val_attr (id_value, id_attribute) VALUES (?, ?)', 
+                                   (id_value, id_attribute))
+        finally:
+            values_cursor.close()
 
         database.commit()
 
     except sqlite3.Error as e:
         print(f"Error processing stagging data: {e}")
         database.rollback()
+        promoted_rows = 0
 
     finally:
         cursor.close()
 
+    return promoted_rows
+
 
 def truncate_all_tables(database: sqlite3.Connection) -> None:
     """
@@ -323,6 +351,55 @@ def truncate_all_tables(database: sqlite3.Connection) -> None:
         cursor.close()
 
 
+def create_stagging(database: sqlite3.Connection) -> None:
+    """
+    Creates the staging tables as TEMP tables bound to the current connection.
+
+    The TEMP tables shadow any legacy `stg_table` kept in the database file and are dropped
+    automatically when the connection is closed, so every loading run starts from an empty staging area.
+
+    Args:
+        database (sqlite3.Connection): Connection to the SQLite database.
+
+    Returns:
+        None
+    """
+    cursor = database.cursor()
+
+    try:
+        cursor.execute(sq.CREATE_TEMP_STG_INDICATOR)
+        cursor.execute(sq.CREATE_TEMP_STG_GEO)
+        cursor.execute(sq.CREATE_TEMP_STG_ATTRIBUTE)
+        cursor.execute(sq.CREATE_TEMP_STAGGING_TABLE)
+        database.commit()
+    finally:
+        cursor.close()
+
+
+def truncate_stagging(database: sqlite3.Connection) -> None:
+    """
+    Empties the per-run staging tables once their rows have been promoted.
+
+    Args:
+        database (sqlite3.Connection): Connection to the SQLite database.
+
+    Returns:
+        None
+    """
+    cursor = database.cursor()
+
+    try:
+        for table in ['stg_table', 'stg_indicator', 'stg_geo', 'stg_attribute']:
+            cursor.execute(f'DELETE FROM temp.{table}')
+        database.commit()
+        print("Stagging tables emptied.")
+    except sqlite3.Error as e:
+        database.rollback()
+        print(f"Error emptying the stagging tables: {e}")
+    finally:
+        cursor.close()
+
+
 def main() -> None:
     """
     Main function that handles the database connection, inserts data from CSV to staging,
@@ -334,10 +411,15 @@ def main() -> None:
         print("Conexión exitosa a la base de datos.")
         
         # Insert data into the staging table from CSVs
-        insert_into_stagging(database=database, csv_folder="app/indicators_data/worldbank/wb_data/processed/")
-        
+        create_stagging(database)
+        staged_rows = insert_into_stagging(database=database, csv_folder="app/indicators_data/worldbank/wb_data/processed/")
+
         # Move data from staging to the data warehouse
-        stg_to_datawarehouse(database)
+        promoted_rows = stg_to_datawarehouse(database)
+        print(f"World Bank: {staged_rows} rows staged, {promoted_rows} values promoted.")
+
+        # The staging table only lives for this run
+        truncate_stagging(database=database)
 
         # Uncomment this if you want to truncate all tables after processing
         # truncate_all_tables(database=database)
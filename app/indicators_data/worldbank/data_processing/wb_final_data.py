@@ -1,7 +1,15 @@
 import csv
 import os
+import sys
 from typing import List, Tuple, Dict, Any
 
+# Get the path of the root directory (irradiare-app) and add it to sys.path to import the utils modules
+irradiare_app_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..'))
+sys.path.append(irradiare_app_path)
+
+import app.utils.settings as s
+import app.utils.http_cache as hc
+
 def load_data(data_file: str) -> Tuple[List[str], List[List[str]]]:
     """
     Load data from a CSV file, skipping the first two lines and any blank lines.
@@ -106,13 +114,19 @@ def create_csv_for_indicator(headers: List[str], datos: List[List[str]],
 def main() -> None:
     """
     Main function to load data, load metadata, and generate CSV files for indicators.
+
+    The files are not generated again if the ZIP file has not changed since the previous extraction.
     
     Returns:
         None
     """
-headers, datos = load_data("app/indicators_data/worldbank/wb_data/raw/API_PRT_DS2_en_csv_v2_3412148.csv")
-metadatos = load_metadata("app/indicators_data/worldbank/wb_metadata/Metadata_Indicator_API_PRT_DS2_en_csv_v2_3412148.csv")
-create_csv_for_indicator(headers=headers, datos=datos, metadatos=metadatos, output_dir="app/indicators_data/worldbank/wb_data/processed")
+    output_dir = "app/indicators_data/worldbank/wb_data/processed"
+    if os.path.basename(s.wb_zip_file) in hc.load_unchanged(s.wb_http_cache) and os.path.isdir(output_dir) and os.listdir(output_dir):
+        print("World Bank data unchanged since the previous extraction. Skipping...")
+        return
+    headers, datos = load_data("app/indicators_data/worldbank/wb_data/raw/API_PRT_DS2_en_csv_v2_3412148.csv")
+    metadatos = load_metadata("app/indicators_data/worldbank/wb_metadata/Metadata_Indicator_API_PRT_DS2_en_csv_v2_3412148.csv")
+    create_csv_for_indicator(headers=headers, datos=datos, metadatos=metadatos, output_dir=output_dir)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
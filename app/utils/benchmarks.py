@@ -0,0 +1,344 @@
+import html
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import timeit
+import xml.etree.ElementTree as ET
+from typing import Any, Callable, Dict, List, Tuple
+
+
+# Get the path of the root directory (irradiare-app) and add it to sys.path to import the utils modules
+irradiare_app_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.append(irradiare_app_path)
+
+import app.utils.settings as s
+import app.utils.geo_index as gi
+
+
+"""
+Micro-benchmarks of the per-row operations of the processing pipelines.
+
+Each benchmark times the current implementation against the previous one (kept here as reference) on the same inputs,
+and prints the cost per row. Run it from the root directory of the project: 'python app/utils/benchmarks.py'.
+
+The parsers fed by external services are also checked against responses recorded in the 'fixtures' folder.
+"""
+
+# Responses of the external services recorded for the checks
+fixtures_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def time_per_row(function: Callable[[Any], Any], inputs: List[Any], repeat: int = 5) -> float:
+    """
+    Measures the cost per row of a function.
+
+    Args:
+        function (Callable[[Any], Any]): Function called once per row.
+        inputs (List[Any]): Rows passed to the function.
+        repeat (int): Number of measurements, the best one is kept.
+
+    Returns:
+        float: Time per row in microseconds.
+    """
+    timer = timeit.Timer(lambda: [function(row) for row in inputs])
+    return min(timer.repeat(repeat=repeat, number=1)) / len(inputs) * 1_000_000
+
+
+def report(benchmark: str, previous_us: float, current_us: float) -> None:
+    """
+    Prints the result of a benchmark.
+
+    Args:
+        benchmark (str): Name of the benchmark.
+        previous_us (float): Time per row of the previous implementation, in microseconds.
+        current_us (float): Time per row of the current implementation, in microseconds.
+    """
+    print(f"{benchmark}: {previous_us:.3f} us/row -> {current_us:.3f} us/row ({previous_us / max(current_us, 1e-9):,.0f}x)")
+
+
+def scan_nuts_data(concelho: str, nuts_dict: Dict[str, Any]) -> Tuple[str, str, str]:
+    # Previous implementation of get_nuts_data: walks the NUTS hierarchy for every row
+    for nuts1_region, nuts1_info in nuts_dict.items():
+        for region_nuts2, nuts2_info in nuts1_info.get("NUTS 2", {}).items():
+            for nuts3_region, nuts3_data in nuts2_info.get("NUTS 3", {}).items():
+                if concelho in nuts3_data.get("Municipalities", []):
+                    return nuts1_region, region_nuts2, nuts3_region
+    return 'undefined', 'undefined', 'undefined'
+
+
+def benchmark_nuts_lookup(gazetteer_path: str, dicofre_path: str, zipcode_path: str, nuts_path: str) -> None:
+    """
+    Compares the NUTS regions lookup of a municipality by scanning the NUTS data and through the gazetteer NUTS index.
+
+    Args:
+        gazetteer_path (str): Path to the gazetteer.
+        dicofre_path (str): Path to the dicofre JSON file.
+        zipcode_path (str): Path to the zipcode JSON file.
+        nuts_path (str): Path to the JSON file containing NUTS data.
+    """
+    with open(nuts_path, 'r', encoding='utf-8') as nuts_file:
+        nuts_dict = json.load(nuts_file)
+    nuts_index = gi.open_gazetteer(gazetteer_path, dicofre_path, zipcode_path, nuts_path)['nuts_concelho']
+
+    # Every municipality, plus names missing from the NUTS data (worst case of the scan)
+    concelhos = list(nuts_index) + ['undefined'] * (len(nuts_index) // 10)
+    if any(scan_nuts_data(concelho, nuts_dict) != nuts_index.get(concelho, ('undefined', 'undefined', 'undefined')) for concelho in concelhos):
+        raise ValueError("The NUTS index does not match the NUTS data")
+
+    previous_us = time_per_row(lambda concelho: scan_nuts_data(concelho, nuts_dict), concelhos)
+    current_us = time_per_row(lambda concelho: nuts_index.get(concelho, ('undefined', 'undefined', 'undefined')), concelhos)
+    report("NUTS lookup", previous_us, current_us)
+
+
+def scan_location(name: str, dicofre_data: Dict[str, Dict[str, str]]) -> Tuple[str, str, str]:
+    # Previous implementation of ine_final_data.match_location: up to three scans of the dicofre data for every row
+    for value in dicofre_data.values():
+        if name == value["freguesia"]:
+            return value["distrito"], value["concelho"], value["freguesia"]
+    for value in dicofre_data.values():
+        if name == value["concelho"]:
+            return value["distrito"], value["concelho"], "undefined"
+    for value in dicofre_data.values():
+        if name == value["distrito"]:
+            return value["distrito"], "undefined", "undefined"
+    return "undefined", "undefined", "undefined"
+
+
+def benchmark_area_lookup(gazetteer_path: str, dicofre_path: str, zipcode_path: str, nuts_path: str, rows: int = 20000) -> None:
+    """
+    Compares the location lookup of the INE area names by scanning the dicofre data and through the memoised area resolver.
+
+    Args:
+        gazetteer_path (str): Path to the gazetteer.
+        dicofre_path (str): Path to the dicofre JSON file.
+        zipcode_path (str): Path to the zipcode JSON file.
+        nuts_path (str): Path to the JSON file containing NUTS data.
+        rows (int): Number of rows of the simulated INE data, repeating the concelho and distrito names as the INE files do.
+    """
+    from app.indicators_data.ine.data_processing.ine_final_data import area_resolver
+
+    with open(dicofre_path, 'r', encoding='utf-8') as dicofre_file:
+        dicofre_data = json.load(dicofre_file)
+    gazetteer = gi.open_gazetteer(gazetteer_path, dicofre_path, zipcode_path, nuts_path)
+    resolve_area = area_resolver(gazetteer['location_name'], gazetteer['nuts_area'], s.ine_area_cache_size)
+
+    names = sorted({value["concelho"] for value in dicofre_data.values()} | {value["distrito"] for value in dicofre_data.values()})
+    areas = [names[i % len(names)] for i in range(rows)]
+    if any(scan_location(area, dicofre_data) != resolve_area(area)[:3] for area in names):
+        raise ValueError("The area resolver does not match the dicofre data")
+
+    previous_us = time_per_row(lambda area: scan_location(area, dicofre_data), areas[:len(names)], repeat=1)
+    current_us = time_per_row(resolve_area, areas)
+    report("INE area lookup", previous_us, current_us)
+
+
+def write_sdmx_metadata(metadata_file_path: str, concepts: List[str], filler_attributes: int = 40) -> None:
+    # Synthetic SDMX metadata file with HTML encoded values, and as many other attributes as the Eurostat files have
+    genericmetadata = 'http://www.SDMX.org/resources/SDMXML/schemas/v2_0/genericmetadata'
+    attributes = concepts + [f"CONCEPT_{number}" for number in range(filler_attributes)]
+    values = ''.join(
+        f'<genericmetadata:ReportedAttribute conceptID="{concept}"><genericmetadata:Value xml:lang="en">'
+        f'{html.escape(f"<p>{concept} text with <b>markup</b> &amp; entities. </p>" * 10)}'
+        f'</genericmetadata:Value></genericmetadata:ReportedAttribute>'
+        for concept in attributes
+    )
+    with open(metadata_file_path, 'w', encoding='utf-8') as metadata_file:
+        metadata_file.write(f'<?xml version="1.0" encoding="UTF-8"?><GenericMetadata xmlns:genericmetadata="{genericmetadata}">'
+                            f'<MetadataSet><genericmetadata:AttributeValueSet>{values}</genericmetadata:AttributeValueSet></MetadataSet></GenericMetadata>')
+
+
+def eurostat_records(rows: int) -> List[Dict[str, Any]]:
+    # Synthetic observations of a Eurostat dataset filtered for Portugal, with the columns of the API client dataframes
+    return [{'freq': 'A', 'unit': 'PC' if number % 2 else 'NR', 'geo': 'PT', 'time': str(2000 + number % 25), 'values': number / 10}
+            for number in range(rows)]
+
+
+def write_eurostat_raw_data(base_path: str, records: List[Dict[str, Any]]) -> Tuple[str, str]:
+    # Raw data file as saved by eurostat_client_data (Parquet), and as saved by previous versions (JSON string inside a JSON file)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parquet_path, json_path = f"{base_path}.parquet", f"{base_path}.json"
+    pq.write_table(pa.Table.from_pylist(records), parquet_path)
+    with open(json_path, 'w', encoding='utf-8') as data_file:
+        json.dump(json.dumps(records), data_file, indent=4, ensure_ascii=False)
+    return parquet_path, json_path
+
+
+def benchmark_eurostat_raw_data(rows: int = 200000) -> None:
+    """
+    Compares the size and the reading cost per record of the Eurostat raw data files saved as a JSON string inside
+    a JSON file (previous versions) and as Parquet files.
+
+    Args:
+        rows (int): Number of records of the simulated dataset.
+    """
+    import app.indicators_data.eurostat.data_processing.eurostat_final_data as efd
+
+    with tempfile.TemporaryDirectory() as folder:
+        parquet_path, json_path = write_eurostat_raw_data(os.path.join(folder, 'dataset'), eurostat_records(rows))
+        if efd.read_raw_data(parquet_path) != efd.read_legacy_json(json_path):
+            raise ValueError("The Parquet file does not have the same records as the JSON file")
+
+        previous_us = time_per_row(efd.read_legacy_json, [json_path], repeat=3) / rows
+        current_us = time_per_row(efd.read_raw_data, [parquet_path], repeat=3) / rows
+        print(f"Eurostat raw data size: {os.path.getsize(json_path) / 1_000_000:.2f} MB -> {os.path.getsize(parquet_path) / 1_000_000:.2f} MB")
+    report(f"Eurostat raw data reading ({rows} records)", previous_us, current_us)
+
+
+# Fragments of the metadata texts compared by the parity check of the text cleaning: markup, entities and malformed HTML
+html_fragments = [
+    'Data on energy', ' R&D ', 'a < b > c', '&amp;lt;', '&D;', '&#128;', '&nbsp', '&notit;', '\r\n', '<p>', '</p>', '<br/>',
+    '<b>bold</b>', '<a href="x>y">link</a>', '<ul><li>item</li></ul>', '<!-- comment -->', '<![CDATA[data]]>', '<!DOCTYPE html>',
+    '<?xml version="1.0"?>', '<script>var a = 1;</script>', '<STYLE>p {}</STYLE>', '<template>t</template>', '<ruby>a<rt>b</rt></ruby>',
+    '< p>', '<b', '</b', '<div class="x', 'text</span>', '<textarea><b>x</b></textarea>', '<pre> </pre>', '\u00e9\u00e7\u00e3', '\x00',
+    '&nbsp;', '&Eacute;', '&amp-', '&ampx;', '&#x41;', '&#1;', '&lt;b&gt;', ' ', '\t', ' \n ', '\u00a0', '\f', '<b title="&nbsp;">', '<!', '<', '&'
+]
+
+
+def html_text_samples(samples: int = 5000, seed: int = 0) -> List[str]:
+    # Each fragment alone, and random combinations of them (fixed seed, so that the check is repeatable)
+    generator = random.Random(seed)
+    return html_fragments + [''.join(generator.choices(html_fragments, k=generator.randint(2, 12))) for _ in range(samples)]
+
+
+def benchmark_eurostat_text(samples: int = 20000) -> None:
+    """
+    Checks that the metadata texts cleaned by `eurostat_final_data.html_to_text` are the same as the ones cleaned by BeautifulSoup
+    (previous implementation of `extract_text`), and compares their cost per text.
+
+    The parity is checked on the fragments of `html_fragments` and random combinations of them (markup, entities, malformed HTML),
+    and on the texts of a synthetic SDMX metadata file. The cost is measured on the texts of the SDMX metadata file, clearing
+    the cache of the cleaned texts before each text.
+
+    Args:
+        samples (int): Number of random combinations of fragments checked.
+    """
+    from bs4 import BeautifulSoup
+    import app.indicators_data.eurostat.data_processing.eurostat_final_data as efd
+
+    with tempfile.TemporaryDirectory() as folder:
+        metadata_file_path = os.path.join(folder, 'metadata.sdmx.xml')
+        write_sdmx_metadata(metadata_file_path, list(efd.metadata_concepts.values()))
+        metadata_texts = [html.unescape(value.text) for value in ET.parse(metadata_file_path).getroot().iter(f"{{{efd.namespaces['genericmetadata']}}}Value")]
+
+    efd.html_to_text.cache_clear()
+    mismatches = [text for text in metadata_texts + html_text_samples(samples) if efd.html_to_text(text) != BeautifulSoup(text, 'html.parser').get_text()]
+    if mismatches:
+        raise ValueError(f"The cleaned text does not match BeautifulSoup for {len(mismatches)} texts, e.g. {mismatches[0]!r}")
+
+    previous_us = time_per_row(lambda text: BeautifulSoup(text, 'html.parser').get_text(), metadata_texts)
+    current_us = time_per_row(lambda text: (efd.html_to_text.cache_clear(), efd.html_to_text(text)), metadata_texts)
+    report(f"Eurostat metadata text cleaning ({len(metadata_texts)} texts)", previous_us, current_us)
+
+
+# URLs and metadata expected from the recorded E-REDES catalogue (the CMS page and the untitled dataset are not indicators,
+# and the CSV export link is only built for the datasets with records)
+eredes_fixture_api_url = 'https://e-redes.opendatasoft.com/api/explore/v2.1'
+eredes_fixture_export_query = 'lang=en&timezone=Europe%2FLisbon&use_labels=true&delimiter=%3B'
+eredes_expected_urls = [
+    f"{eredes_fixture_api_url}/catalog/datasets/consumos-faturados-por-municipio-ultimos-10-anos/exports/csv?{eredes_fixture_export_query}",
+    f"{eredes_fixture_api_url}/catalog/datasets/potencia-instalada-upac/exports/csv?{eredes_fixture_export_query}"
+]
+eredes_expected_metadata = [
+    {'title': 'Consumption billed by municipality (last 10 years)',
+     'description': 'Active energy billed per municipality & voltage level. Updated yearly.',
+     'metadata': {'Publisher': 'E-REDES', 'License': 'CC BY 4.0', 'Modified': '2024-03-12T10:15:00+00:00', 'Records': '30710', 'Language': 'en'},
+     'src_code': 'consumos-faturados-por-municipio-ultimos-10-anos'},
+    {'title': 'Connection points for electric vehicles charging stations',
+     'description': '',
+     'metadata': {'Publisher': 'E-REDES, Mobi.E', 'License': 'CC BY 4.0', 'Modified': '2024-05-02T08:00:00+00:00', 'Records': '0', 'Language': 'en, pt'},
+     'src_code': 'postos-de-carregamento-ves'},
+    {'title': 'Installed power of self-consumption units',
+     'description': 'Total installed power (W) by freguesia',
+     'metadata': {'Publisher': 'E-REDES', 'License': 'CC BY 4.0', 'Modified': '2024-06-30T23:00:00+00:00', 'Records': '1204', 'Language': 'en'},
+     'src_code': 'potencia-instalada-upac'}
+]
+
+
+def check_eredes_catalog(pages_path: str = os.path.join(fixtures_folder, 'eredes_catalog_pages.json')) -> None:
+    """
+    Checks the CSV export links and the metadata parsed from a recorded page listing of the E-REDES catalogue
+    (`eredes_catalog.parse_catalog`), and that a recorded catalogue is read as it is parsed (`eredes_catalog.get_catalog`).
+
+    Args:
+        pages_path (str): Path to the recorded pages of the catalogue, as saved by `eredes_catalog.save_catalog_pages`.
+
+    Raises:
+        ValueError: If the links or the metadata do not match the expected ones.
+    """
+    import app.indicators_data.eredes.data_extraction.eredes_catalog as ec
+
+    urls, metadata_list = ec.parse_catalog(ec.load_catalog_pages(pages_path), eredes_fixture_api_url, eredes_fixture_export_query)
+    if urls != eredes_expected_urls:
+        raise ValueError(f"Unexpected E-REDES export links: {urls}")
+    if metadata_list != eredes_expected_metadata:
+        raise ValueError(f"Unexpected E-REDES metadata: {metadata_list}")
+    # eredes_data.download_csv_file names each file after the third to last path component of its link
+    if [url.split('?')[0].split('/')[-3] for url in urls] != ['consumos-faturados-por-municipio-ultimos-10-anos', 'potencia-instalada-upac']:
+        raise ValueError("The dataset identifier is not the third to last path component of the export links")
+    if ec.get_catalog(pages_path, eredes_fixture_api_url, recorded=True)[1] != metadata_list:
+        raise ValueError("The recorded catalogue is not read as it is parsed")
+    print(f"E-REDES catalogue: {len(urls)} export links and {len(metadata_list)} metadata rows match the recorded catalogue")
+
+
+def parse_metadata_per_record(metadata_file_path: str) -> Tuple[Any, ...]:
+    # Previous implementation of eurostat_final_data.process_file: the metadata file is parsed again for every record,
+    # and the HTML of every value is unescaped and cleaned by BeautifulSoup
+    from bs4 import BeautifulSoup
+    from app.indicators_data.eurostat.data_processing.eurostat_final_data import metadata_concepts, namespaces
+
+    root = ET.parse(metadata_file_path).getroot()
+    texts = []
+    for concept in metadata_concepts.values():
+        value = root.find(f".//genericmetadata:ReportedAttribute[@conceptID='{concept}']/genericmetadata:Value", namespaces)
+        texts.append(BeautifulSoup(html.unescape(value.text), 'html.parser').get_text() if value is not None and value.text else None)
+    return tuple(texts)
+
+
+def benchmark_eurostat_metadata(rows: int = 200000, sample_rows: int = 200) -> None:
+    """
+    Compares the cost per record of the Eurostat processing when the metadata file is parsed for every record,
+    and when it is parsed once per file (`eurostat_final_data.read_metadata`).
+
+    The previous implementation is timed on a sample of the records (its cost per record does not depend on the dataset size),
+    and the current one on the whole dataset, including the reading and writing of the data file.
+
+    Args:
+        rows (int): Number of records of the simulated dataset.
+        sample_rows (int): Number of records timed with the previous implementation.
+    """
+    import app.indicators_data.eurostat.data_processing.eurostat_final_data as efd
+
+    with tempfile.TemporaryDirectory() as folder:
+        metadata_file_path = os.path.join(folder, 'metadata.sdmx.xml')
+        write_sdmx_metadata(metadata_file_path, list(efd.metadata_concepts.values()))
+        records = eurostat_records(rows)
+        write_eurostat_raw_data(os.path.join(folder, 'dataset'), records)
+
+        efd.read_metadata.cache_clear()
+        if parse_metadata_per_record(metadata_file_path) != efd.read_metadata(metadata_file_path):
+            raise ValueError("The metadata read once per file does not match the metadata read per record")
+
+        previous_us = time_per_row(lambda record: parse_metadata_per_record(metadata_file_path), records[:sample_rows], repeat=1)
+        efd.read_metadata.cache_clear()
+        started = time.perf_counter()
+        efd.process_file('dataset', 'metadata', folder, folder, os.path.join(folder, 'processed'))
+        current_us = (time.perf_counter() - started) / rows * 1_000_000
+    report(f"Eurostat metadata ({rows} records)", previous_us, current_us)
+
+
+def main() -> None:
+    check_eredes_catalog()
+    benchmark_nuts_lookup(s.gazetteer, s.dicofre_data, s.zipcode_data, s.nuts_data)
+    benchmark_area_lookup(s.gazetteer, s.dicofre_data, s.zipcode_data, s.nuts_data)
+    benchmark_eurostat_metadata()
+    benchmark_eurostat_raw_data()
+    benchmark_eurostat_text()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
 import csv
 import json
 import os
+import sqlite3
+import sys
 
-import settings as s
+# Get the path of the root directory (irradiare-app) and add it to sys.path to import the utils modules
+irradiare_app_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.append(irradiare_app_path)
+
+import app.utils.settings as s
+import app.utils.geo_index as gi
 
 def format_dicofre_dict(dicofre_path):
     # Leer el archivo JSON original
@@ -64,8 +71,53 @@ def format_zipcode_data(zipcode_path):
 
 
 
-#format_dicofre_dict(dicofre_path = s.original_dicofre_data)
+def load_json(json_path):
+    # The geography data files are optional when compiling the gazetteer (e.g. zipcodes.json), missing files give empty indexes
+    if not os.path.exists(json_path):
+        print(f"File not found, its gazetteer indexes will be empty: {json_path}")
+        return {}
+    with open(json_path, 'r', encoding='utf-8') as json_file:
+        return json.load(json_file)
+
+def build_gazetteer(dicofre_path, zipcode_path, nuts_path, gazetteer_path):
+    """
+    Compiles the formatted dicofre, zipcode and NUTS JSON files into a single SQLite gazetteer.
+
+    Each index of `geo_index` (code prefix -> location, location name -> location, municipality/area name -> NUTS regions)
+    is saved as a table keyed by its prefix or name, so the pipelines look up single rows instead of loading the JSON files.
+    The gazetteer is written under a temporary name and renamed when completed.
+    """
+    dicofre_dict = load_json(dicofre_path)
+    nuts_index = gi.build_nuts_index(load_json(nuts_path))
+    indexes = {
+        'dicofre_prefix': gi.build_dicofre_index(dicofre_dict),
+        'zipcode_prefix': gi.build_zipcode_index(load_json(zipcode_path)),
+        'location_name': gi.build_location_name_index(dicofre_dict),
+        'nuts_concelho': nuts_index['concelho'],
+        'nuts_area': nuts_index['area']
+    }
+
+    temp_path = f"{gazetteer_path}.tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    connection = sqlite3.connect(temp_path)
+    try:
+        for table, (key_column, value_columns) in gi.gazetteer_tables.items():
+            columns = [key_column] + value_columns
+            connection.execute(f"CREATE TABLE {table} ({key_column} TEXT PRIMARY KEY, {', '.join(f'{c} TEXT' for c in value_columns)}) WITHOUT ROWID")
+            connection.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                                   ((key,) + tuple(values) for key, values in indexes[table].items()))
+        connection.execute(f"PRAGMA user_version = {gi.gazetteer_version}")
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(temp_path, gazetteer_path)
+    print(f"Gazetteer compiled in: {gazetteer_path}")
+
 
-format_zipcode_data(zipcode_path = s.original_zipcode_data)
+if __name__ == "__main__":
+    #format_dicofre_dict(dicofre_path = s.original_dicofre_data)
 
+    format_zipcode_data(zipcode_path = s.original_zipcode_data)
 
+    build_gazetteer(s.dicofre_data, s.zipcode_data, s.nuts_data, s.gazetteer)
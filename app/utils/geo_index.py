@@ -0,0 +1,264 @@
+import functools
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+"""
+Lookup structures for the geography data (dicofre.json, zipcodes.json and NUTS.json).
+
+The location of a partial code (a 2 or 4 digit dicofre, a 4 digit zip code) is the location of the first complete code
+starting with it, so each index maps every code prefix to that first location, and a lookup is a single key access
+instead of a scan of the whole file. In the same way, the location of an area name and the NUTS regions of a municipality
+only depend on the name, so they are resolved once for every name.
+
+The indexes are compiled by `format_loc_codes.py` into a single SQLite gazetteer (one table per index, keyed by prefix or name),
+which the pipelines open lazily: nothing is read until the first lookup, and then only the rows looked up.
+"""
+
+# Code lengths indexed for each geography code: partial codes (distrito/concelho, zip code area) and complete codes
+dicofre_prefix_lengths = (2, 4, 6)
+zipcode_prefix_lengths = (4, 7)
+
+# Maximum number of rows (including the missing keys) kept in memory by each gazetteer index
+gazetteer_cache_size = 65536
+
+# Version of the gazetteer tables, saved in the gazetteer ('user_version') so that it is compiled again when the tables change
+gazetteer_version = 2
+
+# Tables of the gazetteer: key column and value columns of each index
+gazetteer_tables = {
+    'dicofre_prefix': ('prefix', ['distrito', 'concelho', 'freguesia']),
+    'zipcode_prefix': ('prefix', ['distrito', 'concelho', 'freguesia']),
+    'location_name': ('name', ['distrito', 'concelho', 'freguesia']),
+    'nuts_concelho': ('concelho', ['nuts1', 'nuts2', 'nuts3']),
+    'nuts_area': ('area', ['nuts1', 'nuts2', 'nuts3'])
+}
+
+
+def normalise_name(name: str) -> str:
+    """
+    Normalises a location name to be used as a lookup key: same Unicode form (NFC) and single spaces between words.
+
+    Args:
+        name (str): Location name.
+
+    Returns:
+        str: Normalised location name.
+    """
+    return ' '.join(unicodedata.normalize('NFC', name).split())
+
+
+def location(location_data: Dict[str, str]) -> Tuple[str, str, str]:
+    return (location_data.get('distrito', 'undefined'), location_data.get('concelho', 'undefined'),
+            location_data.get('freguesia', 'undefined'))
+
+
+def build_dicofre_index(dicofre_dict: Dict[str, Dict[str, str]]) -> Dict[str, Tuple[str, str, str]]:
+    """
+    Builds the prefix index of the dicofre codes.
+
+    Args:
+        dicofre_dict (Dict[str, Dict[str, str]]): Dictionary containing dicofre data, with the 6 digit dicofre codes as keys.
+
+    Returns:
+        Dict[str, Tuple[str, str, str]]: Dictionary with the 2, 4 and 6 digit prefixes of the dicofre codes as keys, and the
+                                         location (distrito, concelho, freguesia) of the first dicofre code starting with them as values.
+    """
+    dicofre_index = {}
+    for dicofre, location_data in dicofre_dict.items():
+        for length in dicofre_prefix_lengths:
+            if len(dicofre) >= length:
+                dicofre_index.setdefault(dicofre[:length], location(location_data))
+    return dicofre_index
+
+
+def build_zipcode_index(zipcode_dict: Dict[str, Dict[str, str]]) -> Dict[str, Tuple[str, str, str]]:
+    """
+    Builds the prefix index of the zip codes.
+
+    Args:
+        zipcode_dict (Dict[str, Dict[str, str]]): Dictionary containing zipcode data, with the zip codes as keys.
+
+    Returns:
+        Dict[str, Tuple[str, str, str]]: Dictionary with the zip codes, and the 4 and 7 digit prefixes of the unformatted zip codes
+                                         ('ZipNoFormat') as keys, and the location (distrito, concelho, freguesia) of the first
+                                         zip code matching them as values.
+    """
+    # Complete zip codes are looked up by key first, and then by their unformatted value
+    zipcode_index = {zipcode: location(location_data) for zipcode, location_data in zipcode_dict.items() if len(zipcode) > 4}
+    for location_data in zipcode_dict.values():
+        zip_no_format = location_data.get('ZipNoFormat', '')
+        for length in zipcode_prefix_lengths:
+            if len(zip_no_format) >= length:
+                zipcode_index.setdefault(zip_no_format[:length], location(location_data))
+    return zipcode_index
+
+
+def build_location_name_index(dicofre_dict: Dict[str, Dict[str, str]]) -> Dict[str, Tuple[str, str, str]]:
+    """
+    Builds the index of the location names of the dicofre data.
+
+    Args:
+        dicofre_dict (Dict[str, Dict[str, str]]): Dictionary containing dicofre data.
+
+    Returns:
+        Dict[str, Tuple[str, str, str]]: Dictionary with the normalised freguesia, concelho and distrito names as keys, and their location
+                                         (distrito, concelho, freguesia) as values. A name matches a freguesia before a concelho,
+                                         and a concelho before a distrito; the levels below the matched one are 'undefined'.
+    """
+    name_index = {}
+    for location_data in dicofre_dict.values():
+        name_index.setdefault(normalise_name(location_data['freguesia']), (location_data['distrito'], location_data['concelho'], location_data['freguesia']))
+    for location_data in dicofre_dict.values():
+        name_index.setdefault(normalise_name(location_data['concelho']), (location_data['distrito'], location_data['concelho'], 'undefined'))
+    for location_data in dicofre_dict.values():
+        name_index.setdefault(normalise_name(location_data['distrito']), (location_data['distrito'], 'undefined', 'undefined'))
+    return name_index
+
+
+def build_nuts_index(nuts_dict: Dict[str, Any]) -> Dict[str, Dict[str, Tuple[str, str, str]]]:
+    """
+    Builds the reverse index of the NUTS data, from the area names to their NUTS 1, NUTS 2 and NUTS 3 regions.
+
+    Args:
+        nuts_dict (Dict[str, Any]): NUTS data (NUTS 1 -> 'NUTS 2' -> NUTS 2 -> 'NUTS 3' -> NUTS 3 -> 'Municipalities').
+
+    Returns:
+        Dict[str, Dict[str, Tuple[str, str, str]]]: Dictionary with two indexes:
+            - 'concelho': municipality name -> (nuts1, nuts2, nuts3).
+            - 'area': normalised municipality, NUTS 2 or NUTS 1 name -> (nuts1, nuts2, nuts3) ('undefined' for the levels below the area),
+              keeping the first match in the NUTS data order (a municipality before its NUTS 2, and its NUTS 2 before its NUTS 1).
+    """
+    concelho_index, area_index = {}, {}
+    for nuts1, nuts1_info in nuts_dict.items():
+        for nuts2, nuts2_info in nuts1_info.get("NUTS 2", {}).items():
+            for nuts3, nuts3_data in nuts2_info.get("NUTS 3", {}).items():
+                for municipality in nuts3_data.get("Municipalities", []):
+                    concelho_index.setdefault(municipality, (nuts1, nuts2, nuts3))
+                    area_index.setdefault(normalise_name(municipality), (nuts1, nuts2, nuts3))
+                area_index.setdefault(normalise_name(nuts2), (nuts1, nuts2, 'undefined'))
+                area_index.setdefault(normalise_name(nuts1), (nuts1, 'undefined', 'undefined'))
+    return {'concelho': concelho_index, 'area': area_index}
+
+
+class GazetteerIndex(Mapping):
+    """
+    Read-only dictionary over one index table of the gazetteer.
+
+    The database is opened on the first lookup (one read-only connection per thread, closed with `close`), and the last rows
+    looked up (including the missing keys) are kept in a bounded cache (`gazetteer_cache_size`), so the frequent keys are
+    read once from the database.
+    """
+
+    def __init__(self, gazetteer_path: str, table: str, cache_size: int = gazetteer_cache_size):
+        self.gazetteer_path = gazetteer_path
+        self.table = table
+        self.key_column, self.value_columns = gazetteer_tables[table]
+        self._query = f"SELECT {', '.join(self.value_columns)} FROM {self.table} WHERE {self.key_column} = ?"
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._lookup = functools.lru_cache(maxsize=cache_size)(self._read_row)
+
+    def _connection(self) -> sqlite3.Connection:
+        if not hasattr(self._local, 'connection'):
+            # Each connection is only used by its thread, but it is closed by the thread calling `close`
+            connection = sqlite3.connect(f"file:{os.path.abspath(self.gazetteer_path)}?mode=ro", uri=True, check_same_thread=False)
+            with self._connections_lock:
+                self._connections.append(connection)
+            self._local.connection = connection
+        return self._local.connection
+
+    def _read_row(self, key: str) -> Optional[Tuple[str, ...]]:
+        return self._connection().execute(self._query, (key,)).fetchone()
+
+    def close(self) -> None:
+        """
+        Closes the connections of every thread to the gazetteer and clears the cached rows. The index can still be used
+        afterwards: the database is opened again on the next lookup.
+        """
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+        self._lookup.cache_clear()
+
+    def __getitem__(self, key: str) -> Tuple[str, ...]:
+        row = self._lookup(key)
+        if row is None:
+            raise KeyError(key)
+        return row
+
+    def get(self, key: str, default: Any = None) -> Any:
+        # Same as Mapping.get, without raising and catching a KeyError for every missing key
+        row = self._lookup(key)
+        return default if row is None else row
+
+    def __iter__(self) -> Iterator[str]:
+        return (key for (key,) in self._connection().execute(f"SELECT {self.key_column} FROM {self.table}"))
+
+    def __len__(self) -> int:
+        return self._connection().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+def gazetteer_is_outdated(gazetteer_path: str, source_paths: List[str]) -> bool:
+    """
+    Checks if the gazetteer has to be compiled: it does not exist, it was compiled with other tables (`gazetteer_version`),
+    or any of its source files has been modified after it.
+
+    Args:
+        gazetteer_path (str): Path to the gazetteer.
+        source_paths (List[str]): Paths to the geography data files compiled into the gazetteer.
+
+    Returns:
+        bool: True if the gazetteer is missing, corrupted or outdated.
+    """
+    if not os.path.exists(gazetteer_path):
+        return True
+    try:
+        connection = sqlite3.connect(f"file:{os.path.abspath(gazetteer_path)}?mode=ro", uri=True)
+        try:
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            connection.close()
+    except sqlite3.DatabaseError: # Not a SQLite database (e.g. truncated by an interrupted compilation)
+        return True
+    if version != gazetteer_version:
+        return True
+    gazetteer_time = os.path.getmtime(gazetteer_path)
+    return any(os.path.exists(path) and os.path.getmtime(path) > gazetteer_time for path in source_paths)
+
+
+def open_gazetteer(gazetteer_path: str, dicofre_path: str, zipcode_path: str, nuts_path: str) -> Dict[str, GazetteerIndex]:
+    """
+    Opens the indexes of the gazetteer, compiling it first if it is missing or outdated.
+
+    Args:
+        gazetteer_path (str): Path to the gazetteer.
+        dicofre_path (str): Path to the dicofre JSON file.
+        zipcode_path (str): Path to the zipcode JSON file.
+        nuts_path (str): Path to the NUTS JSON file.
+
+    Returns:
+        Dict[str, GazetteerIndex]: Index of each gazetteer table (see `gazetteer_tables`), by table name.
+    """
+    if gazetteer_is_outdated(gazetteer_path, [dicofre_path, zipcode_path, nuts_path]):
+        import app.utils.format_loc_codes as flc
+        flc.build_gazetteer(dicofre_path, zipcode_path, nuts_path, gazetteer_path)
+    return {table: GazetteerIndex(gazetteer_path, table) for table in gazetteer_tables}
+
+
+def close_gazetteer(gazetteer: Dict[str, GazetteerIndex]) -> None:
+    """
+    Closes the connections of the indexes opened with `open_gazetteer`.
+
+    Args:
+        gazetteer (Dict[str, GazetteerIndex]): Index of each gazetteer table, by table name.
+    """
+    for index in gazetteer.values():
+        index.close()
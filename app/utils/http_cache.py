@@ -0,0 +1,269 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional, Set, Tuple
+
+
+"""
+Conditional fetching of the source files, shared by the extractors, the processing scripts and the loaders.
+
+    - The extractor of each source keeps the validators of every file it downloads (the 'ETag' and 'Last-Modified' response
+      headers, and a digest of the content) in a JSON cache file, and sends them back in the next run ('If-None-Match',
+      'If-Modified-Since'), so the server answers '304 Not Modified' without the content when the file has not changed.
+    - When the server does not support conditional requests, a file with the same content digest as the saved one is also unchanged.
+    - The files found unchanged in the last extraction are saved in the same cache file ('unchanged'), and the processing
+      scripts of the source skip them when their outputs already exist. The loading scripts load every processed file,
+      since an unchanged file may not have reached the database (a load interrupted, or two extractions before a load).
+
+The pages read by the crawlers (HTML pages parsed to find links) are kept in a response cache on disk (`ResponseCache`),
+so that the next extractions read them from disk instead of requesting them again.
+"""
+
+
+def content_digest(content: bytes) -> str:
+    """
+    Returns the digest of the content of a downloaded file.
+
+    Args:
+        content (bytes): Content of the file.
+
+    Returns:
+        str: SHA-256 digest of the content, in hexadecimal.
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+def load_cache(cache_path: str) -> Dict[str, Any]:
+    """
+    Loads a cache file, returning an empty cache if it does not exist or it cannot be read.
+
+    Args:
+        cache_path (str): Path to the JSON cache file.
+
+    Returns:
+        Dict[str, Any]: Cache with the 'validators' of each URL and the 'unchanged' files of the last extraction.
+    """
+    if not os.path.exists(cache_path):
+        return {'validators': {}, 'unchanged': []}
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as cache_file:
+            return json.load(cache_file)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Could not read the HTTP cache {cache_path}, every file will be downloaded: {e}")
+        return {'validators': {}, 'unchanged': []}
+
+
+def load_unchanged(cache_path: str) -> Set[str]:
+    """
+    Returns the files found unchanged by the last extraction of a source.
+
+    Args:
+        cache_path (str): Path to the JSON cache file of the source.
+
+    Returns:
+        Set[str]: Keys of the unchanged files (indicator or dataset codes, as saved by the extractor).
+    """
+    return set(load_cache(cache_path).get('unchanged', []))
+
+
+class HttpCache:
+    """
+    Validators of the files downloaded by an extractor, and files found unchanged in the current extraction.
+
+    The cache is shared by the extraction threads, and saved with `save` at the end of the extraction.
+    The unchanged files of the previous extraction are replaced by the ones of the current extraction.
+    """
+
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        self.validators = load_cache(cache_path).get('validators', {})
+        self.unchanged = set()
+        self.requests = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+
+    def request_headers(self, url: str) -> Dict[str, str]:
+        """
+        Returns the conditional request headers of a URL.
+
+        Args:
+            url (str): URL requested.
+
+        Returns:
+            Dict[str, str]: 'If-None-Match' and 'If-Modified-Since' headers with the saved validators (empty if there are none).
+        """
+        validators = self.validators.get(url, {})
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+
+    def matches(self, url: str, headers: Mapping[str, str], digest: Optional[str] = None) -> bool:
+        """
+        Checks if a response has the same validators as the ones saved for its URL.
+
+        Args:
+            url (str): URL requested (or name of the resource, for validators not sent as headers).
+            headers (Mapping[str, str]): Response headers ('ETag', 'Last-Modified').
+            digest (Optional[str]): Digest of the content of the response (see `content_digest`), compared when the server
+                                    does not send validators.
+
+        Returns:
+            bool: True if the ETag, the Last-Modified date or the content digest is the same as the saved one.
+        """
+        validators = self.validators.get(url, {})
+        if headers.get('ETag') and validators.get('etag'):
+            return headers['ETag'] == validators['etag']
+        if headers.get('Last-Modified') and validators.get('last_modified'):
+            return headers['Last-Modified'] == validators['last_modified']
+        if digest is not None and validators.get('digest'):
+            return digest == validators['digest']
+        return False
+
+    def is_unchanged(self, url: str, response: Any) -> bool:
+        """
+        Checks if the file requested with `http_utils.conditional_get` has not changed since it was downloaded,
+        counting the request and its result.
+
+        Args:
+            url (str): URL requested.
+            response (requests.Response): Response of the server (not streamed, so that its content can be compared;
+                                          the streamed downloads are checked by `http_utils.download_file`).
+
+        Returns:
+            bool: True if the server answered '304 Not Modified', or the response matches the saved validators.
+        """
+        unchanged = response.status_code == 304 or (response.status_code == 200 and
+                                                     self.matches(url, response.headers, content_digest(response.content)))
+        self.record(unchanged)
+        return unchanged
+
+    def record(self, unchanged: bool) -> None:
+        """
+        Counts a conditional request and its result.
+
+        Args:
+            unchanged (bool): Whether the file requested has not changed.
+        """
+        with self._lock:
+            self.requests += 1
+            self.not_modified += unchanged
+
+    def store(self, url: str, headers: Mapping[str, str], digest: Optional[str] = None) -> None:
+        """
+        Saves the validators of a downloaded file, once the file has been saved.
+
+        Args:
+            url (str): URL requested (or name of the resource, for validators not sent as headers).
+            headers (Mapping[str, str]): Response headers ('ETag', 'Last-Modified').
+            digest (Optional[str]): Digest of the content of the response (see `content_digest`).
+        """
+        validators = {}
+        if headers.get('ETag'):
+            validators['etag'] = headers['ETag']
+        if headers.get('Last-Modified'):
+            validators['last_modified'] = headers['Last-Modified']
+        if digest is not None:
+            validators['digest'] = digest
+        with self._lock:
+            if validators:
+                self.validators[url] = validators
+            else:
+                self.validators.pop(url, None)
+
+    def mark_unchanged(self, key: str) -> None:
+        """
+        Records a file as unchanged, so that its processing is skipped.
+
+        Args:
+            key (str): Key of the file read by the processing scripts (indicator or dataset code).
+        """
+        with self._lock:
+            self.unchanged.add(key)
+
+    def save(self) -> None:
+        """
+        Saves the cache file (under a temporary name, renamed when completed) and prints the number of unchanged files.
+        """
+        os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+        temp_path = f"{self.cache_path}.tmp"
+        with self._lock:
+            cache = {'validators': self.validators, 'unchanged': sorted(self.unchanged)}
+            with open(temp_path, 'w', encoding='utf-8') as cache_file:
+                json.dump(cache, cache_file, indent=4, ensure_ascii=False)
+            os.replace(temp_path, self.cache_path)
+        print(f"HTTP cache: {self.requests} conditional requests, {self.not_modified} not modified, "
+              f"{len(self.unchanged)} files unchanged")
+
+
+class ResponseCache:
+    """
+    On-disk cache of the pages read by a crawler, keyed by URL.
+
+    Each page is saved in a file named after the digest of its URL, with the final URL of the response (after redirects,
+    needed to resolve the relative links of the page) in the first line and the content after it. A page saved more than
+    `max_age_days` days ago is requested again.
+    """
+
+    def __init__(self, cache_folder: str, max_age_days: Optional[float] = None):
+        self.cache_folder = cache_folder
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def page_path(self, url: str) -> str:
+        return os.path.join(self.cache_folder, f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.page")
+
+    def get(self, url: str) -> Optional[Tuple[str, bytes]]:
+        """
+        Returns a page saved in the cache.
+
+        Args:
+            url (str): URL requested.
+
+        Returns:
+            Optional[Tuple[str, bytes]]: Final URL and content of the page, or None if it is not saved or it has expired.
+        """
+        page_path = self.page_path(url)
+        try:
+            if self.max_age_days is not None and time.time() - os.path.getmtime(page_path) > self.max_age_days * 86400:
+                page = None
+            else:
+                with open(page_path, 'rb') as page_file:
+                    final_url, _, content = page_file.read().partition(b'\n')
+                page = final_url.decode('utf-8'), content
+        except OSError:
+            page = None
+        with self._lock:
+            if page is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return page
+
+    def put(self, url: str, final_url: str, content: bytes) -> None:
+        """
+        Saves a page in the cache (under a temporary name, renamed when completed).
+
+        Args:
+            url (str): URL requested.
+            final_url (str): URL of the response, after redirects.
+            content (bytes): Content of the page.
+        """
+        os.makedirs(self.cache_folder, exist_ok=True)
+        page_path = self.page_path(url)
+        temp_path = f"{page_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as page_file:
+            page_file.write(final_url.encode('utf-8') + b'\n' + content)
+        os.replace(temp_path, page_path)
+
+    def report(self) -> None:
+        """
+        Prints the number of pages read from the cache and requested.
+        """
+        print(f"Response cache: {self.hits} pages read from the cache, {self.misses} requested")
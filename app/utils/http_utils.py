@@ -0,0 +1,256 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Iterable, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import app.utils.http_cache as hc
+
+
+"""
+HTTP helpers shared by the extractors of the data sources.
+
+    - A session keeps the connections to each host alive between requests, and retries the failed requests
+      (connection errors, 429 and 5xx responses) with exponential backoff, honouring the 'Retry-After' header.
+    - A token bucket limits the rate of requests sent to a host by all the threads sharing it, instead of sleeping
+      a fixed time after each request. A crawler visiting several hosts keeps a token bucket per host (`HostRateLimiter`).
+    - A conditional request sends the validators saved in the HTTP cache of the extractor (see `http_cache.HttpCache`),
+      so that the files which have not changed are not downloaded again.
+    - A file download is streamed to disk in chunks, so the memory used does not depend on the file size. The file is written
+      under a temporary name ('.part') and renamed when completed, and an interrupted download is resumed from the
+      bytes already written (Range request) by the next attempt.
+"""
+
+# Status codes retried by the sessions (rate limited and server errors)
+retry_status_codes = (429, 500, 502, 503, 504)
+# Size of the chunks written to disk by the streamed downloads, in bytes
+download_chunk_size = 1024 * 1024
+
+
+def create_session(max_connections: int = 10, retries: int = 5, backoff_factor: float = 1.0, retry_methods: Iterable[str] = ('GET', 'HEAD')) -> requests.Session:
+    """
+    Creates an HTTP session with a pool of keep-alive connections and retries with exponential backoff.
+
+    Args:
+        max_connections (int): Maximum number of connections kept alive per host (the number of threads using the session).
+        retries (int): Maximum number of retries of each request.
+        backoff_factor (float): Backoff between retries, in seconds: backoff_factor * 2 ** (retry number - 1).
+        retry_methods (Iterable[str]): HTTP methods retried.
+
+    Returns:
+        requests.Session: Session to be shared by the threads of an extractor.
+    """
+    retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=retry_status_codes,
+                  allowed_methods=frozenset(retry_methods), respect_retry_after_header=True, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+
+    The bucket is refilled with `rate` tokens per second up to `capacity` tokens, and each request takes one token,
+    waiting for it when the bucket is empty. Bursts of up to `capacity` requests are sent without waiting.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """
+        Takes tokens from the bucket, waiting until they are available.
+
+        Args:
+            tokens (float): Number of tokens taken.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    """
+    Thread-safe rate limiter per host: a token bucket for each host, created on the first request to the host,
+    so that the requests to a slow host do not delay the ones to the other hosts.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def for_url(self, url: str) -> TokenBucket:
+        """
+        Returns the token bucket of the host of a URL.
+
+        Args:
+            url (str): URL requested.
+
+        Returns:
+            TokenBucket: Rate limiter shared by all the requests to the host.
+        """
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.rate, self.capacity)
+            return self._buckets[host]
+
+
+def get(session: requests.Session, url: str, limiter: Optional[TokenBucket] = None, timeout: float = 60, **kwargs: Any) -> requests.Response:
+    """
+    Sends a GET request through a session, after taking a token from the rate limiter.
+
+    Args:
+        session (requests.Session): Session created with `create_session`.
+        url (str): URL requested.
+        limiter (Optional[TokenBucket]): Rate limiter of the host, if any.
+        timeout (float): Seconds to wait for the server to connect and to send data.
+        **kwargs (Any): Other arguments of `requests.Session.get` (headers, params, stream...).
+
+    Returns:
+        requests.Response: Response of the server.
+    """
+    if limiter is not None:
+        limiter.acquire()
+    return session.get(url, timeout=timeout, **kwargs)
+
+
+def conditional_get(session: requests.Session, url: str, cache: hc.HttpCache, revalidate: bool = True, limiter: Optional[TokenBucket] = None, timeout: float = 60, **kwargs: Any) -> requests.Response:
+    """
+    Sends a conditional GET request, with the validators saved in the HTTP cache for the URL.
+
+    Args:
+        session (requests.Session): Session created with `create_session`.
+        url (str): URL requested.
+        cache (HttpCache): HTTP cache of the extractor.
+        revalidate (bool): Whether to send the validators. It must be False when the local copy of the file is missing,
+                           otherwise the server could answer '304 Not Modified' without the content.
+        limiter (Optional[TokenBucket]): Rate limiter of the host, if any.
+        timeout (float): Seconds to wait for the server to connect and to send data.
+        **kwargs (Any): Other arguments of `requests.Session.get` (headers, params...).
+
+    Returns:
+        requests.Response: Response of the server, checked with `HttpCache.is_unchanged`.
+    """
+    headers = dict(kwargs.pop('headers', None) or {})
+    if revalidate:
+        headers.update(cache.request_headers(url))
+    return get(session, url, limiter, timeout, headers=headers, **kwargs)
+
+
+def download_file(session: requests.Session, url: str, file_path: str, cache: Optional[hc.HttpCache] = None, checksum: Optional[str] = None,
+                  resume: bool = True, limiter: Optional[TokenBucket] = None, timeout: float = 60, chunk_size: int = download_chunk_size, **kwargs: Any) -> bool:
+    """
+    Downloads a file streaming its content to disk in chunks, without keeping it in memory.
+
+    The content is written to '<file_path>.part' and renamed to `file_path` when completed, so an interrupted download never
+    replaces a complete file. The validator of the partial download ('ETag' or 'Last-Modified') is saved next to it, and the next
+    download of the file resumes it with a Range request, which the server only honours if the file has not changed ('If-Range').
+
+    Args:
+        session (requests.Session): Session created with `create_session`.
+        url (str): URL of the file.
+        file_path (str): Path where the file is saved.
+        cache (Optional[HttpCache]): HTTP cache of the extractor. If given and the file was already downloaded, the request is
+                                     conditional, and a file with the same validators or content digest is not replaced.
+        checksum (Optional[str]): Expected SHA-256 digest of the file, checked while it is written.
+        resume (bool): Whether to resume a previous partial download of the file.
+        limiter (Optional[TokenBucket]): Rate limiter of the host, if any.
+        timeout (float): Seconds to wait for the server to connect and to send data.
+        chunk_size (int): Size of the chunks written to disk, in bytes.
+        **kwargs (Any): Other arguments of `requests.Session.get` (headers, params...).
+
+    Returns:
+        bool: True if the file has not changed since the previous download (only with an HTTP cache).
+
+    Raises:
+        requests.exceptions.RequestException: If the request fails (the partial download is kept to be resumed).
+        ValueError: If the digest of the file does not match the expected checksum (the partial download is removed).
+    """
+    part_path = f"{file_path}.part"
+    validator_path = f"{part_path}.validator"
+    revalidate = cache is not None and os.path.exists(file_path)
+    headers = dict(kwargs.pop('headers', None) or {})
+    if revalidate:
+        headers.update(cache.request_headers(url))
+
+    # Resume the partial download only if its validator is known, otherwise the parts could belong to different versions
+    offset = 0
+    if resume and os.path.exists(part_path) and os.path.exists(validator_path):
+        with open(validator_path, 'r', encoding='utf-8') as validator_file:
+            headers['If-Range'] = validator_file.read()
+        offset = os.path.getsize(part_path)
+        headers['Range'] = f"bytes={offset}-"
+
+    with get(session, url, limiter, timeout, headers=headers, stream=True, **kwargs) as response:
+        if revalidate and (response.status_code == 304 or (response.status_code == 200 and cache.matches(url, response.headers))):
+            # The file has not changed, so a partial download of it is not needed anymore
+            for path in (part_path, validator_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            cache.record(True)
+            return True
+        if response.status_code == 416 and os.path.exists(part_path):
+            # The partial download does not match the file anymore: the next attempt downloads it again from the beginning
+            os.remove(part_path)
+        response.raise_for_status()
+
+        # The server sends the whole file if it does not support ranges or the file has changed (200 instead of 206)
+        if response.status_code != 206:
+            offset = 0
+        validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+        if validator and offset == 0:
+            with open(validator_path, 'w', encoding='utf-8') as validator_file:
+                validator_file.write(validator)
+
+        hasher = hashlib.sha256() if cache is not None or checksum is not None else None
+        if hasher is not None and offset:
+            with open(part_path, 'rb') as part_file:
+                for chunk in iter(lambda: part_file.read(chunk_size), b''):
+                    hasher.update(chunk)
+
+        with open(part_path, 'ab' if offset else 'wb') as part_file:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                part_file.write(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+        response_headers = response.headers
+
+    digest = hasher.hexdigest() if hasher is not None else None
+    if os.path.exists(validator_path):
+        os.remove(validator_path)
+    if checksum is not None and digest != checksum.lower():
+        os.remove(part_path)
+        raise ValueError(f"Checksum mismatch for {url}: expected {checksum}, got {digest}")
+
+    if revalidate:
+        unchanged = cache.matches(url, {}, digest)
+        cache.record(unchanged)
+        if unchanged:
+            os.remove(part_path)
+            return True
+    os.replace(part_path, file_path)
+    if cache is not None:
+        cache.store(url, response_headers, digest)
+    return False
@@ -0,0 +1,289 @@
+import csv
+import itertools
+import json
+import os
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+"""
+Processed data files are written as compact fact files plus a dimension dictionary sidecar.
+
+    - The fact file (.csv, .arrow or .parquet) keeps the per-row values (timecode, value, attributes...) and replaces the repeated
+      geography and indicator columns with integer keys ('id_geo', 'id_indicator').
+    - The sidecar (.dims.json) stores, for each dimension, its column names and the list of distinct values;
+      the position of each value in the list is the integer key used in the fact file.
+"""
+
+# Name of the integer key column written in the fact files for each dimension
+dimension_key_columns = {
+    'geo': 'id_geo',
+    'indicator': 'id_indicator'
+}
+
+"""
+The intermediate and processed files of each pipeline can be stored in any of the following formats (see settings.py):
+    - 'csv': delimited text files, readable with any editor.
+    - 'arrow': Arrow IPC files, read one record batch at a time.
+    - 'parquet': compressed columnar files, read one row group at a time.
+The binary formats require the 'pyarrow' package. The readers always return the rows as lists of strings, as csv.reader does,
+so every value of the binary files is still converted to a Python string when read.
+"""
+storage_extensions = {
+    'csv': '.csv',
+    'arrow': '.arrow',
+    'parquet': '.parquet'
+}
+# Number of rows converted and written at once in the binary formats
+write_batch_size = 65536
+
+
+def dims_path(file_path: str) -> str:
+    """
+    Returns the path of the dimension dictionary sidecar of a processed data file.
+
+    Args:
+        file_path (str): Path to the processed data file.
+
+    Returns:
+        str: Path to the '.dims.json' file saved next to the data file.
+    """
+    return f"{os.path.splitext(file_path)[0]}.dims.json"
+
+
+def encode(keys: Dict[Tuple[str, ...], int], values: Tuple[str, ...]) -> int:
+    """
+    Returns the integer key of a combination of dimension values, assigning the next free key the first time it is seen.
+
+    Args:
+        keys (Dict[Tuple[str, ...], int]): Dictionary of the values already encoded for the dimension.
+        values (Tuple[str, ...]): Dimension values of the current row.
+
+    Returns:
+        int: Integer key of the values.
+    """
+    return keys.setdefault(values, len(keys))
+
+
+def write_dims(file_path: str, dims: Dict[str, Tuple[List[str], Dict[Tuple[str, ...], int]]]) -> None:
+    """
+    Saves the dimension dictionaries built while processing a data file into its sidecar.
+
+    Args:
+        file_path (str): Path to the processed data file.
+        dims (Dict[str, Tuple[List[str], Dict[Tuple[str, ...], int]]]): Column names and encoded values of each dimension.
+    """
+    sidecar = {
+        name: {
+            'columns': columns,
+            'values': [list(values) for values, _ in sorted(keys.items(), key=lambda item: item[1])]
+        }
+        for name, (columns, keys) in dims.items()
+    }
+    with open(dims_path(file_path), 'w', encoding='utf-8') as dims_file:
+        json.dump(sidecar, dims_file, ensure_ascii=False)
+
+
+def read_dims(file_path: str) -> Dict[str, List[Dict[str, str]]]:
+    """
+    Loads the dimension dictionaries of a processed data file.
+
+    Args:
+        file_path (str): Path to the processed data file.
+
+    Returns:
+        Dict[str, List[Dict[str, str]]]: For each dimension, the list of its values as {column: value} dictionaries,
+                                         indexed by the integer keys used in the data file.
+    """
+    with open(dims_path(file_path), 'r', encoding='utf-8') as dims_file:
+        sidecar = json.load(dims_file)
+    return {
+        name: [dict(zip(dimension['columns'], values)) for values in dimension['values']]
+        for name, dimension in sidecar.items()
+    }
+
+
+def is_data_file(filename: str) -> bool:
+    """
+    Checks if a file is a data file written in any of the supported storage formats.
+
+    Args:
+        filename (str): Name or path of the file.
+
+    Returns:
+        bool: True if the file extension is one of the storage formats extensions.
+    """
+    return filename.endswith(tuple(storage_extensions.values()))
+
+
+def data_file_path(file_path: str, storage_format: str) -> str:
+    """
+    Returns the path of a data file with the extension of the selected storage format.
+
+    Args:
+        file_path (str): Path to the data file, with or without extension.
+        storage_format (str): Storage format ('csv', 'arrow' or 'parquet').
+
+    Returns:
+        str: Path to the data file with the storage format extension.
+    """
+    base_path, extension = os.path.splitext(file_path)
+    if extension not in storage_extensions.values():
+        base_path = file_path
+    return f"{base_path}{storage_extensions[storage_format]}"
+
+
+def write_table(file_path: str, headers: List[str], rows: Iterable[List], storage_format: str = 'csv', delimiter: str = ';') -> int:
+    """
+    Writes the rows of a data file in the selected storage format.
+
+    The file is written under a temporary name and renamed when completed, so that a file can be rewritten
+    from the rows read from itself.
+
+    Args:
+        file_path (str): Path to the data file, with or without extension.
+        headers (List[str]): Column names.
+        rows (Iterable[List]): Rows of the file.
+        storage_format (str): Storage format ('csv', 'arrow' or 'parquet').
+        delimiter (str): Delimiter of the csv files.
+
+    Returns:
+        int: Number of rows written.
+    """
+    file_path = data_file_path(file_path, storage_format)
+    temp_path = f"{file_path}.tmp"
+    written_rows = 0
+
+    # The temporary file is removed if the rows cannot be written, so that no partial file is left behind
+    try:
+        if storage_format == 'csv':
+            with open(temp_path, 'w', encoding='utf-8', newline='') as data_file:
+                writer = csv.writer(data_file, delimiter=delimiter)
+                writer.writerow(headers)
+                for row in rows:
+                    writer.writerow(row)
+                    written_rows += 1
+        else:
+            import pyarrow as pa
+
+            # Integer keys are stored as integers, any other column as text (empty values as '')
+            key_columns = set(dimension_key_columns.values())
+            schema = pa.schema([(header, pa.int32() if header in key_columns else pa.string()) for header in headers])
+
+            if storage_format == 'arrow':
+                sink = pa.OSFile(temp_path, 'wb')
+                writer = pa.ipc.new_file(sink, schema)
+            else:
+                import pyarrow.parquet as pq
+                sink = None
+                writer = pq.ParquetWriter(temp_path, schema)
+
+            # The rows are converted and written in batches, so that the memory used does not depend on the file size
+            try:
+                rows = iter(rows)
+                while True:
+                    batch_rows = list(itertools.islice(rows, write_batch_size))
+                    if not batch_rows:
+                        break
+                    columns = list(zip(*batch_rows))
+                    writer.write_batch(pa.record_batch([
+                        pa.array([int(value) for value in column], type=pa.int32()) if header in key_columns
+                        else pa.array(['' if value is None else str(value) for value in column], type=pa.string())
+                        for header, column in zip(headers, columns)
+                    ], schema=schema))
+                    written_rows += len(batch_rows)
+            finally:
+                writer.close()
+                if sink is not None:
+                    sink.close()
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    os.replace(temp_path, file_path)
+    return written_rows
+
+
+def read_table(file_path: str, delimiter: str = ';') -> Tuple[List[str], Iterator[List[str]]]:
+    """
+    Reads a data file in any of the supported storage formats, guessing the format from its extension.
+
+    Args:
+        file_path (str): Path to the data file.
+        delimiter (str): Delimiter of the csv files.
+
+    Returns:
+        Tuple[List[str], Iterator[List[str]]]: Column names and an iterator over the rows of the file
+                                               (empty list of columns if the file is empty).
+    """
+    if file_path.endswith(storage_extensions['csv']):
+        rows = _read_csv_rows(file_path, delimiter)
+    else:
+        rows = _read_arrow_rows(file_path)
+    headers = next(rows, [])
+    return headers, rows
+
+
+def _read_csv_rows(file_path: str, delimiter: str) -> Iterator[List[str]]:
+    with open(file_path, 'r', encoding='utf-8') as data_file:
+        yield from csv.reader(data_file, delimiter=delimiter)
+
+
+def _read_arrow_rows(file_path: str) -> Iterator[List[str]]:
+    import pyarrow as pa
+
+    # The record batches (row groups of the Parquet files) are decoded one at a time, as the rows are read,
+    # so that reading the first rows of a file (see `read_row`) does not decode the whole file
+    with pa.memory_map(file_path, 'r') as source:
+        if file_path.endswith(storage_extensions['arrow']):
+            reader = pa.ipc.open_file(source)
+            column_names = reader.schema.names
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        else:
+            import pyarrow.parquet as pq
+            parquet_file = pq.ParquetFile(source)
+            column_names = parquet_file.schema_arrow.names
+            batches = parquet_file.iter_batches(batch_size=write_batch_size)
+
+        yield column_names
+        for batch in batches:
+            columns = [column.to_pylist() for column in batch.columns]
+            for row in zip(*columns):
+                yield ['' if value is None else str(value) for value in row]
+
+
+def read_row(file_path: str, row_number: int, delimiter: str = ';') -> Optional[List[str]]:
+    """
+    Reads a single row of a data file.
+
+    Args:
+        file_path (str): Path to the data file.
+        row_number (int): Number of the row to read (the headers are the row 0).
+        delimiter (str): Delimiter of the csv files.
+
+    Returns:
+        Optional[List[str]]: The row as a list of strings, or None if the file has fewer rows.
+    """
+    _, rows = read_table(file_path, delimiter)
+    row = next(itertools.islice(rows, row_number - 1, None), None)
+    rows.close()
+    return row
+
+
+def report_throughput(stage: str, rows: int, started: float, file_path: Optional[str] = None) -> None:
+    """
+    Prints the throughput of a pipeline stage.
+
+    Args:
+        stage (str): Name of the stage.
+        rows (int): Number of rows processed by the stage.
+        started (float): Value of time.perf_counter() when the stage started.
+        file_path (Optional[str]): Path to the file written or read by the stage, used to report its size.
+    """
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    message = f"{stage}: {rows} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s"
+    if file_path is not None and os.path.exists(file_path):
+        megabytes = os.path.getsize(file_path) / 1_000_000
+        message += f", {megabytes:.2f} MB, {megabytes / elapsed:.2f} MB/s"
+    print(f"{message})")
@@ -4,6 +4,7 @@ original_zipcode_data = "app/utils/loc_codes/original_zipcodes.csv"
 dicofre_data = "app/utils/loc_codes/dicofre.json"
 zipcode_data = "app/utils/loc_codes/zipcodes.json"
 nuts_data = "app/utils/nuts_levels/NUTS.json"
+gazetteer = "app/utils/loc_codes/gazetteer.db"     # Compiled indexes of the dicofre, zipcode and NUTS data (see format_loc_codes.py)
 continental_dicode = {'01', '02', '03', '04', '05', '06', '07', '08', '09', '10', '11', '12', '13', '14', '15', '16', '17', '18'}
 madeira_dicode = {'31', '32'}
 açores_dicode = {'41', '42', '43', '44', '45', '46', '47', '48', '49'}
@@ -24,10 +25,18 @@ headers = {'User-Agent': user_agent}
 eredes_url = 'https://e-redes.opendatasoft.com/explore/?sort=modified'
 eredes_metadata_folder = "app/indicators_data/eredes/eredes_metadata/"
 eredes_metadata = "app/indicators_data/eredes/eredes_metadata/metadata.csv"
+# Catalogue listed through the OpenDataSoft Explore API of the portal (see eredes_catalog.py)
+eredes_api_url = "https://e-redes.opendatasoft.com/api/explore/v2.1"
+eredes_export_query = "lang=en&timezone=Europe%2FLisbon&use_labels=true&delimiter=%3B"   # CSV exports with ';' as delimiter
+eredes_catalog_pages = "app/indicators_data/eredes/eredes_metadata/catalog_pages.json"  # Pages of the last catalogue listed
+eredes_catalog_engine = "api"      # 'api' (Selenium only if the API fails), 'recorded' (saved catalogue pages) or 'selenium'
+eredes_browser_drivers = 4         # Headless browsers loading the export pages in parallel when the catalogue is scraped
+eredes_page_timeout = 10           # Seconds to wait for the content of a page when the catalogue is scraped
+# Validators of the downloaded files and files unchanged since the previous extraction (see http_cache.py)
+eredes_http_cache = "app/indicators_data/eredes/data/http_cache.json"
 
 # DATA/METADATA PROCESSING:
 eredes_raw_data = "app/indicators_data/eredes/data/raw/"
-eredes_merged = "app/indicators_data/eredes/data/temp_eredes_merged/"
 eredes_removed_files = [
     "articles.csv",
     "civil-parishes-portugal.csv",
@@ -52,6 +61,8 @@ eredes_year_cols = ["Year", "ANO", "year", "ano"]     #-------------------------
 eredes_month_cols = ["Month", "month", "mes"]         # Naming options for time related columns in the eredes data files #
 eredes_semester_cols = ["Semester"]                   #------------------------------------------------------------------#
 eredes_quarter_cols = ["Quarter"]
+# Storage format of the intermediate and processed data files: 'csv', 'arrow' or 'parquet' (binary formats require pyarrow)
+eredes_storage_format = "csv"
 
 
 # _________________________________________EUROSTAT________________________________________
@@ -61,12 +72,21 @@ eurostat_toc_url_txt = "https://ec.europa.eu/eurostat/api/dissemination/catalogu
 eurostat_toc_folder = "app/indicators_data/eurostat/eurostat_data/eurostat_comp_files/"
 # Path to TOC (Eurostat Table of Contents) in .txt
 eurostat_toc_txt = "app/indicators_data/eurostat/eurostat_data/eurostat_comp_files/table_of_contents_en.txt"
+# Validators of the TOC and the datasets, and datasets unchanged since the previous extraction (see http_cache.py)
+eurostat_http_cache = "app/indicators_data/eurostat/eurostat_data/eurostat_comp_files/http_cache.json"
 # Folder to save Eurostat raw data
 eurostat_raw_data = "app/indicators_data/eurostat/eurostat_data/raw"
 # Path to eurostat complementary data files
 eurostat_comp_files = "app/indicators_data/eurostat/eurostat_data/eurostat_comp_files"
 # File with definitions for each eurostat dataset code (datacode)
 eurostat_dataset_def = "app/indicators_data/eurostat/eurostat_data/eurostat_comp_files/datasets_definitions.csv"
+# Progress of the current extraction (datasets already fetched), to resume it if it is interrupted (see eurostat_client_data.py)
+eurostat_fetch_journal = "app/indicators_data/eurostat/eurostat_data/eurostat_comp_files/fetch_journal.csv"
+eurostat_fetch_workers = 4             # Datasets fetched at a time
+eurostat_requests_per_second = 4       # Maximum rate of requests sent to the Eurostat API (shared by all the extraction threads)
+# Datasets without data for Portugal, not fetched again until the TTL expires or they are updated in the TOC
+eurostat_empty_cache = "app/indicators_data/eurostat/eurostat_data/eurostat_comp_files/empty_datasets.json"
+eurostat_empty_ttl_days = 30
 # Eurostat TOC (Table of Contents) URL in .xml format
 eurostat_toc_url_xml = "https://ec.europa.eu/eurostat/api/dissemination/catalogue/toc/xml"
 # Path to TOC (Eurostat Table of Contents) in .xml
@@ -88,18 +108,38 @@ eurostat_download_metadata = "app/indicators_data/eurostat/eurostat_data/eurosta
 eurostat_manual_metadata = "app/indicators_data/eurostat/eurostat_data/eurostat_comp_files/manual_metadata.csv"
 # Folder to save Eurostat metadata
 eurostat_metadata_folder = "app/indicators_data/eurostat/eurostat_metadata"
+# Metadata pages read by the crawler (see eurostat_get_metadata.py), requested again after the given days
+eurostat_page_cache = "app/indicators_data/eurostat/eurostat_data/eurostat_comp_files/metadata_pages"
+eurostat_page_cache_days = 30
+eurostat_crawler_workers = 4           # Metadata pages crawled (and metadata files downloaded) at a time
+eurostat_requests_per_host = 2         # Maximum rate of requests sent to each host by the crawler
 # Filename for saving merged codes (datacode,metadatacode)
 merged_codes_file = "app/indicators_data/eurostat/eurostat_data/eurostat_comp_files/merged_codes.csv"
 # Folder to save Eurostat processed data
 eurostat_processed_data = "app/indicators_data/eurostat/eurostat_data/processed"
+# Storage format of the processed data files: 'csv', 'arrow' or 'parquet' (binary formats require pyarrow)
+eurostat_storage_format = "csv"
+# Metadata fields of each metadata code, extracted once before processing the datasets (see eurostat_final_data.py)
+eurostat_metadata_table = "app/indicators_data/eurostat/eurostat_data/eurostat_comp_files/metadata_fields.db"
+# Processes used to process the datasets (None: one per CPU, os.cpu_count())
+eurostat_max_workers = None
 
 # ___________________________________________INE___________________________________________
 ine_url = "https://www.ine.pt"
 ine_catalog_path = "app/indicators_data/ine/ine_data/ine_comp_files/"
 ine_catalog_filename = "ine_indicators_catalog.json"
+ine_max_workers = 4             # Indicators extracted at a time
+ine_requests_per_second = 4     # Maximum rate of requests sent to the INE API (shared by all the extraction threads)
+ine_request_timeout = 60        # Seconds to wait for the INE API to connect and to send data
+# Validators of the extracted files and indicators unchanged since the previous extraction (see http_cache.py)
+ine_http_cache = "app/indicators_data/ine/ine_data/ine_comp_files/http_cache.json"
 ine_data_path = "app/indicators_data/ine/ine_data/raw/"
 ine_metadata_path = "app/indicators_data/ine/ine_metadata/"
 ine_processed_data = "app/indicators_data/ine/ine_data/processed/"
+# Storage format of the intermediate and processed data files: 'csv', 'arrow' or 'parquet' (binary formats require pyarrow)
+ine_storage_format = "csv"
+# Maximum number of distinct area names whose location is kept in memory while processing the INE data
+ine_area_cache_size = 4096
 
 
 # _____________________________________THE WORLD BANK______________________________________
@@ -108,4 +148,7 @@ wb_catalog_filename = "wbindicators.json"
 wb_catalog_file = "app/indicators_data/worldbank/wb_data/wb_comp_files/wbindicators.json"
 wb_data_path = "app/indicators_data/worldbank/wb_data/raw/wb_data.json"
 wb_metadata_path = "app/indicators_data/worldbank/wb_metadata/wb_metadata.json"
-wb_complete_file = "app/indicators_data/worldbank/wb_data/processed/wb_final_data.csv"
\ No newline at end of file
+wb_complete_file = "app/indicators_data/worldbank/wb_data/processed/wb_final_data.csv"
+wb_zip_file = "app/indicators_data/worldbank/wb_data/wb_comp_files/files.zip"
+# Validators of the downloaded ZIP file, and whether it is unchanged since the previous extraction (see http_cache.py)
+wb_http_cache = "app/indicators_data/worldbank/wb_data/wb_comp_files/http_cache.json"
\ No newline at end of file